@@ -1,6 +1,13 @@
 import os
 
 from celery import Celery
+from celery.app.defaults import DEFAULT_POOL
+from celery.concurrency import get_implementation
+from celery.signals import celeryd_init
+from celery.signals import worker_init
+from django.conf import settings
+from kombu import Exchange
+from kombu import Queue
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
@@ -13,5 +20,90 @@ app = Celery('backend')
 #   should have a `CELERY_` prefix.
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
+
+def declare_queues(app, queues):
+    """
+    It makes the workers of app consume the queues given.
+
+    Parameters
+    ----------
+    app : Celery
+        The Celery application.
+    queues : iterable of str
+        Names of the queues to consume.
+    """
+
+    app.conf.update(task_queues=[
+        Queue(queue, Exchange(queue), routing_key=queue) for queue in queues
+    ])
+
+
+def configure_worker(app, queue, options):
+    """
+    It makes the workers of app consume queue only, with the pool and
+    concurrency in options. Options given in the command line, e.g.
+    --concurrency, still take precedence.
+
+    Parameters
+    ----------
+    app : Celery
+        The Celery application.
+    queue : str
+        Name of the queue to consume.
+    options : dict
+        Dictionary with the keys pool and concurrency.
+    """
+
+    declare_queues(app, [queue])
+    app.conf.update(
+        worker_pool=options['pool'],
+        worker_concurrency=options['concurrency'],
+    )
+
+
+@celeryd_init.connect
+def configure_queues(instance, **kwargs):
+    """
+    It configures the worker starting from the environment variable
+    CELERY_WORKER_QUEUE. If it is set, the worker consumes that queue only,
+    with its options in CELERY_WORKER_QUEUES (see configure_worker).
+    Otherwise, it consumes every queue in CELERY_WORKER_QUEUES, so a single
+    worker is enough to run every task.
+
+    Parameters
+    ----------
+    instance : Worker
+        The worker starting.
+    """
+
+    queue = os.environ.get('CELERY_WORKER_QUEUE')
+    if queue:
+        configure_worker(
+            instance.app, queue, settings.CELERY_WORKER_QUEUES[queue]
+        )
+    else:
+        declare_queues(instance.app, settings.CELERY_WORKER_QUEUES)
+
+
+@worker_init.connect
+def apply_worker_pool(sender, **kwargs):
+    """
+    It makes the worker starting use the pool configured by
+    configure_queues. The command line resolves the pool before
+    celeryd_init is sent, so the setting worker_pool is only read there if
+    it is set when the app is imported. A pool given with --pool still takes
+    precedence.
+
+    Parameters
+    ----------
+    sender : WorkController
+        The worker starting.
+    """
+
+    default = get_implementation(DEFAULT_POOL)
+    if get_implementation(sender.pool_cls) is default:
+        sender.pool_cls = sender.app.conf.worker_pool
+
+
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
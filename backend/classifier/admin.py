@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from .models import APIQuota
 from .models import App
 from .models import PredictionLabel
 from .models import Predictor
@@ -7,3 +8,4 @@ from .models import Predictor
 admin.site.register(App)
 admin.site.register(Predictor)
 admin.site.register(PredictionLabel)
+admin.site.register(APIQuota)
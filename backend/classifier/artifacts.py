@@ -0,0 +1,186 @@
+"""
+This module contains the store of the files (artifacts) the predictors and
+preprocessors load their trained models from.
+
+Each Predictor owns a directory under settings.MODEL_ARTIFACTS_DIR, given by
+its field artifacts_path, which contains one joblib file per model and a
+manifest file (manifest.json) recording the artifacts version and the
+checksum of each file.
+
+Notes
+-----
+Artifacts are saved uncompressed so that joblib.load can memory-map their
+NumPy arrays (see settings.MODEL_ARTIFACTS_MMAP_MODE). Then, the arrays of a
+model are read-only pages of the page cache shared by every Celery worker
+process which loads it, instead of a private copy per process.
+"""
+import os
+
+import joblib
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .utils import MANIFEST_FILENAME
+from .utils import verify_manifest
+from .utils import write_manifest
+
+
+class ArtifactStore:
+    """
+    This class saves and loads the model artifacts of the predictors.
+
+    Attributes
+    ----------
+    root : str
+        Directory containing the artifacts directory of every predictor.
+    mmap_mode : str or None
+        Memory-map mode passed to joblib.load. If None, arrays are read into
+        private memory.
+    verified : dict
+        Pairs of modification time of the manifest file and manifest of each
+        artifacts directory already verified by this process, keyed by the
+        directory path.
+    """
+
+    def __init__(self, root, mmap_mode='r'):
+        """
+        This method sets the attributes root and mmap_mode.
+        """
+
+        self.root = root
+        self.mmap_mode = mmap_mode
+        self.verified = {}
+
+    def path(self, predictor):
+        """
+        This method returns the artifacts directory of a predictor.
+
+        Parameters
+        ----------
+        predictor : Predictor
+            Predictor whose artifacts are located.
+
+        Returns
+        -------
+        str
+            Path of the artifacts directory.
+        """
+
+        return os.path.join(self.root, predictor.artifacts_path)
+
+    def save(self, predictor, **models):
+        """
+        This method saves the models of a predictor in a format joblib.load
+        can memory-map and records their checksums.
+
+        Parameters
+        ----------
+        predictor : Predictor
+            Predictor the models belong to. Its version is recorded as the
+            artifacts version.
+        **models
+            Trained models to save, keyed by the name used to load them.
+        """
+
+        directory = self.path(predictor)
+        os.makedirs(directory, exist_ok=True)
+        for name, model in models.items():
+            joblib.dump(model, os.path.join(directory, f'{name}.model'))
+        write_manifest(directory, version=predictor.version)
+        self.verified.pop(directory, None)
+
+    def verify(self, predictor):
+        """
+        This method verifies the artifacts directory of a predictor the first
+        time it is called for that directory, and again whenever its manifest
+        file is modified (e.g. the artifacts are replaced by a deployment).
+
+        Parameters
+        ----------
+        predictor : Predictor
+            Predictor whose artifacts are verified.
+
+        Returns
+        -------
+        dict
+            Manifest of the artifacts directory.
+
+        Raises
+        ------
+        ImproperlyConfigured
+            If a file is missing or corrupted, or if the artifacts version
+            does not match the predictor version.
+        """
+
+        directory = self.path(predictor)
+        try:
+            mtime = os.stat(
+                os.path.join(directory, MANIFEST_FILENAME)
+            ).st_mtime_ns
+        except OSError:
+            mtime = None
+        entry = self.verified.get(directory)
+        if entry is None or entry[0] != mtime:
+            entry = (mtime, verify_manifest(directory))
+            self.verified[directory] = entry
+
+        manifest = entry[1]
+        if manifest.get('version') != predictor.version:
+            raise ImproperlyConfigured(
+                f'{directory} contains the artifacts version '
+                f'{manifest.get("version")}, not {predictor.version}.'
+            )
+        return manifest
+
+    def checksum(self, predictor, name):
+        """
+        This method returns the checksum of a model of a predictor, which
+        identifies its content regardless of the directory it is in.
+
+        Parameters
+        ----------
+        predictor : Predictor
+            Predictor the model belongs to.
+        name : str
+            Name the model was saved with.
+
+        Returns
+        -------
+        str
+            SHA-256 hex digest of the model file.
+        """
+
+        return self.verify(predictor)['files'][f'{name}.model']
+
+    def load(self, predictor, name):
+        """
+        This method loads a model of a predictor. The artifacts directory is
+        verified by calling the method verify.
+
+        Parameters
+        ----------
+        predictor : Predictor
+            Predictor the model belongs to.
+        name : str
+            Name the model was saved with.
+
+        Returns
+        -------
+        object
+            Unpickled, trained model.
+
+        Raises
+        ------
+        ImproperlyConfigured
+            If a file is missing or corrupted, or if the artifacts version
+            does not match the predictor version.
+        """
+
+        self.verify(predictor)
+        file_path = os.path.join(self.path(predictor), f'{name}.model')
+        return joblib.load(file_path, mmap_mode=self.mmap_mode)
+
+
+artifact_store = ArtifactStore(
+    settings.MODEL_ARTIFACTS_DIR, settings.MODEL_ARTIFACTS_MMAP_MODE or None
+)
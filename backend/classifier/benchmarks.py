@@ -0,0 +1,533 @@
+"""
+This module contains the business logic to measure how fast the predictors
+classify tweets and to detect performance and label regressions between runs.
+
+Function list:
+    * make_corpus - It builds a reproducible collection of synthetic,
+    Spanish tweet-like texts.
+    * corpus_digest - It computes a checksum of a collection of texts.
+    * benchmark_predictor - It classifies a collection of texts in batches
+    and reports the time each stage took, the throughput and the peak memory.
+    * compare_results - It compares the results of benchmark_predictor
+    against a baseline.
+    * benchmark_scorer - It times the scorer of a predictor against the
+    predict_proba method of its prediction model.
+    * measure_peak_rss - It vectorizes and predicts a collection of texts in
+    a child process and reports its peak resident set size.
+    * measure_worker_memory - It loads the artifacts of a predictor in
+    several worker processes at once and reports how much memory each one
+    takes.
+"""
+import collections
+import hashlib
+import multiprocessing
+import random
+import time
+import timeit
+import tracemalloc
+
+from django.db import transaction
+from django.utils import timezone
+
+from .artifacts import artifact_store
+from .models import Search
+from .tasks import store_predictions
+
+
+STAGES = ['clean', 'tokenize', 'vectorize', 'predict', 'persist']
+
+WORDS = [
+    'hola', 'Qué', 'tal', 'día', 'CORAZÓN', 'pingüino', 'canción', 'él',
+    'Ecuador', 'quito', 'gobierno', 'año', 'niño', 'lluvia', 'fútbol', 'sí',
+    'no', 'muy', 'bien', 'mal', 'gonna', 'cannot', "don't", "it's", 'wanna',
+]
+NOISE = [
+    '#Trending', '@usuario', 'https://t.co/abc123', 'www.ejemplo.com',
+    'pic.twitter.com/xyz', 'bit.ly/3xYz', 'noticias.gob.ec/hoy', '2021',
+    '3.5', '10,000', '¿', '¡', '!', '?', '...', ',', '.', ':', ';', '(', ')',
+    '"', "'", '&', '%', '$', '😀', '²', '—', '“', '”', 'x2', 'a.b', 'c,d',
+]
+
+Regression = collections.namedtuple(
+    'Regression', ['predictor', 'batch_size', 'metric', 'baseline', 'current']
+)
+
+
+class _TimedTokenizer:
+    """
+    This class wraps a tokenizer to add up the time spent splitting texts, so
+    it can be told apart from the rest of the cleaning steps.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.seconds = 0.0
+
+    def tokenize(self, data):
+        start = time.perf_counter()
+        try:
+            return self.tokenizer.tokenize(data)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+def make_corpus(size, seed=0):
+    """
+    This function builds a reproducible collection of synthetic, tweet-like
+    texts mixing Spanish words, accents, hashtags, mentions, links, numbers
+    and punctuations.
+
+    Parameters
+    ----------
+    size : int
+        Number of texts to build.
+    seed : int, default=0
+        Seed of the random generator.
+
+    Returns
+    -------
+    list of str
+        Collection of synthetic texts.
+    """
+
+    generator = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        tokens = [
+            generator.choice(WORDS if generator.random() < 0.6 else NOISE)
+            for _ in range(generator.randint(0, 25))
+        ]
+        separator = '' if generator.random() < 0.1 else ' '
+        corpus.append(separator.join(tokens))
+    return corpus
+
+
+def corpus_digest(texts):
+    """
+    This function computes a checksum of texts, so two runs can tell whether
+    they classified the same corpus.
+
+    Parameters
+    ----------
+    texts : list of str
+        Collection of texts.
+
+    Returns
+    -------
+    str
+        Hexadecimal SHA-256 digest of texts.
+    """
+
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _run_batch(predictor, tweets, search, timings):
+    """
+    This function classifies a batch of tweets stage by stage, adds the time
+    each stage took to timings and returns the prediction.
+    """
+
+    preprocessor = predictor.preprocessor
+    tokenizer = preprocessor.tokenizer
+    preprocessor.tokenizer = _TimedTokenizer(tokenizer)
+    try:
+        start = time.perf_counter()
+        cleaned = [
+            (id, date, preprocessor.clean(text)) for id, date, text in tweets
+        ]
+        cleaned = [tweet for tweet in cleaned if tweet[2] is not None]
+        clean_seconds = time.perf_counter() - start
+        timings['tokenize'] += preprocessor.tokenizer.seconds
+        timings['clean'] += clean_seconds - preprocessor.tokenizer.seconds
+    finally:
+        preprocessor.tokenizer = tokenizer
+
+    prediction = []
+    if cleaned:
+        ids, dates, texts = zip(*cleaned)
+        start = time.perf_counter()
+        features = preprocessor.processor_model.transform(texts)
+        timings['vectorize'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        prediction = predictor.predict_features((ids, dates, features))
+        timings['predict'] += time.perf_counter() - start
+
+    if search is not None:
+        start = time.perf_counter()
+        store_predictions(search, prediction)
+        timings['persist'] += time.perf_counter() - start
+    return prediction
+
+
+def _run(predictor, tweets, batch_size, persist):
+    """
+    This function classifies tweets in batches of batch_size and returns the
+    time each stage took and the predictions. Everything persisted is rolled
+    back.
+    """
+
+    timings = dict.fromkeys(STAGES, 0.0)
+    prediction = []
+    with transaction.atomic():
+        search = None
+        if persist:
+            search = Search.objects.create(
+                truncated_uuid='bench', search_term='bench',
+                number_of_tweets=len(tweets), predictor=predictor.predictor
+            )
+        for i in range(0, len(tweets), batch_size):
+            prediction.extend(_run_batch(
+                predictor, tweets[i:i + batch_size], search, timings
+            ))
+        transaction.set_rollback(True)
+    return timings, prediction
+
+
+def benchmark_predictor(predictor, texts, batch_size, persist=True):
+    """
+    This function classifies texts in batches of batch_size and reports the
+    time each stage took, the throughput and the peak memory.
+
+    Parameters
+    ----------
+    predictor : AbstractPredictor
+        Predictor to benchmark. It must have a preprocessor with the methods
+        clean and tokenize and a processor_model to vectorize the texts, like
+        LogisticRegression.
+    texts : list of str
+        Collection of texts to classify.
+    batch_size : int
+        Number of texts classified at once.
+    persist : bool, default=True
+        Whether to time storing the predictions too. The rows stored are
+        rolled back afterwards.
+
+    Returns
+    -------
+    dict
+        Dictionary with the keys stages (seconds per stage), seconds (all the
+        stages), tweets_per_second, peak_memory (bytes allocated at most
+        while classifying) and labels (the integer label predicted for each
+        text, None for the short lines).
+
+    Notes
+    -----
+    The stages run serially in the current process, bypassing
+    prediction_cache and the pool of preprocessing workers, so the numbers
+    measure the code of the predictor and not the hit ratio or the number of
+    CPUs. Peak memory is measured in a second run with tracemalloc because
+    tracing allocations slows down the code being timed.
+    """
+
+    date = timezone.now()
+    tweets = [(str(i), date, text) for i, text in enumerate(texts)]
+
+    timings, prediction = _run(predictor, tweets, batch_size, persist)
+
+    tracemalloc.start()
+    try:
+        _run(predictor, tweets, batch_size, persist)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    labels = [None] * len(tweets)
+    for id, _, label, _ in prediction:
+        labels[int(id)] = label.integer_label
+    seconds = sum(timings.values())
+    return {
+        'stages': timings,
+        'seconds': seconds,
+        'tweets_per_second': len(tweets) / seconds if seconds else None,
+        'peak_memory': peak_memory,
+        'labels': labels,
+    }
+
+
+def compare_results(baseline, current, threshold):
+    """
+    This function compares the results of benchmark_predictor against a
+    baseline.
+
+    Parameters
+    ----------
+    baseline : dict
+        Results of a previous run, keyed by predictor name and then by batch
+        size. Each value is the dictionary returned by benchmark_predictor.
+    current : dict
+        Results of the current run, with the same layout as baseline.
+    threshold : float
+        Fraction the throughput may drop, or the peak memory may grow, before
+        it is considered a regression, e.g. 0.1 is 10%.
+
+    Returns
+    -------
+    tuple
+        Pair in the following order: list of Regression, dictionary mapping
+        each predictor name to the positions of the texts whose labels
+        differ from the baseline. Predictors and batch sizes missing in either
+        side are ignored.
+    """
+
+    regressions = []
+    label_differences = {}
+    for name, runs in current.items():
+        for batch_size, result in runs.items():
+            expected = baseline.get(name, {}).get(batch_size)
+            if expected is None:
+                continue
+
+            if (
+                expected['tweets_per_second']
+                and result['tweets_per_second'] is not None
+                and result['tweets_per_second']
+                < expected['tweets_per_second'] * (1 - threshold)
+            ):
+                regressions.append(Regression(
+                    name, batch_size, 'tweets_per_second',
+                    expected['tweets_per_second'], result['tweets_per_second']
+                ))
+            if result['peak_memory'] > expected['peak_memory'] * (
+                1 + threshold
+            ):
+                regressions.append(Regression(
+                    name, batch_size, 'peak_memory',
+                    expected['peak_memory'], result['peak_memory']
+                ))
+
+            differences = [
+                i for i, (old, new)
+                in enumerate(zip(expected['labels'], result['labels']))
+                if old != new
+            ]
+            if differences:
+                label_differences.setdefault(name, set()).update(differences)
+
+    return regressions, {
+        name: sorted(differences)
+        for name, differences in label_differences.items()
+    }
+
+
+def benchmark_scorer(predictor, texts, repeat=5):
+    """
+    This function times the scorer of a predictor (see scorers.py) against
+    the predict_proba method of its prediction model, which the scorer
+    replaces, on the features of a batch of texts.
+
+    Parameters
+    ----------
+    predictor : AbstractPredictor
+        Predictor with a scorer and a prediction_model, like
+        LogisticRegression.
+    texts : list of str
+        Batch of texts to classify at once.
+    repeat : int, default=5
+        Number of times each one is timed. The fastest time is kept.
+
+    Returns
+    -------
+    dict
+        Dictionary with the keys scorer and predict_proba, the seconds each
+        one took to classify the batch.
+    """
+
+    date = timezone.now()
+    preprocessed = predictor.preprocess(
+        [(str(i), date, text) for i, text in enumerate(texts)]
+    )
+    if preprocessed is None:
+        return {'scorer': 0.0, 'predict_proba': 0.0}
+    features = predictor.prepare_features(preprocessed[2])
+    return {
+        'scorer': min(timeit.repeat(
+            lambda: predictor.scorer.predict(features), number=1,
+            repeat=repeat
+        )),
+        'predict_proba': min(timeit.repeat(
+            lambda: predictor.prediction_model.predict_proba(features),
+            number=1, repeat=repeat
+        )),
+    }
+
+
+def _read_status(field):
+    """
+    This function returns a memory field (e.g. VmHWM) of /proc/self/status in
+    bytes.
+    """
+
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(f'{field}:'):
+                return int(line.split()[1]) * 1024
+    raise KeyError(field)
+
+
+def _vectorize_and_predict(predictor, texts, sparse, connection):
+    """
+    This function vectorizes and predicts texts like _run_batch does, keeping
+    the features sparse or not, and sends the resident set size before and
+    at most while doing it through connection.
+    """
+
+    baseline = _read_status('VmRSS')
+    preprocessor = predictor.preprocessor
+    cleaned = [
+        text for text in map(preprocessor.clean, texts) if text is not None
+    ]
+    features = preprocessor.processor_model.transform(cleaned)
+    if not sparse:
+        features = features.toarray()
+    ids = [str(i) for i in range(len(cleaned))]
+    predictor.predict_features((ids, ids, features))
+    connection.send((baseline, _read_status('VmHWM')))
+    connection.close()
+
+
+def measure_peak_rss(predictor, texts, sparse=True):
+    """
+    This function vectorizes and predicts texts in a child process and
+    reports its peak resident set size (RSS).
+
+    Parameters
+    ----------
+    predictor : AbstractPredictor
+        Predictor to measure, with a preprocessor and processor_model like
+        benchmark_predictor requires.
+    texts : list of str
+        Collection of texts to classify at once.
+    sparse : bool, default=True
+        Whether the feature matrix is kept sparse up to the prediction model.
+        If False, it is converted to a dense array first, as it was done
+        before predictors accepted sparse features.
+
+    Returns
+    -------
+    dict
+        Dictionary with the keys baseline (RSS of the child before
+        classifying, in bytes) and peak (highest RSS of the child, in bytes).
+
+    Notes
+    -----
+    The child is forked, so it starts with the predictor already loaded and
+    its peak RSS only covers the classification. It reads /proc/self/status,
+    so it only works on Linux.
+    """
+
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_vectorize_and_predict,
+        args=(predictor, texts, sparse, sender)
+    )
+    process.start()
+    sender.close()
+    try:
+        baseline, peak = receiver.recv()
+    finally:
+        process.join()
+    return {'baseline': baseline, 'peak': peak}
+
+
+def _read_rollup():
+    """
+    This function returns the resident set size (Rss) and the proportional
+    set size (Pss) of /proc/self/smaps_rollup in bytes.
+    """
+
+    memory = {}
+    with open('/proc/self/smaps_rollup') as rollup:
+        for line in rollup:
+            field, _, value = line.partition(':')
+            if field in ('Rss', 'Pss'):
+                memory[field.lower()] = int(value.split()[0]) * 1024
+    return memory
+
+
+def _load_and_predict(predictor, texts, mmap_mode, barrier, connection):
+    """
+    This function reloads the artifacts of predictor with mmap_mode, predicts
+    texts so their pages are read, and sends how much the memory of the
+    process grew once every worker did the same through connection.
+    """
+
+    artifact_store.mmap_mode = mmap_mode
+    # The baseline is read once every worker started, since the pages
+    # inherited from the parent are divided among all of them.
+    barrier.wait()
+    baseline = _read_rollup()
+    predictor.preprocessor.load_model()
+    predictor.load_model()
+    tweets = [(str(i), '', text) for i, text in enumerate(texts)]
+    predictor.predict_features(predictor.preprocess(tweets))
+    barrier.wait()
+    memory = _read_rollup()
+    connection.send({
+        field: memory[field] - baseline[field] for field in memory
+    })
+    connection.close()
+    # The workers stay alive until all of them measured, so the pages they
+    # share are divided among all of them.
+    barrier.wait()
+
+
+def measure_worker_memory(predictor, texts, workers, mmap_mode='r'):
+    """
+    This function loads the artifacts of a predictor in several worker
+    processes at once, like the processes of a Celery prefork pool do, and
+    reports how much memory each one takes.
+
+    Parameters
+    ----------
+    predictor : AbstractPredictor
+        Predictor to measure, with a preprocessor like benchmark_predictor
+        requires. Both must load their artifacts in a method load_model.
+    texts : list of str
+        Collection of texts each worker classifies after loading the
+        artifacts.
+    workers : int
+        Number of worker processes.
+    mmap_mode : str or None, default='r'
+        Memory-map mode the workers load the artifacts with (see
+        ArtifactStore in artifacts.py). If None, each worker reads them into
+        private memory.
+
+    Returns
+    -------
+    list of dict
+        Dictionary per worker with the keys rss (growth of its resident set
+        size, in bytes) and pss (growth of its proportional set size, in
+        bytes). The pages shared by n processes count fully in the rss of
+        each one but only 1/n in their pss.
+
+    Notes
+    -----
+    The workers are forked, so they share the memory of this process. It
+    reads /proc/self/smaps_rollup, so it only works on Linux 4.14 or newer.
+    """
+
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(workers, timeout=60)
+    receivers = []
+    processes = []
+    for _ in range(workers):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_load_and_predict,
+            args=(predictor, texts, mmap_mode, barrier, sender)
+        )
+        process.start()
+        sender.close()
+        receivers.append(receiver)
+        processes.append(process)
+    try:
+        return [receiver.recv() for receiver in receivers]
+    finally:
+        for process in processes:
+            process.join()
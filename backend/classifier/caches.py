@@ -0,0 +1,237 @@
+"""
+This module contains in-process caches to avoid repeating expensive work.
+
+The caches available are:
+    * PredictionCache - It maps tweet texts to the labels a predictor
+    predicted for them.
+    * PredictorRegistry - It keeps the predictive model (from predictors.py)
+    instances built for each predictor.
+
+Notes
+-----
+These caches live in the memory of each process (web server or Celery
+worker), unlike the Django cache. A process notices that a predictor changed
+through the generation field of the Predictor model, which is stored in the
+database and read along with the predictor.
+"""
+import collections
+import hashlib
+import threading
+
+from django.conf import settings
+
+
+class PredictionCache:
+    """
+    Bounded, least-recently-used cache of the labels predicted for tweet
+    texts.
+
+    Entries are keyed by (predictor id, predictor version, tokenizer name,
+    checksums of the model artifacts, hash of the normalized tweet text), so
+    retokenizing or retraining without bumping the predictor version does not
+    serve stale labels. Their values are pairs of integer label and
+    probability, or None when the tweet text was discarded during
+    preprocessing.
+
+    Attributes
+    ----------
+    max_size : int
+        Maximum number of entries. When it is exceeded, the least recently
+        used entry is evicted.
+    hits : int
+        Number of lookups that found an entry.
+    misses : int
+        Number of lookups that did not find an entry.
+    """
+
+    def __init__(self, max_size):
+        """
+        This method initializes an empty cache.
+
+        Parameters
+        ----------
+        max_size : int
+            Maximum number of entries.
+        """
+
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, predictor, tokenizer, checksums, text):
+        """
+        This method builds the key of the entry for a tweet text.
+
+        Parameters
+        ----------
+        predictor : Predictor
+            Predictor which predicts the label.
+        tokenizer : str
+            Name of the tokenizer class the text is tokenized with.
+        checksums : tuple of str
+            Checksums of the model artifacts the label is predicted with.
+        text : str
+            Normalized tweet text.
+
+        Returns
+        -------
+        tuple
+            Predictor id, predictor version, tokenizer, checksums and text
+            digest.
+        """
+
+        digest = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        return predictor.id, predictor.version, tokenizer, checksums, digest
+
+    def get_many(self, keys, default=None):
+        """
+        This method looks up several entries and marks the ones found as
+        recently used.
+
+        Parameters
+        ----------
+        keys : list of tuple
+            Keys built with the method key.
+        default : object, default=None
+            Value to return for the keys that are not found.
+
+        Returns
+        -------
+        list
+            Value of each key, or default if the key is not found.
+        """
+
+        values = []
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    values.append(self._entries[key])
+                    self.hits += 1
+                else:
+                    values.append(default)
+                    self.misses += 1
+        return values
+
+    def set_many(self, items):
+        """
+        This method stores several entries, evicting the least recently used
+        ones if max_size is exceeded.
+
+        Parameters
+        ----------
+        items : iterable of pairs
+            Collection of pairs in the following order: key, value.
+        """
+
+        with self._lock:
+            for key, value in items:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, predictor_id):
+        """
+        This method removes all the entries of a predictor.
+
+        Parameters
+        ----------
+        predictor_id : int
+            Primary key of the Predictor whose entries are removed.
+        """
+
+        with self._lock:
+            self._entries = collections.OrderedDict(
+                (key, value) for key, value in self._entries.items()
+                if key[0] != predictor_id
+            )
+
+    def stats(self):
+        """
+        This method reports the cache usage.
+
+        Returns
+        -------
+        dict
+            Number of entries, hits and misses.
+        """
+
+        return {
+            'size': len(self._entries), 'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+class PredictorRegistry:
+    """
+    Registry of the predictive model (from predictors.py) instances built by
+    this process.
+
+    Each entry is identified by the predictor id, and it is stale as soon as
+    the version or the generation of the predictor (as read from the
+    database) differ from the ones it was built for.
+    """
+
+    def __init__(self):
+        """
+        This method initializes an empty registry.
+        """
+
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, predictor, build):
+        """
+        This method returns the instance registered for a predictor, building
+        it first if it is missing or stale.
+
+        Parameters
+        ----------
+        predictor : Predictor
+            Predictor as recently read from the database.
+        build : callable
+            Function which receives predictor and returns a new instance.
+
+        Returns
+        -------
+        AbstractPredictor
+            Predictive model instance for predictor.
+        """
+
+        stamp = (predictor.version, predictor.generation)
+        entry = self._entries.get(predictor.id)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+        with self._lock:
+            entry = self._entries.get(predictor.id)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+            if entry is not None:
+                prediction_cache.invalidate(predictor.id)
+            instance = build(predictor)
+            self._entries[predictor.id] = (stamp, instance)
+            return instance
+
+    def discard(self, predictor_id):
+        """
+        This method removes the instance registered for a predictor, if any.
+
+        Parameters
+        ----------
+        predictor_id : int
+            Primary key of the Predictor whose instance is removed.
+        """
+
+        with self._lock:
+            self._entries.pop(predictor_id, None)
+
+    def __contains__(self, predictor_id):
+        return predictor_id in self._entries
+
+
+prediction_cache = PredictionCache(settings.PREDICTION_CACHE_SIZE)
+predictor_registry = PredictorRegistry()
@@ -0,0 +1,122 @@
+"""
+This module contains the business logic to coalesce identical searches, so
+that a trending term is collected and classified once for everyone searching
+it at the same time.
+
+Two searches are identical when they have the same normalized term (see
+normalize_search_term in utils.py), predictor and number of tweets. A search
+which finds an identical one in progress, started less than
+SEARCH_LEADER_MAX_AGE seconds ago, or done less than SEARCH_COALESCING_WINDOW
+seconds ago, becomes its follower: it does not collect tweets and its results
+are those of its leader. Followers stay queued until their leader is done,
+empty or failed, and then take its state and done_date.
+
+Function list:
+    * find_leader - It returns the search a new search should follow.
+    * create_search - It creates a search which follows an identical search
+    or leads itself.
+    * sync_followers - It copies the state and done_date of searches to
+    their followers.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models import Subquery
+from django.utils import timezone
+
+from .models import Predictor
+from .models import Search
+from .utils import normalize_search_term
+
+
+def find_leader(search_term, predictor, number_of_tweets):
+    """
+    This function returns the search a new search should follow.
+
+    Parameters
+    ----------
+    search_term : str
+        Term entered by the user in the search box.
+    predictor : Predictor
+        The predictor to use for the tweets collected.
+    number_of_tweets : int
+        Number of tweets the user requested to collect.
+
+    Returns
+    -------
+    Search or None
+        The latest identical search without a leader which is in progress
+        and started less than SEARCH_LEADER_MAX_AGE seconds ago, or was done
+        less than SEARCH_COALESCING_WINDOW seconds ago. None if there is not
+        such a search.
+    """
+
+    now = timezone.now()
+    fresh = now - timedelta(seconds=settings.SEARCH_COALESCING_WINDOW)
+    started = now - timedelta(seconds=settings.SEARCH_LEADER_MAX_AGE)
+    return Search.objects.filter(
+        normalized_term=normalize_search_term(search_term),
+        predictor=predictor, number_of_tweets=number_of_tweets, leader=None
+    ).filter(
+        Q(state__in=Search.IN_PROGRESS, date__gte=started)
+        | Q(done_date__gte=fresh)
+    ).order_by('-date').first()
+
+
+def create_search(serializer):
+    """
+    This function creates a search which follows an identical search, or
+    leads itself if there is not such a search.
+
+    Parameters
+    ----------
+    serializer : SearchSerializer
+        Validated serializer of the search to create.
+
+    Returns
+    -------
+    Search
+        The search created, already committed. Its leader is None if it must
+        collect its own tweets. Each search has its own truncated_uuid, even
+        if it follows another search.
+
+    Notes
+    -----
+    The predictor row is locked while looking for the leader, so concurrent
+    identical searches do not become leaders at the same time.
+    """
+
+    data = serializer.validated_data
+    with transaction.atomic():
+        Predictor.all_objects.select_for_update().get(pk=data['predictor'].pk)
+        leader = find_leader(
+            data['search_term'], data['predictor'], data['number_of_tweets']
+        )
+        if leader is not None and leader.state not in Search.IN_PROGRESS:
+            return serializer.save(
+                leader=leader, state=leader.state, done_date=leader.done_date
+            )
+        return serializer.save(leader=leader)
+
+
+def sync_followers(search_ids):
+    """
+    This function copies the state and done_date of searches to their
+    followers. It must be called whenever a leader is done, empty or failed,
+    so the followers are not seen as queued forever by anything filtering on
+    Search.state.
+
+    Parameters
+    ----------
+    search_ids : list of int
+        Primary keys of the leaders.
+    """
+
+    leader = Search.objects.filter(pk=OuterRef('leader_id'))
+    Search.objects.filter(leader_id__in=search_ids).update(
+        state=Subquery(leader.values('state')[:1]),
+        done_date=Subquery(leader.values('done_date')[:1])
+    )
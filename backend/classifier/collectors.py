@@ -4,16 +4,46 @@ collect tweets.
 
 The collectors available are:
     * OfficialAPICollector - It collects tweets through the official
-    Twitter API.
+    Twitter API, one page at a time, with Tweepy.
+    * AsyncAPICollector - It collects tweets through the official Twitter API
+    with a pooled asynchronous HTTP client, so a process can run many
+    collections at once. It is the default collector.
+
+Both collectors spend the calls of the shared rate limit (see quotas.py) and
+raise QuotaExceeded instead of waiting for the rate limit window to end.
+Other errors worth retrying the collection for, e.g. an outage of the
+Twitter API, are listed in COLLECTION_ERRORS.
 
 Notes
 -----
 It is wanted to add web scraping collectors to bypass the official API
 limitations. Feel free to open a pull request.
 """
+import asyncio
+import base64
+import collections
+import os
+import threading
+from datetime import datetime
+from datetime import timezone
+
+import aiohttp
 import tweepy
 from django.conf import settings
 
+from .quotas import QuotaExceeded
+from .quotas import twitter_quota
+
+
+CollectedTweet = collections.namedtuple(
+    'CollectedTweet', ['id_str', 'created_at', 'full_text']
+)
+RateLimit = collections.namedtuple('RateLimit', ['remaining', 'reset'])
+
+COLLECTION_ERRORS = (
+    aiohttp.ClientError, asyncio.TimeoutError, tweepy.TweepError
+)
+
 
 class OfficialAPICollector:
     """
@@ -25,6 +55,11 @@ class OfficialAPICollector:
     api : tweepy.API
         Connected and authenticated Tweepy interface to interact with the
         Twitter API.
+    quota : QuotaScheduler
+        Rate limit of the search endpoint shared by every worker.
+    page_size : int
+        Number of tweets requested per page. 100 is the maximum the API
+        allows.
 
     Notes
     -----
@@ -39,7 +74,9 @@ class OfficialAPICollector:
     this collection method.
     """
 
-    def __init__(self):
+    page_size = 100
+
+    def __init__(self, quota=None):
         """
         It sets up the connection to the Twitter API using Tweepy.
         """
@@ -50,11 +87,36 @@ class OfficialAPICollector:
         auth.set_access_token(
             settings.TWITTER_ACCESS_TOKEN, settings.TWITTER_ACCESS_TOKEN_SECRET
         )
-        self.api = tweepy.API(auth, wait_on_rate_limit=True)
+        self.api = tweepy.API(auth)
+        self.quota = quota or twitter_quota
 
-    def collect(self, search_term, number_of_tweets):
+    def collect(
+        self, search_term, number_of_tweets, max_id=None, since_id=None
+    ):
         """
-        This method performs the actual tweets collection.
+        This method performs the actual tweets collection. It takes the same
+        parameters as collect_pages.
+
+        Returns
+        -------
+        generator
+            Iterable of tweepy.Status objects containing information about a
+            tweet.
+        """
+
+        for page in self.collect_pages(
+            search_term, number_of_tweets, max_id, since_id
+        ):
+            yield from page
+
+    def collect_pages(
+        self, search_term, number_of_tweets, max_id=None, since_id=None
+    ):
+        """
+        This method collects the tweets page by page, spending a call of
+        quota per page. It stops once the API reports no more pages (the
+        next_results of the search metadata), instead of spending a call on
+        an empty page.
 
         Parameters
         ----------
@@ -62,17 +124,326 @@ class OfficialAPICollector:
             Term entered by the user in the search box.
         number_of_tweets : int
             Number of tweets the user requested to collect.
+        max_id : int, default=None
+            If it is given, only tweets with an id less than or equal to it
+            are collected, e.g. to resume a collection.
+        since_id : int, default=None
+            If it is given, only tweets with an id greater than it are
+            collected, e.g. the ones newer than the tweets already stored.
 
         Returns
         -------
-        tweepy.SearchResults
-            Iterable of tweepy.Status objects containing information about a
-            tweet.
+        generator
+            Iterable of pages, each one a list of tweepy.Status objects
+            containing information about a tweet.
+
+        Raises
+        ------
+        QuotaExceeded
+            If the rate limit is exhausted, once the pages already requested
+            were yielded.
         """
 
         query = f'{search_term} -filter:retweets'
         cursor = tweepy.Cursor(
             self.api.search, q=query, tweet_mode='extended',
-            result_type='recent', include_entities=False
+            result_type='recent', include_entities=False,
+            count=self.page_size, max_id=max_id, since_id=since_id
+        )
+        pages = cursor.pages()
+        collected = 0
+        while not number_of_tweets or collected < number_of_tweets:
+            self.quota.acquire()
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            except tweepy.RateLimitError:
+                raise QuotaExceeded(self.quota.update(0))
+            last = not page.next_results
+            if number_of_tweets:
+                page = page[:number_of_tweets - collected]
+            collected += len(page)
+            yield page
+            if last:
+                return
+
+
+class AsyncAPICollector:
+    """
+    This class encapsulates the business logic to collect tweets through the
+    official Twitter API with an asynchronous HTTP client.
+
+    Every collection of the process shares an event loop, which runs in a
+    background thread, and an aiohttp session, whose connections are kept
+    alive between requests. While a page is being consumed, the request of
+    the next one is already in flight.
+
+    Attributes
+    ----------
+    api_url : str
+        Base URL of the Twitter API.
+    max_connections : int
+        Maximum number of connections open at the same time.
+    quota : QuotaScheduler
+        Rate limit of the search endpoint shared by every worker.
+    page_size : int
+        Number of tweets requested per page. 100 is the maximum the API
+        allows.
+    loop : asyncio.AbstractEventLoop or None
+        Event loop the requests run in. It is created the first time it is
+        needed in each process.
+    session : aiohttp.ClientSession or None
+        Pooled HTTP client. It is created the first time it is needed.
+    bearer_token : str
+        Token to authenticate requests. If it is not set, it is requested
+        with TWITTER_CONSUMER_KEY and TWITTER_CONSUMER_SECRET.
+
+    Notes
+    -----
+    The search endpoint pages backwards with max_id, so the request of a page
+    depends on the previous one and the pages of a collection cannot be
+    requested in parallel. Concurrency comes from running many collections
+    at once (see CELERY_WORKER_QUEUES in settings.py).
+
+    The quota is spent in the thread calling collect, not in the event loop,
+    because the Django ORM cannot be used from asynchronous code.
+    """
+
+    page_size = 100
+
+    def __init__(self, api_url=None, max_connections=None, quota=None):
+        """
+        This method sets the attributes. It does not touch the network.
+        """
+
+        self.api_url = api_url or settings.TWITTER_API_URL
+        self.max_connections = (
+            max_connections or settings.COLLECTOR_MAX_CONNECTIONS
+        )
+        self.quota = quota or twitter_quota
+        self.bearer_token = settings.TWITTER_BEARER_TOKEN
+        self.loop = None
+        self.session = None
+        self.token_lock = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def get_loop(self):
+        """
+        This method returns the event loop of the current process, starting
+        it in a background thread if needed.
+        """
+
+        with self.lock:
+            if self.loop is None or self.pid != os.getpid():
+                self.loop = asyncio.new_event_loop()
+                self.session = None
+                self.pid = os.getpid()
+                threading.Thread(
+                    target=self.loop.run_forever, daemon=True,
+                    name='AsyncAPICollector'
+                ).start()
+            return self.loop
+
+    def close(self):
+        """
+        This method closes the aiohttp session and stops the event loop, if
+        they were started in the current process.
+        """
+
+        with self.lock:
+            if self.loop is None or self.pid != os.getpid():
+                return
+            if self.session is not None:
+                asyncio.run_coroutine_threadsafe(
+                    self.session.close(), self.loop
+                ).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop = self.session = None
+
+    async def get_session(self):
+        """
+        This method returns the aiohttp session, creating it if needed, once
+        the bearer token is known.
+        """
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections)
+            )
+            self.token_lock = asyncio.Lock()
+        if not self.bearer_token:
+            async with self.token_lock:
+                if not self.bearer_token:
+                    self.bearer_token = await self.request_bearer_token()
+        return self.session
+
+    async def request_bearer_token(self):
+        """
+        This method requests an application-only bearer token with the
+        consumer key and secret.
+        """
+
+        credentials = base64.b64encode(
+            f'{settings.TWITTER_CONSUMER_KEY}:'
+            f'{settings.TWITTER_CONSUMER_SECRET}'.encode()
+        ).decode()
+        async with self.session.post(
+            f'{self.api_url}/oauth2/token',
+            data={'grant_type': 'client_credentials'},
+            headers={'Authorization': f'Basic {credentials}'}
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())['access_token']
+
+    async def request_page(self, params):
+        """
+        This method requests a page of the search endpoint and reads the rate
+        limit reported in its headers. The page is None if the rate limit was
+        exceeded.
+        """
+
+        session = await self.get_session()
+        async with session.get(
+            f'{self.api_url}/1.1/search/tweets.json', params=params,
+            headers={'Authorization': f'Bearer {self.bearer_token}'}
+        ) as response:
+            rate_limit = None
+            if 'x-rate-limit-remaining' in response.headers:
+                rate_limit = RateLimit(
+                    int(response.headers['x-rate-limit-remaining']),
+                    datetime.fromtimestamp(
+                        int(response.headers['x-rate-limit-reset']),
+                        timezone.utc
+                    )
+                )
+            if response.status == 429:
+                return None, rate_limit
+            response.raise_for_status()
+            return await response.json(), rate_limit
+
+    def send(self, params):
+        """
+        This method spends a call of quota and starts requesting a page in
+        the event loop. It returns the concurrent.futures.Future of the
+        request.
+        """
+
+        self.quota.acquire()
+        return asyncio.run_coroutine_threadsafe(
+            self.request_page(dict(params)), self.get_loop()
         )
-        return cursor.items(number_of_tweets)
+
+    def receive(self, request):
+        """
+        This method waits for a request started by send, corrects quota with
+        the rate limit reported and returns the statuses of the page.
+        """
+
+        page, rate_limit = request.result()
+        if rate_limit is not None:
+            self.quota.update(*rate_limit)
+        if page is None:
+            raise QuotaExceeded(self.quota.update(0))
+        return page['statuses']
+
+    def collect(
+        self, search_term, number_of_tweets, max_id=None, since_id=None
+    ):
+        """
+        This method performs the actual tweets collection. It takes the same
+        parameters as collect_pages.
+
+        Returns
+        -------
+        generator
+            Iterable of CollectedTweet, which have the same attributes
+            collect_tweets reads from the tweepy.Status objects returned by
+            OfficialAPICollector.
+        """
+
+        for page in self.collect_pages(
+            search_term, number_of_tweets, max_id, since_id
+        ):
+            yield from page
+
+    def collect_pages(
+        self, search_term, number_of_tweets, max_id=None, since_id=None
+    ):
+        """
+        This method collects the tweets page by page. It can be called from
+        many threads at once.
+
+        Parameters
+        ----------
+        search_term : str
+            Term entered by the user in the search box.
+        number_of_tweets : int
+            Number of tweets the user requested to collect. If it is 0, every
+            tweet found is collected.
+        max_id : int, default=None
+            If it is given, only tweets with an id less than or equal to it
+            are collected, e.g. to resume a collection.
+        since_id : int, default=None
+            If it is given, only tweets with an id greater than it are
+            collected, e.g. the ones newer than the tweets already stored.
+
+        Returns
+        -------
+        generator
+            Iterable of pages, each one a list of CollectedTweet.
+
+        Raises
+        ------
+        QuotaExceeded
+            If the rate limit is exhausted, once the pages already requested
+            were yielded.
+        """
+
+        params = {
+            'q': f'{search_term} -filter:retweets', 'tweet_mode': 'extended',
+            'result_type': 'recent', 'include_entities': 'false',
+            'count': self.page_size
+        }
+        if max_id is not None:
+            params['max_id'] = max_id
+        if since_id is not None:
+            params['since_id'] = since_id
+        collected = 0
+        request = self.send(params)
+        try:
+            while request is not None:
+                statuses = self.receive(request)
+                request = None
+                if number_of_tweets:
+                    statuses = statuses[:number_of_tweets - collected]
+                collected += len(statuses)
+
+                exceeded = None
+                if statuses and (
+                    not number_of_tweets or collected < number_of_tweets
+                ):
+                    params['max_id'] = statuses[-1]['id'] - 1
+                    try:
+                        request = self.send(params)
+                    except QuotaExceeded as error:
+                        exceeded = error
+
+                if statuses:
+                    yield [
+                        CollectedTweet(
+                            status['id_str'],
+                            datetime.strptime(
+                                status['created_at'],
+                                '%a %b %d %H:%M:%S %z %Y'
+                            ),
+                            status['full_text']
+                        )
+                        for status in statuses
+                    ]
+                if exceeded is not None:
+                    raise exceeded
+        finally:
+            if request is not None:
+                request.cancel()
@@ -0,0 +1,244 @@
+"""
+This module contains the business logic to collect the tweets of a search
+term incrementally, so that a term collected a while ago is not collected
+again from scratch.
+
+Each term keeps a collection index per predictor (see the model
+CollectionIndex) with the range of tweet ids, from max_id to since_id, whose
+tweets were all collected, classified and stored. A later search of the term
+fetches from the API only the tweets newer than since_id, tops up with the
+tweets of the range and fetches tweets older than the range only if it needs
+more. Indexes older than COLLECTION_INDEX_MAX_AGE seconds are ignored.
+
+Class list:
+    * IncrementalCollection - It iterates over the pages of tweets of a
+    search, newest first, fetching from the API only the ones missing in the
+    index.
+
+Function list:
+    * find_index - It returns the collection index a search can use.
+    * update_index - It merges the tweets of a search done into the
+    collection index of its term.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.db import transaction
+from django.db.models.functions import Cast
+
+from .collectors import CollectedTweet
+from .models import CollectionIndex
+from .models import Tweet
+
+
+def find_index(search):
+    """
+    This function returns the collection index a search can use.
+
+    Parameters
+    ----------
+    search : Search
+        The search to collect tweets for.
+
+    Returns
+    -------
+    CollectionIndex or None
+        The index of the search term and predictor, if it was updated less
+        than COLLECTION_INDEX_MAX_AGE seconds before the search was done.
+    """
+
+    fresh = search.date - timedelta(
+        seconds=settings.COLLECTION_INDEX_MAX_AGE
+    )
+    return CollectionIndex.objects.filter(
+        normalized_term=search.normalized_term,
+        predictor=search.predictor_id, date__gte=fresh
+    ).first()
+
+
+def update_index(search):
+    """
+    This function merges the tweets of a search into the collection index of
+    its term. It must be called once the search is done, so its tweets are
+    all stored.
+
+    Parameters
+    ----------
+    search : Search
+        The search done.
+
+    Notes
+    -----
+    The tweets of a search are a range of tweet ids too. The ranges are
+    merged if they overlap, otherwise the newest one is kept.
+    """
+
+    bounds = search.tweets.annotate(
+        number=Cast('id', models.BigIntegerField())
+    ).aggregate(newest=models.Max('number'), oldest=models.Min('number'))
+    if bounds['newest'] is None:
+        return
+
+    with transaction.atomic():
+        index, created = CollectionIndex.objects.select_for_update(
+        ).get_or_create(
+            normalized_term=search.normalized_term,
+            predictor_id=search.predictor_id,
+            defaults={
+                'since_id': bounds['newest'], 'max_id': bounds['oldest'],
+                'date': search.date
+            }
+        )
+        if created:
+            return
+        fresh = index.date >= search.date - timedelta(
+            seconds=settings.COLLECTION_INDEX_MAX_AGE
+        )
+        if (
+            fresh and bounds['oldest'] <= index.since_id
+            and bounds['newest'] >= index.max_id
+        ):
+            if bounds['newest'] > index.since_id:
+                index.since_id = bounds['newest']
+                index.date = max(index.date, search.date)
+            index.max_id = min(index.max_id, bounds['oldest'])
+        elif search.date >= index.date:
+            index.since_id = bounds['newest']
+            index.max_id = bounds['oldest']
+            index.date = search.date
+        else:
+            return
+        index.save()
+
+
+class IncrementalCollection:
+    """
+    This class iterates over the pages of tweets of a search, each one a
+    list of tweets, newest first, fetching from the API only the ones missing
+    in the collection index of its term.
+
+    The tweets of the index are yielded as CollectedTweet without text,
+    since they are classified already (see the task classify_tweets).
+
+    Attributes
+    ----------
+    collector : object
+        Collector (from collectors.py) instance to fetch tweets with.
+    search : Search
+        The search to collect tweets for.
+    number_of_tweets : int
+        Number of tweets to collect. If it is 0, every tweet found is
+        collected.
+    index : CollectionIndex or None
+        The collection index the search uses (see find_index).
+    cursor : int or None
+        Every tweet with an id greater than cursor was already yielded. It is
+        the max_id to resume the collection from, e.g. Search.max_id.
+    collected : int
+        Number of tweets yielded.
+    """
+
+    def __init__(self, collector, search, number_of_tweets, max_id=None):
+        """
+        This method sets the attributes.
+
+        Parameters
+        ----------
+        collector : object
+            Collector (from collectors.py) instance to fetch tweets with.
+        search : Search
+            The search to collect tweets for.
+        number_of_tweets : int
+            Number of tweets to collect. If it is 0, every tweet found is
+            collected.
+        max_id : int, default=None
+            Tweet id to resume a collection from.
+        """
+
+        self.collector = collector
+        self.search = search
+        self.number_of_tweets = number_of_tweets
+        self.index = find_index(search)
+        self.cursor = max_id
+        self.collected = 0
+
+    def __iter__(self):
+        if self.index is None:
+            yield from self.fetch(self.cursor)
+            return
+
+        if self.cursor is None or self.cursor > self.index.since_id:
+            yield from self.fetch(self.cursor, self.index.since_id)
+            if self.is_full():
+                return
+            self.cursor = self.index.since_id
+        yield from self.top_up()
+        if self.is_full():
+            return
+        self.cursor = min(self.cursor, self.index.max_id - 1)
+        yield from self.fetch(self.cursor)
+
+    def is_full(self):
+        """
+        This method returns whether number_of_tweets were already yielded.
+        """
+
+        return bool(self.number_of_tweets) and (
+            self.collected >= self.number_of_tweets
+        )
+
+    def remaining(self):
+        """
+        This method returns the number of tweets left to yield, 0 if there is
+        no limit.
+        """
+
+        if not self.number_of_tweets:
+            return 0
+        return self.number_of_tweets - self.collected
+
+    def fetch(self, max_id, since_id=None):
+        """
+        This method yields the pages fetched from the API with an id from
+        since_id (excluded) to max_id.
+        """
+
+        for page in self.collector.collect_pages(
+            self.search.search_term, self.remaining(), max_id, since_id
+        ):
+            self.cursor = int(page[-1].id_str) - 1
+            self.collected += len(page)
+            yield page
+
+    def top_up(self):
+        """
+        This method yields the tweets of the index with an id up to cursor,
+        which are stored and classified by the search predictor already, in
+        pages of up to COLLECTION_CHUNK_SIZE tweets, so the range is never
+        loaded at once.
+        """
+
+        tweets = Tweet.objects.filter(
+            search__normalized_term=self.search.normalized_term,
+            prediction__predictor=self.search.predictor_id,
+            prediction__deleted=None
+        ).annotate(
+            number=Cast('id', models.BigIntegerField())
+        ).filter(
+            number__gte=self.index.max_id
+        ).order_by('-number').values_list('id', 'date').distinct()
+        while not self.is_full():
+            size = settings.COLLECTION_CHUNK_SIZE
+            if self.number_of_tweets:
+                size = min(size, self.remaining())
+            page = [
+                CollectedTweet(id, date, '')
+                for id, date in tweets.filter(number__lte=self.cursor)[:size]
+            ]
+            if page:
+                self.cursor = int(page[-1].id_str) - 1
+                self.collected += len(page)
+                yield page
+            if len(page) < size:
+                return
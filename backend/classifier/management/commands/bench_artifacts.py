@@ -0,0 +1,88 @@
+"""
+This module contains a Django custom command to measure the memory each
+Celery worker process takes to load the artifacts of the registered
+predictors, with the artifacts memory-mapped and without it.
+"""
+import json
+
+from django.core.management import BaseCommand
+
+from ...benchmarks import make_corpus
+from ...benchmarks import measure_worker_memory
+from ...models import Predictor
+from ...utils import get_predictor
+
+
+class Command(BaseCommand):
+    """
+    Django custom command to report the resident and proportional set sizes
+    per worker process of loading the artifacts of every registered
+    predictor in several processes at once, memory-mapped and not.
+
+    Method list:
+        * add_arguments - It defines the command options.
+        * handle - It overrides the BaseCommand's handle method to run the
+        actual command logic.
+
+    Notes
+    -----
+    The proportional set size (PSS) divides the pages shared by several
+    processes among them, so it shows the memory memory-mapping saves, which
+    the resident set size (RSS) does not. See measure_worker_memory in
+    benchmarks.py. It only works on Linux.
+    """
+
+    help = 'Measure the memory per worker of loading model artifacts.'
+
+    def add_arguments(self, parser):
+        """
+        This method defines the command options.
+        """
+
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Number of worker processes.'
+        )
+        parser.add_argument(
+            '--size', type=int, default=1000,
+            help='Number of tweets each worker classifies.'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed of the synthetic corpus.'
+        )
+        parser.add_argument('--output', help='JSON file to write results to.')
+
+    def handle(self, *args, **options):
+        """
+        This method overrides the BaseCommand's handle method to run the
+        actual command logic.
+        """
+
+        corpus = make_corpus(options['size'], options['seed'])
+        results = {}
+        for predictor in Predictor.objects.order_by('id'):
+            name = str(predictor)
+            if name in results:
+                continue
+            instance = get_predictor(predictor)
+            results[name] = {}
+            for mode in ['r', None]:
+                workers = measure_worker_memory(
+                    instance, corpus, options['workers'], mode
+                )
+                results[name][str(mode)] = workers
+                averages = {
+                    field: sum(worker[field] for worker in workers)
+                    / len(workers) / 2 ** 20
+                    for field in ['rss', 'pss']
+                }
+                self.stdout.write(
+                    f'{name} {options["workers"]} workers, mmap_mode {mode}: '
+                    f'RSS {averages["rss"]:.1f} MiB, '
+                    f'PSS {averages["pss"]:.1f} MiB per worker'
+                )
+
+        if options['output'] is not None:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output)
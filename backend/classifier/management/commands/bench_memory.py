@@ -0,0 +1,83 @@
+"""
+This module contains a Django custom command to measure the peak memory the
+registered predictors take to classify collections of tweets at once.
+"""
+import json
+
+from django.core.management import BaseCommand
+
+from ...benchmarks import make_corpus
+from ...benchmarks import measure_peak_rss
+from ...models import Predictor
+from ...utils import get_predictor
+
+
+class Command(BaseCommand):
+    """
+    Django custom command to report the peak resident set size of
+    vectorizing and predicting synthetic corpora of several sizes with every
+    registered predictor, keeping the features sparse and making them dense.
+
+    Method list:
+        * add_arguments - It defines the command options.
+        * handle - It overrides the BaseCommand's handle method to run the
+        actual command logic.
+
+    Notes
+    -----
+    Each measure runs in a forked process (see measure_peak_rss in
+    benchmarks.py), so the measures do not add up. It only works on Linux.
+    """
+
+    help = 'Measure the peak memory of classifying tweets at once.'
+
+    def add_arguments(self, parser):
+        """
+        This method defines the command options.
+        """
+
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+            help='Number of tweets classified at once.'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed of the synthetic corpus.'
+        )
+        parser.add_argument(
+            '--no-dense', action='store_false', dest='dense',
+            help='Do not measure dense features.'
+        )
+        parser.add_argument('--output', help='JSON file to write results to.')
+
+    def handle(self, *args, **options):
+        """
+        This method overrides the BaseCommand's handle method to run the
+        actual command logic.
+        """
+
+        modes = ['sparse', 'dense'] if options['dense'] else ['sparse']
+        corpus = make_corpus(max(options['sizes']), options['seed'])
+        results = {}
+        for predictor in Predictor.objects.order_by('id'):
+            name = str(predictor)
+            if name in results:
+                continue
+            instance = get_predictor(predictor)
+            results[name] = {}
+            for size in options['sizes']:
+                results[name][str(size)] = {
+                    mode: measure_peak_rss(
+                        instance, corpus[:size], sparse=mode == 'sparse'
+                    )
+                    for mode in modes
+                }
+                peaks = ', '.join(
+                    f'{mode} {result["peak"] / 2 ** 20:.0f} MiB'
+                    for mode, result in results[name][str(size)].items()
+                )
+                self.stdout.write(f'{name} {size} tweets: peak RSS {peaks}')
+
+        if options['output'] is not None:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output)
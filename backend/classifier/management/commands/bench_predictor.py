@@ -0,0 +1,170 @@
+"""
+This module contains a Django custom command to benchmark the registered
+predictors and compare the results against a baseline.
+"""
+import json
+
+from django.core.management import BaseCommand
+from django.core.management import CommandError
+
+from ...benchmarks import benchmark_predictor
+from ...benchmarks import benchmark_scorer
+from ...benchmarks import compare_results
+from ...benchmarks import corpus_digest
+from ...benchmarks import make_corpus
+from ...benchmarks import STAGES
+from ...models import Predictor
+from ...utils import get_predictor
+
+
+class Command(BaseCommand):
+    """
+    Django custom command to classify a synthetic or given corpus with every
+    registered predictor at several batch sizes and report how long it took.
+
+    Method list:
+        * add_arguments - It defines the command options.
+        * handle - It overrides the BaseCommand's handle method to run the
+        actual command logic.
+        * load_corpus - It reads the corpus file or builds a synthetic one.
+        * report - It writes the results of a predictor and batch size.
+
+    Notes
+    -----
+    For the predictors with a scorer (see scorers.py), each batch size also
+    reports the time the scorer and the predict_proba method of the model
+    take to classify a batch, under the key scorer.
+
+    The results are written to --output as a JSON file. Pass a previous one as
+    --baseline to fail the command when the throughput drops, or the peak
+    memory grows, more than --threshold, or when any label differs. See
+    benchmarks.py for how each stage is timed.
+    """
+
+    help = 'Benchmark the registered predictors and compare to a baseline.'
+
+    def add_arguments(self, parser):
+        """
+        This method defines the command options.
+        """
+
+        parser.add_argument(
+            '--corpus', help='Text file with one tweet per line. If it is '
+            'not given, a synthetic Spanish corpus is built.'
+        )
+        parser.add_argument(
+            '--size', type=int, default=10000,
+            help='Number of tweets of the synthetic corpus.'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed of the synthetic corpus.'
+        )
+        parser.add_argument(
+            '--batch-sizes', type=int, nargs='+', default=[100, 1000, 10000],
+            help='Number of tweets classified at once.'
+        )
+        parser.add_argument(
+            '--no-persist', action='store_false', dest='persist',
+            help='Do not time storing the predictions.'
+        )
+        parser.add_argument('--output', help='JSON file to write results to.')
+        parser.add_argument(
+            '--baseline', help='JSON file written by a previous run.'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.1,
+            help='Fraction the results may get worse than the baseline.'
+        )
+
+    def load_corpus(self, options):
+        """
+        This method reads the corpus file given, or builds a synthetic one if
+        none was given.
+        """
+
+        if options['corpus'] is None:
+            return make_corpus(options['size'], options['seed'])
+        with open(options['corpus'], encoding='utf-8') as corpus:
+            return [line.rstrip('\n') for line in corpus]
+
+    def report(self, name, batch_size, result):
+        """
+        This method writes the results of a predictor and batch size.
+        """
+
+        stages = ', '.join(
+            f'{stage} {result["stages"][stage]:.3f}s' for stage in STAGES
+        )
+        self.stdout.write(
+            f'{name} batch {batch_size}: {stages}; '
+            f'{result["tweets_per_second"]:.0f} tweets/s; '
+            f'peak memory {result["peak_memory"] / 2 ** 20:.1f} MiB'
+        )
+        if 'scorer' in result:
+            self.stdout.write(
+                f'{name} batch {batch_size}: scorer '
+                f'{result["scorer"]["scorer"]:.4f}s, predict_proba '
+                f'{result["scorer"]["predict_proba"]:.4f}s'
+            )
+
+    def handle(self, *args, **options):
+        """
+        This method overrides the BaseCommand's handle method to run the
+        actual command logic.
+        """
+
+        baseline = None
+        if options['baseline'] is not None:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        texts = self.load_corpus(options)
+        digest = corpus_digest(texts)
+        if baseline is not None and baseline['corpus'] != digest:
+            raise CommandError(
+                'The corpus differs from the one of the baseline.'
+            )
+
+        results = {}
+        for predictor in Predictor.objects.order_by('id'):
+            name = str(predictor)
+            if name in results:
+                continue
+            instance = get_predictor(predictor)
+            results[name] = {}
+            for batch_size in options['batch_sizes']:
+                result = benchmark_predictor(
+                    instance, texts, batch_size, options['persist']
+                )
+                if hasattr(instance, 'scorer'):
+                    result['scorer'] = benchmark_scorer(
+                        instance, texts[:batch_size]
+                    )
+                results[name][str(batch_size)] = result
+                self.report(name, batch_size, result)
+
+        if options['output'] is not None:
+            with open(options['output'], 'w') as output:
+                json.dump({'corpus': digest, 'results': results}, output)
+
+        if baseline is None:
+            return
+
+        regressions, label_differences = compare_results(
+            baseline['results'], results, options['threshold']
+        )
+        for regression in regressions:
+            self.stderr.write(
+                f'{regression.predictor} batch {regression.batch_size}: '
+                f'{regression.metric} went from {regression.baseline:.0f} to '
+                f'{regression.current:.0f}.'
+            )
+        for name, differences in label_differences.items():
+            self.stderr.write(
+                f'{name}: {len(differences)} labels differ from the baseline, '
+                f'e.g. line {differences[0] + 1}.'
+            )
+        if regressions or label_differences:
+            raise CommandError('The predictors regressed from the baseline.')
+        self.stdout.write(self.style.SUCCESS('No regressions found!'))
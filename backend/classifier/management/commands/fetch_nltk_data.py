@@ -0,0 +1,46 @@
+"""
+This module contains a Django custom command to fill the NLTK data directory
+the tokenizers read from, so no download happens at runtime.
+"""
+import nltk
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.core.management import CommandError
+
+from ...utils import write_manifest
+
+
+class Command(BaseCommand):
+    """
+    Django custom command to download the NLTK modules into
+    settings.NLTK_DATA_DIR and record their checksums.
+
+    Method list:
+        * handle - It overrides the BaseCommand's handle method to run the
+        actual command logic.
+
+    Notes
+    -----
+    Run it when building the image, which is the only step that needs network
+    access. Workers verify the checksums recorded here before using the data
+    (see NLTKTokenizer in tokenizers.py).
+    """
+
+    help = 'Download the NLTK data into settings.NLTK_DATA_DIR.'
+    modules = ['punkt']
+
+    def handle(self, *args, **options):
+        """
+        This method overrides the BaseCommand's handle method to run the
+        actual command logic.
+        """
+
+        data_dir = settings.NLTK_DATA_DIR
+        self.stdout.write(f'Downloading NLTK data into {data_dir}...')
+        for module in self.modules:
+            if not nltk.download(module, download_dir=data_dir, quiet=True):
+                raise CommandError(f'NLTK module {module} not downloaded.')
+        manifest = write_manifest(data_dir)
+        self.stdout.write(self.style.SUCCESS(
+            f'NLTK data ready! {len(manifest["files"])} files.'
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-17 23:09
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifier', '0002_alter_app_logo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictor',
+            name='artifacts_path',
+            field=models.CharField(default='example', max_length=100),
+        ),
+    ]
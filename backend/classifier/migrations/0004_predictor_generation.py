@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-17 23:16
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifier', '0003_predictor_artifacts_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictor',
+            name='generation',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
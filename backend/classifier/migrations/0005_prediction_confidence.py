@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-17 23:17
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifier', '0004_predictor_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prediction',
+            name='confidence',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2 on 2026-10-17 23:21
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifier', '0005_prediction_confidence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InferenceRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tweets', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('size', models.PositiveIntegerField()),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('predictor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='classifier.predictor')),
+                ('search', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='classifier.search')),
+            ],
+            options={
+                'db_table': 'InferenceRequest',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inferencerequest',
+            index=models.Index(fields=['predictor', 'date'], name='InferenceRe_predict_c4d79b_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2 on 2026-10-17 23:40
+from django.db import migrations
+from django.db import models
+
+
+def complete_existing_searches(apps, schema_editor):
+    # Searches made before this migration were collected and classified at
+    # once, so they are already completed.
+    Search = apps.get_model('classifier', 'Search')
+    for search in Search.objects.annotate(size=models.Count('tweets')):
+        search.collected = search.classified = search.size
+        search.collecting = False
+        search.done = True
+        search.save(
+            update_fields=['collected', 'classified', 'collecting', 'done']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifier', '0006_inferencerequest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='search',
+            name='classified',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='search',
+            name='collected',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='search',
+            name='collecting',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='search',
+            name='done',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(
+            complete_existing_searches, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2 on 2026-10-17 23:58
+import classifier.utils
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+def normalize_existing_terms(apps, schema_editor):
+    Search = apps.get_model('classifier', 'Search')
+    for search in Search.objects.all():
+        search.normalized_term = classifier.utils.normalize_search_term(
+            search.search_term
+        )
+        search.save(update_fields=['normalized_term'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifier', '0007_search_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='search',
+            name='done_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='search',
+            name='leader',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='followers', to='classifier.search'),
+        ),
+        migrations.AddField(
+            model_name='search',
+            name='normalized_term',
+            field=models.CharField(default='', editable=False, max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(
+            normalize_existing_terms, migrations.RunPython.noop
+        ),
+        migrations.AddIndex(
+            model_name='search',
+            index=models.Index(fields=['normalized_term', 'predictor', 'number_of_tweets'], name='Search_normali_beb58e_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2 on 2026-10-18 00:02
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifier', '0008_search_coalescing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIQuota',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=30, unique=True)),
+                ('remaining', models.PositiveIntegerField()),
+                ('reset', models.DateTimeField(blank=True, null=True)),
+                ('waiting', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'APIQuota',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2 on 2026-10-18 00:08
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifier', '0009_apiquota'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('normalized_term', models.CharField(max_length=100)),
+                ('since_id', models.BigIntegerField()),
+                ('max_id', models.BigIntegerField()),
+                ('date', models.DateTimeField()),
+                ('predictor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='classifier.predictor')),
+            ],
+            options={
+                'db_table': 'CollectionIndex',
+                'unique_together': {('normalized_term', 'predictor')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 00:12
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifier', '0010_collectionindex'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='search',
+            name='max_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2 on 2026-10-18 00:16
+from django.db import migrations
+from django.db import models
+
+
+def skip_existing_searchers(apps, schema_editor):
+    # Searchers registered before this migration were never notified, since
+    # notifications were not implemented. They are not notified now either,
+    # because their searches may be long done.
+    Searcher = apps.get_model('classifier', 'Searcher')
+    Searcher.objects.update(notified=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifier', '0011_search_max_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searcher',
+            name='notified',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(
+            skip_existing_searchers, migrations.RunPython.noop
+        ),
+    ]
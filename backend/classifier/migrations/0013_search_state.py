@@ -0,0 +1,59 @@
+# Generated by Django 3.2 on 2026-10-18 00:19
+from django.db import migrations
+from django.db import models
+
+
+def set_state(apps, schema_editor):
+    Search = apps.get_model('classifier', 'Search')
+    Search.objects.filter(collecting=False, done=False).update(
+        state='classifying'
+    )
+    Search.objects.filter(collecting=True, collected__gt=0).update(
+        state='collecting'
+    )
+    Search.objects.filter(done=True).update(state='done')
+    Search.objects.filter(empty=True).update(state='empty')
+
+
+def set_flags(apps, schema_editor):
+    Search = apps.get_model('classifier', 'Search')
+    Search.objects.exclude(state__in=['queued', 'collecting']).update(
+        collecting=False
+    )
+    Search.objects.filter(state__in=['done', 'empty']).update(done=True)
+    Search.objects.filter(state='empty').update(empty=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifier', '0012_searcher_notified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='search',
+            name='state',
+            field=models.CharField(
+                choices=[
+                    ('queued', 'Queued'), ('collecting', 'Collecting'),
+                    ('classifying', 'Classifying'), ('done', 'Done'),
+                    ('empty', 'Empty'), ('failed', 'Failed')
+                ],
+                db_index=True, default='queued', max_length=11
+            ),
+        ),
+        migrations.RunPython(set_state, set_flags),
+        migrations.RemoveField(
+            model_name='search',
+            name='collecting',
+        ),
+        migrations.RemoveField(
+            model_name='search',
+            name='done',
+        ),
+        migrations.RemoveField(
+            model_name='search',
+            name='empty',
+        ),
+    ]
@@ -14,14 +14,23 @@ The application models are:
     * Prediction - It encapsulates information about a prediction made.
     * PredictionLabel - It encapsulates information about a label that may be
     predicted by a predictive model.
+    * InferenceRequest - It encapsulates the tweets of a search waiting to be
+    classified.
+    * APIQuota - It encapsulates the calls left to a Twitter API endpoint in
+    its current rate limit window.
+    * CollectionIndex - It encapsulates the range of tweets of a search term
+    already collected and classified by a predictor.
 """
-from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from safedelete.models import SafeDeleteModel
 from safedelete.models import SOFT_DELETE_CASCADE
 
+from .caches import prediction_cache
+from .caches import predictor_registry
 from .storage import OverwriteableStorage
 from .utils import logo_filename
+from .utils import normalize_search_term
 from .utils import update_app_settings
 
 
@@ -71,12 +80,22 @@ class Predictor(BaseModel):
         When the app is configured to allow the user to choose the predictor
         to use and this field is True, this predictor is shown to the user,
         otherwise is not shown.
+    artifacts_path : str, default='example'
+        Directory, relative to settings.MODEL_ARTIFACTS_DIR, containing the
+        trained model files of the predictor. Its manifest file must record
+        the same version as this predictor. Max 100 characters.
+    generation : int, default=0
+        Counter incremented every time the predictor or its labels change.
+        Processes compare it with the one their Predictor (from
+        predictors.py) instance was built for to know when to rebuild it.
     """
 
     name = models.CharField(max_length=30)
     version = models.CharField(max_length=10)
     description = models.CharField(max_length=200)
     active = models.BooleanField(default=True, blank=True)
+    artifacts_path = models.CharField(max_length=100, default='example')
+    generation = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         db_table = 'Predictor'
@@ -119,31 +138,32 @@ class Predictor(BaseModel):
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
         update_app_settings()
-        self.delete_predictor_from_cache()
+        self.invalidate_predictor()
 
     def delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
         update_app_settings()
-        self.delete_predictor_from_cache()
+        self.invalidate_predictor()
 
-    # FIXME: cache is not being updated when running cache.set here.
-    # cache from .models and cache from .utils seem to be different.
-    # This may be a sign of being running two django instances.
-    # Check backend and celery services in docker-compose.yml.
-    def delete_predictor_from_cache(self):
+    def invalidate_predictor(self):
         """
-        This method removes a Predictor (from predictors.py) instance
-        from cache if its id matches this model id.
+        This method increments generation in the database so that every
+        process (web server or Celery worker) rebuilds its Predictor (from
+        predictors.py) instance for this model the next time it calls
+        get_predictor (utils.py). The instance and the labels predicted by
+        this process are dropped right away.
 
         It is intended to be used when predictor-related information changes,
         which includes creating/updating/deleting instances of the models
         Predictor and PredictionLabel.
         """
 
-        predictors = cache.get_or_set('PREDICTORS', {})
-        if self.id in predictors:
-            del predictors[self.id]
-            cache.set('PREDICTORS', predictors)
+        Predictor.all_objects.filter(pk=self.pk).update(
+            generation=models.F('generation') + 1
+        )
+        self.refresh_from_db(fields=['generation'])
+        predictor_registry.discard(self.id)
+        prediction_cache.invalidate(self.id)
 
 
 class PredictionLabel(BaseModel):
@@ -175,10 +195,12 @@ class PredictionLabel(BaseModel):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
+        self.predictor.invalidate_predictor()
         update_app_settings()
 
     def delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
+        self.predictor.invalidate_predictor()
         update_app_settings()
 
     def __str__(self):
@@ -230,6 +252,9 @@ class Prediction(BaseModel):
         The tweet for which the prediction was made.
     label : PredictionLabel
         The label predicted.
+    confidence : float, default=None
+        Probability the predictor assigned to the label predicted. None if the
+        predictor does not estimate it.
     date : datetime
         Date when the prediction was made/stored.
     """
@@ -237,6 +262,7 @@ class Prediction(BaseModel):
     predictor = models.ForeignKey(Predictor, on_delete=models.CASCADE)
     tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE)
     label = models.ForeignKey(PredictionLabel, on_delete=models.CASCADE)
+    confidence = models.FloatField(null=True, blank=True)
     date = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -267,9 +293,6 @@ class Search(BaseModel):
         Date when the user did the search.
     number_of_tweets :int
         Number of tweets the user requested to collect.
-    empty : bool, default=False
-        Set to True when no tweets were found for the search term,
-        otherwise False.
     predictor : Predictor
         The predictor to used for the tweets collected in this search.
         If the app is not configured to allow the user to choose the predictor,
@@ -277,18 +300,90 @@ class Search(BaseModel):
     tweets : Queryset<Tweet>
         Collection of tweets found in this search. This field represents a
         many-to-many relationship between Search and Tweet.
+    collected : int
+        Number of tweets collected so far.
+    classified : int
+        Number of tweets collected so far whose classification is completed.
+    state : str, default='queued'
+        Stage of the lifecycle of the search (see Search.State). Followers
+        stay queued until their leader is done, empty or failed, and then
+        take its state (see coalescing.py).
+    done_date : models.DateTimeField, default=None
+        Date when the search was done.
+    normalized_term : str
+        search_term in lowercase and with its whitespaces collapsed. It is
+        set when the search is saved. Max 100 characters.
+    leader : Search, default=None
+        Identical search whose collection and classification results this
+        search reuses (see coalescing.py). None if this search collects and
+        classifies its own tweets.
+    max_id : int, default=None
+        Checkpoint of the collection: every tweet with a greater id was
+        already collected. None if no tweet was collected yet.
+
+    Notes
+    -----
+    The state is changed by the Celery tasks (see tasks.py) with conditional
+    UPDATE statements, so concurrent tasks cannot skip a stage:
+
+        queued -> collecting -> classifying -> done
+                  collecting -> empty, if no tweets were found
+                  collecting -> failed -> collecting, if it is retried
     """
 
+    class State(models.TextChoices):
+        QUEUED = 'queued'
+        COLLECTING = 'collecting'
+        CLASSIFYING = 'classifying'
+        DONE = 'done'
+        EMPTY = 'empty'
+        FAILED = 'failed'
+
+    IN_PROGRESS = [State.QUEUED, State.COLLECTING, State.CLASSIFYING]
+    FINISHED = [State.DONE, State.EMPTY]
+    # The searchers of a failed search are notified of the failure.
+    NOTIFIABLE = [State.DONE, State.EMPTY, State.FAILED]
+
     truncated_uuid = models.CharField(max_length=8, db_index=True)
     search_term = models.CharField(max_length=100)
     date = models.DateTimeField(auto_now_add=True)
     number_of_tweets = models.PositiveIntegerField()
-    empty = models.BooleanField(default=False, blank=True)
     predictor = models.ForeignKey(Predictor, on_delete=models.CASCADE)
     tweets = models.ManyToManyField(Tweet)
+    collected = models.PositiveIntegerField(default=0)
+    classified = models.PositiveIntegerField(default=0)
+    state = models.CharField(
+        max_length=11, choices=State.choices, default=State.QUEUED,
+        db_index=True
+    )
+    done_date = models.DateTimeField(null=True, blank=True)
+    normalized_term = models.CharField(max_length=100, editable=False)
+    leader = models.ForeignKey(
+        'self', on_delete=models.CASCADE, null=True, blank=True,
+        related_name='followers'
+    )
+    max_id = models.BigIntegerField(null=True, blank=True)
 
     class Meta:
         db_table = 'Search'
+        indexes = [
+            models.Index(
+                fields=['normalized_term', 'predictor', 'number_of_tweets']
+            )
+        ]
+
+    @property
+    def finished(self):
+        """
+        This property returns whether the collection and classification of
+        tweets are completed, i.e. the search is done or empty.
+        """
+
+        return self.state in self.FINISHED
+
+    def save(self, *args, **kwargs):
+        self.normalized_term = normalize_search_term(self.search_term)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.search_term
@@ -311,11 +406,14 @@ class Searcher(BaseModel):
         Email of the user. This email address is used to notify the user.
     search : Search
         the search which the user is interested in.
+    notified : bool, default=False
+        Whether the user was already notified. See notifications.py.
     """
 
     name = models.CharField(max_length=50)
     email = models.EmailField()
     search = models.ForeignKey(Search, on_delete=models.CASCADE)
+    notified = models.BooleanField(default=False)
 
     class Meta:
         db_table = 'Searcher'
@@ -327,6 +425,126 @@ class Searcher(BaseModel):
         return f'{self.name} ({self.email})'
 
 
+class InferenceRequest(models.Model):
+    """
+    This model encapsulates the tweets of a search waiting to be classified.
+
+    Requests of several searches which use the same predictor are classified
+    together in micro-batches (see the task run_inference_batch in tasks.py).
+    They are deleted once their predictions are stored.
+
+    It also stages the tweets collected for the Celery tasks, which receive
+    the primary key of the request instead of the tweets themselves.
+
+    Attributes
+    ----------
+    search : Search
+        The search the tweets were collected for.
+    predictor : Predictor
+        The predictor to classify the tweets with.
+    tweets : list of triples
+        Collection of triples containing tweet information in the following
+        order: tweet id, tweet date, tweet text.
+    size : int
+        Number of tweets.
+    date : datetime
+        Date when the request was queued.
+    """
+
+    search = models.ForeignKey(Search, on_delete=models.CASCADE)
+    predictor = models.ForeignKey(Predictor, on_delete=models.CASCADE)
+    tweets = models.JSONField(encoder=DjangoJSONEncoder)
+    size = models.PositiveIntegerField()
+    date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'InferenceRequest'
+        indexes = [models.Index(fields=['predictor', 'date'])]
+
+    def __str__(self):
+        return f'{self.search} ({self.size})'
+
+    def __repr__(self):
+        return f'{self.search} ({self.size})'
+
+
+class APIQuota(models.Model):
+    """
+    This model encapsulates the calls left to a Twitter API endpoint in its
+    current rate limit window.
+
+    It is shared by every worker, which must lock it before spending calls
+    (see quotas.py).
+
+    Attributes
+    ----------
+    name : str
+        Name of the rate limited endpoint. Max 30 characters.
+    remaining : int
+        Number of calls left in the current window.
+    reset : datetime, default=None
+        Date when the current window ends and the calls are replenished.
+    waiting : int, default=0
+        Number of collections deferred until the window ends.
+    """
+
+    name = models.CharField(max_length=30, unique=True)
+    remaining = models.PositiveIntegerField()
+    reset = models.DateTimeField(null=True, blank=True)
+    waiting = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'APIQuota'
+
+    def __str__(self):
+        return f'{self.name} ({self.remaining})'
+
+    def __repr__(self):
+        return f'{self.name} ({self.remaining})'
+
+
+class CollectionIndex(models.Model):
+    """
+    This model encapsulates the range of tweets of a search term already
+    collected and classified by a predictor.
+
+    Every tweet found for the term with an id from max_id to since_id is
+    stored, along with its prediction, so later searches of the term only
+    fetch the tweets out of the range (see incremental.py).
+
+    Attributes
+    ----------
+    normalized_term : str
+        Search term as normalized by normalize_search_term in utils.py. Max
+        100 characters.
+    predictor : Predictor
+        The predictor which classified the tweets.
+    since_id : int
+        Id of the newest tweet of the range.
+    max_id : int
+        Id of the oldest tweet of the range.
+    date : datetime
+        Date of the search which collected the tweet with id since_id. Newer
+        tweets may have been published since then.
+    """
+
+    normalized_term = models.CharField(max_length=100)
+    predictor = models.ForeignKey(Predictor, on_delete=models.CASCADE)
+    since_id = models.BigIntegerField()
+    max_id = models.BigIntegerField()
+    date = models.DateTimeField()
+
+    class Meta:
+        db_table = 'CollectionIndex'
+        unique_together = ('normalized_term', 'predictor')
+
+    def __str__(self):
+        return f'{self.normalized_term} ({self.max_id}-{self.since_id})'
+
+    def __repr__(self):
+        return f'{self.normalized_term} ({self.max_id}-{self.since_id})'
+
+
 class App(models.Model):
     """
     This model encapsulates information about the application itself.
@@ -0,0 +1,160 @@
+"""
+This module contains the business logic to notify the searchers by email
+once their searches are done or failed.
+
+The summary of the results of a search is rendered once, whatever the
+number of its searchers. Searches done within NOTIFICATION_WINDOW seconds
+are notified together (see the task notify_searchers in tasks.py), so an
+address registered in several of them gets a single email with every
+summary. The emails are sent in batches of NOTIFICATION_BATCH_SIZE over a
+single connection to the mail server.
+
+Function list:
+    * render_summary - It renders the summary of the results of a search.
+    * build_messages - It builds one email per address from the summaries of
+    the searches of its searchers.
+    * send_notifications - It sends the notifications pending of every search
+    done or failed.
+"""
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import Q
+from django.template.loader import render_to_string
+
+from .models import Prediction
+from .models import Search
+from .models import Searcher
+
+
+def render_summary(search):
+    """
+    This function renders the summary of the results of a search: the number
+    of tweets per label and the link to the results, or why there are none.
+
+    Parameters
+    ----------
+    search : Search
+        The search done or failed. Followers summarize the results of their
+        leaders.
+
+    Returns
+    -------
+    str
+        Plain text summary.
+    """
+
+    leader = search.leader or search
+    labels = Prediction.objects.filter(
+        predictor=leader.predictor_id, tweet__search=leader.id
+    ).values(name=F('label__label')).annotate(
+        tweets=Count('id')
+    ).order_by('name')
+    return render_to_string('classifier/notification.txt', {
+        'search': search,
+        'leader': leader,
+        'labels': labels,
+        'url': f'{settings.FRONTEND_URL}/search/{search.truncated_uuid}',
+    }).strip()
+
+
+def build_messages(searchers):
+    """
+    This function builds one email per address from the summaries of the
+    searches of its searchers.
+
+    Parameters
+    ----------
+    searchers : list of Searcher
+        The searchers to notify.
+
+    Returns
+    -------
+    list of tuples
+        Pairs of EmailMessage and the list of the primary keys of the
+        searchers it notifies.
+    """
+
+    summaries = {}
+    recipients = {}
+    for searcher in searchers:
+        if searcher.search_id not in summaries:
+            summaries[searcher.search_id] = render_summary(searcher.search)
+        recipients.setdefault(searcher.email.lower(), []).append(searcher)
+
+    messages = []
+    for email, group in recipients.items():
+        searches = list(dict.fromkeys(
+            searcher.search for searcher in group
+        ))
+        if len(searches) == 1:
+            subject = f"Results for '{searches[0].search_term}'"
+        else:
+            subject = f'Results for {len(searches)} searches'
+        body = '\n\n'.join(
+            [f'Hi {group[0].name},']
+            + [summaries[search.id] for search in searches]
+        )
+        message = EmailMessage(subject, body, to=[group[0].email])
+        messages.append((message, [searcher.id for searcher in group]))
+    return messages
+
+
+def send_notifications():
+    """
+    This function sends the notifications pending of every search done or
+    failed.
+
+    Returns
+    -------
+    int
+        Number of emails sent.
+
+    Notes
+    -----
+    The searchers are claimed (marked as notified) in a transaction that
+    skips the ones locked by concurrent calls, so no searcher is notified
+    twice. The ones whose email could not be sent are released to be
+    notified by a later call. The email backends send the messages of a
+    batch in order and return the number sent, so the ones after that number
+    are the ones not sent.
+    """
+
+    with transaction.atomic():
+        searchers = list(
+            Searcher.objects.select_for_update(
+                skip_locked=True, of=('self',)
+            ).filter(
+                Q(search__state__in=Search.NOTIFIABLE)
+                | Q(search__leader__state__in=Search.NOTIFIABLE),
+                notified=False
+            ).select_related('search__leader').order_by('id')
+        )
+        Searcher.objects.filter(
+            pk__in=[searcher.id for searcher in searchers]
+        ).update(notified=True)
+    if not searchers:
+        return 0
+
+    messages = build_messages(searchers)
+    unsent = {searcher.id for searcher in searchers}
+    sent = 0
+    try:
+        with get_connection() as connection:
+            for i in range(
+                0, len(messages), settings.NOTIFICATION_BATCH_SIZE
+            ):
+                batch = messages[i:i + settings.NOTIFICATION_BATCH_SIZE]
+                count = connection.send_messages(
+                    [message for message, _ in batch]
+                ) or 0
+                for _, searcher_ids in batch[:count]:
+                    unsent.difference_update(searcher_ids)
+                sent += count
+    finally:
+        if unsent:
+            Searcher.objects.filter(pk__in=unsent).update(notified=False)
+    return sent
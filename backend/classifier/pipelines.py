@@ -0,0 +1,115 @@
+"""
+This module contains the feature pipeline layer, which lets several
+predictors share their preprocessing stage.
+
+A predictor declares its preprocessing stage through its preprocessing_key
+attribute (see AbstractPredictor in predictors.py). The key is built from the
+content of everything that determines the features, e.g. the checksum of the
+vectorizer file, so predictors with equal keys produce identical features for
+the same tweets.
+
+Function list:
+    * preprocessing_key - It builds a content-addressed key.
+    * get_shared_preprocessor - It returns the preprocessor instance shared
+    by the predictors with the same key.
+    * predict_many - It classifies the same tweets with several predictors,
+    preprocessing them once per distinct key.
+"""
+import hashlib
+import threading
+import weakref
+
+
+_preprocessors = weakref.WeakValueDictionary()
+_preprocessors_lock = threading.Lock()
+
+
+def preprocessing_key(*parts):
+    """
+    This function builds a content-addressed key for a preprocessing stage.
+
+    Parameters
+    ----------
+    *parts : str
+        Everything that determines the features the stage produces, e.g. its
+        class name, settings and checksums of its model files.
+
+    Returns
+    -------
+    str
+        Hex digest of parts.
+    """
+
+    digest = hashlib.blake2b('\0'.join(parts).encode(), digest_size=16)
+    return digest.hexdigest()
+
+
+def get_shared_preprocessor(key, build):
+    """
+    This function returns the preprocessor instance registered for a key,
+    building and registering it first if needed. It is kept while any
+    predictor of this process uses it.
+
+    Parameters
+    ----------
+    key : str
+        Content-addressed key of the preprocessing stage.
+    build : callable
+        Function which receives no arguments and returns a new preprocessor.
+
+    Returns
+    -------
+    object
+        Preprocessor instance shared by the predictors with the same key.
+    """
+
+    with _preprocessors_lock:
+        preprocessor = _preprocessors.get(key)
+        if preprocessor is None:
+            preprocessor = build()
+            _preprocessors[key] = preprocessor
+        return preprocessor
+
+
+def predict_many(predictors, tweets):
+    """
+    This function classifies the same tweets with several predictors (e.g. for
+    A/B evaluations or ensembles). The tweets are preprocessed once per
+    distinct preprocessing_key and the features are fed to every predictor
+    sharing it.
+
+    Parameters
+    ----------
+    predictors : list of AbstractPredictor
+        Predictors (from predictors.py) to classify the tweets with.
+    tweets : list of triples
+        Collection of triples containing tweet information in the following
+        order: tweet id, tweet date, tweet text.
+
+    Returns
+    -------
+    list
+        Prediction of each predictor, in the same order, as returned by
+        AbstractPredictor.predict.
+
+    Notes
+    -----
+    Predictors without a preprocessing_key are called through their method
+    predict. The rest skip the prediction_cache (caches.py).
+    """
+
+    stages = {}
+    for predictor in predictors:
+        if predictor.preprocessing_key is not None:
+            stages.setdefault(predictor.preprocessing_key, predictor)
+
+    preprocessed_data = {
+        key: predictor.preprocess(tweets) for key, predictor in stages.items()
+    }
+    return [
+        predictor.predict(tweets) if predictor.preprocessing_key is None
+        else predictor.predict_features(
+            preprocessed_data[predictor.preprocessing_key]
+        )
+        for predictor in predictors
+    ]
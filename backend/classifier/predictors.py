@@ -4,22 +4,46 @@ ranging from data preprocessing to the actual inference.
 
 Notes
 -----
-Instances of classes in here are cached if you call get_predictor (utils.py)
-instead of instantiating them directly. This is done to mitigate the cost of
-loading (likely) heavy model files for every prediction request.
+Instances of classes in here are registered per process if you call
+get_predictor (utils.py) instead of instantiating them directly. This is done
+to mitigate the cost of loading (likely) heavy model files for every
+prediction request.
+
+The labels predicted for each tweet text are also cached (see caches.py), so
+texts which were already classified by a predictor skip the prediction
+pipeline.
 """
 import abc
-import os
 
-import joblib
+import scipy.sparse
 
+from .artifacts import artifact_store
+from .caches import prediction_cache
+from .pipelines import get_shared_preprocessor
 from .preprocessors import LogisticRegressionPreprocessor
+from .scorers import LinearScorer
+
+
+# Placeholder for the tweets which are not found in prediction_cache.
+_MISSING = object()
 
 
 class AbstractPredictor(metaclass=abc.ABCMeta):
     """
     Abstract class which your custom predictors must subclass from.
 
+    Attributes
+    ----------
+    accepts_sparse : bool, default=False
+        Set it to True if your prediction model accepts scipy.sparse matrices
+        as input. If False, sparse feature matrices are converted to dense
+        arrays by the method prepare_features before prediction.
+    preprocessing_key : str, default=None
+        Content-addressed key of the preprocessing stage (see pipelines.py).
+        Predictors with the same key share the features computed by the
+        method preprocess. If you set it, implement the methods preprocess
+        and predict_features, too.
+
     Notes
     -----
     You must register a Predictor model instance from the Django Admin
@@ -27,6 +51,69 @@ class AbstractPredictor(metaclass=abc.ABCMeta):
     for the system to use it to make predictions.
     """
 
+    accepts_sparse = False
+    preprocessing_key = None
+
+    def prepare_features(self, features):
+        """
+        This method adapts a feature matrix to the input format the
+        prediction model accepts.
+
+        Parameters
+        ----------
+        features : scipy.sparse matrix or np.array
+            Feature matrix to feed the prediction model.
+
+        Returns
+        -------
+        scipy.sparse matrix or np.array
+            If features is sparse and accepts_sparse is False, it returns
+            features as a dense np.array, otherwise it returns features
+            unmodified.
+        """
+
+        if not self.accepts_sparse and scipy.sparse.issparse(features):
+            return features.toarray()
+        return features
+
+    def preprocess(self, tweets):
+        """
+        This method runs the preprocessing stage identified by
+        preprocessing_key.
+
+        Parameters
+        ----------
+        tweets : list of triples
+            Collection of triples containing tweet information in the following
+            order: tweet id, tweet date, tweet text.
+
+        Returns
+        -------
+        object
+            Preprocessed data to pass to the method predict_features.
+        """
+
+        raise NotImplementedError
+
+    def predict_features(self, preprocessed_data):
+        """
+        This method makes predictions from the output of the method
+        preprocess, which may have been run by another predictor with the
+        same preprocessing_key.
+
+        Parameters
+        ----------
+        preprocessed_data : object
+            Output of the method preprocess.
+
+        Returns
+        -------
+        list of quadruples
+            Same as the method predict.
+        """
+
+        raise NotImplementedError
+
     @abc.abstractmethod
     def predict(self, tweets):
         """
@@ -41,10 +128,11 @@ class AbstractPredictor(metaclass=abc.ABCMeta):
 
         Returns
         -------
-        list of triples
-            Collection of triples containing tweet and prediction information
-            in the following order: tweet id, tweet date,
-            tweet predicted label (instance of PredictionLabel).
+        list of quadruples
+            Collection of quadruples containing tweet and prediction
+            information in the following order: tweet id, tweet date,
+            tweet predicted label (instance of PredictionLabel), probability
+            of the predicted label (None if the model does not estimate it).
 
         Notes
         -----
@@ -73,12 +161,22 @@ class LogisticRegression(AbstractPredictor):
         instance.
     preprocessor : LogisticRegressionPreprocessor
         Responsible for preprocessing the tweets collected before passing them
-        into the prediction model.
+        into the prediction model. It is shared with the predictors with the
+        same preprocessing_key.
+    preprocessing_key : str
+        Content-addressed key of preprocessor (see pipelines.py).
     prediction_model : object
-        Unpickled, trained Logistic Regression model responsible for making
-        predictions.
+        Unpickled, trained Logistic Regression model.
+    checksums : tuple of str
+        Checksums of the TF-IDF vectorizer and prediction_model files, which
+        are part of the keys of prediction_cache.
+    scorer : LinearScorer
+        Responsible for making predictions with the coefficients of
+        prediction_model.
     """
 
+    accepts_sparse = True
+
     def __init__(self, predictor):
         """
         This method initializes the attributes predictor, label and
@@ -95,17 +193,28 @@ class LogisticRegression(AbstractPredictor):
         self.predictor = predictor
         labels = PredictionLabel.objects.filter(predictor=self.predictor)
         self.labels = {label.integer_label: label for label in labels}
-        self.preprocessor = LogisticRegressionPreprocessor()
+        self.preprocessing_key = LogisticRegressionPreprocessor.key_for(
+            self.predictor
+        )
+        self.preprocessor = get_shared_preprocessor(
+            self.preprocessing_key,
+            lambda: LogisticRegressionPreprocessor(self.predictor)
+        )
         self.load_model()
 
     def load_model(self):
         """
-        This method loads the pickled, trained predictive model.
+        This method loads the pickled, trained predictive model from the
+        predictor artifacts (see artifacts.py), sets up the scorer and records
+        the checksums of the model files.
         """
 
-        module_dir = os.path.dirname(__file__)
-        file_path = os.path.join(module_dir, 'models', 'example', 'logit.model') # noqa
-        self.prediction_model = joblib.load(file_path)
+        self.prediction_model = artifact_store.load(self.predictor, 'logit')
+        self.checksums = (
+            artifact_store.checksum(self.predictor, 'tfidf'),
+            artifact_store.checksum(self.predictor, 'logit')
+        )
+        self.scorer = LinearScorer(self.prediction_model)
 
     def predict(self, tweets):
         """
@@ -120,18 +229,94 @@ class LogisticRegression(AbstractPredictor):
 
         Returns
         -------
-        list of triples
-            Collection of triples containing tweet and prediction information
-            in the following order: tweet id, tweet date,
-            tweet predicted label (instance of PredictionLabel).
+        list of quadruples
+            Collection of quadruples containing tweet and prediction
+            information in the following order: tweet id, tweet date,
+            tweet predicted label (instance of PredictionLabel), probability
+            of the predicted label (None if the model does not estimate it).
+
+        Notes
+        -----
+        Only the tweets whose normalized text is not found in
+        prediction_cache go through the preprocessor and the scorer. Their
+        labels and probabilities are stored in prediction_cache afterwards.
+        """
+
+        tokenizer = type(self.preprocessor.tokenizer).__name__
+        keys = [
+            prediction_cache.key(
+                self.predictor, tokenizer, self.checksums,
+                self.preprocessor.normalize(text)
+            )
+            for _, _, text in tweets
+        ]
+        results = prediction_cache.get_many(keys, default=_MISSING)
+        missing = [
+            i for i, result in enumerate(results) if result is _MISSING
+        ]
+
+        prediction = self.predict_features(
+            self.preprocess([tweets[i] for i in missing])
+        )
+        predicted = {
+            id: (label.integer_label, confidence)
+            for id, _, label, confidence in prediction
+        }
+
+        for i in missing:
+            results[i] = predicted.get(tweets[i][0])
+        prediction_cache.set_many((keys[i], results[i]) for i in missing)
+
+        return [
+            (id, date, self.labels[result[0]], result[1])
+            for (id, date, _), result in zip(tweets, results)
+            if result is not None
+        ]
+
+    def preprocess(self, tweets):
+        """
+        This method preprocesses tweets with preprocessor.
+
+        Parameters
+        ----------
+        tweets : list of triples
+            Collection of triples containing tweet information in the following
+            order: tweet id, tweet date, tweet text.
+
+        Returns
+        -------
+        None or triple
+            Same as LogisticRegressionPreprocessor.preprocess.
+        """
+
+        return self.preprocessor.preprocess(tweets)
+
+    def predict_features(self, preprocessed_data):
+        """
+        This method predicts the labels of preprocessed tweets with scorer.
+
+        Parameters
+        ----------
+        preprocessed_data : None or triple
+            Output of the method preprocess.
+
+        Returns
+        -------
+        list of quadruples
+            Collection of quadruples containing tweet and prediction
+            information in the following order: tweet id, tweet date,
+            tweet predicted label (instance of PredictionLabel), probability
+            of the predicted label.
         """
 
-        preprocessed_data = self.preprocessor.preprocess(tweets)
-        result = []
-        if preprocessed_data is not None:
-            ids, dates, features = preprocessed_data
-            prediction = self.prediction_model.predict(features)
+        if preprocessed_data is None:
+            return []
 
-            for i in range(ids.shape[0]):
-                result.append((ids[i], dates[i], self.labels[prediction[i]]))
-        return result
+        ids, dates, features = preprocessed_data
+        features = self.prepare_features(features)
+        labels, probabilities = self.scorer.predict(features)
+        return [
+            (id, date, self.labels[label], probability)
+            for id, date, label, probability
+            in zip(ids, dates, labels.tolist(), probabilities.tolist())
+        ]
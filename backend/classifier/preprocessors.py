@@ -8,15 +8,27 @@ You are not required to create preprocessors at all, it depends a lot on your
 prediction logic. However, if you need to perform several data preparation
 steps/tasks before making actual predictions, you are encouraged to encapsulate
 those routines in a class in here.
+
+Large collections of tweets are preprocessed in chunks by a pool of worker
+processes. Each worker process keeps its own LogisticRegressionPreprocessor
+instance, so the TF-IDF vectorizer is loaded once per worker. The pool is
+billiard's (the multiprocessing fork Celery uses), because the processes of
+a Celery prefork pool are daemons, which the standard library does not let
+have children.
 """
-import os
 import re
 import string
+import weakref
 
-import joblib
-import nltk
+import billiard
 import numpy as np
 import pandas as pd
+import scipy.sparse
+from django.conf import settings
+
+from .artifacts import artifact_store
+from .pipelines import preprocessing_key
+from .utils import get_tokenizer
 
 
 class LogisticRegressionPreprocessor:
@@ -26,37 +38,94 @@ class LogisticRegressionPreprocessor:
 
     Attributes
     ----------
+    predictor : Predictor
+        Predictor whose artifacts contain the TF-IDF vectorizer.
     regex_1 : SRE_Pattern
         Regular expression pattern to match top-level domains.
     regex_2 : SRE_Pattern
         Regular expression pattern to match protocol and domain names in URLs.
+    cleaning_regex : SRE_Pattern
+        Combination of regex_1 and regex_2 to remove hashtags, mentions and
+        links in a single sweep.
+    alpha_regex : SRE_Pattern
+        Regular expression pattern to match runs of letters. It is used to
+        discard short lines before tokenizing.
+    contractions_regex : SRE_Pattern
+        Regular expression pattern to match the contractions the word
+        tokenizer splits into two words.
     trans_table : dict
         Mapping table to remove punctuations.
+    accents_table : dict
+        Mapping table to remove accents.
     processor_model : object
         Unpickled, trained TF-IDF vectorizer.
+    tokenizer : AbstractTokenizer
+        Responsible for splitting tweet texts into words. It is chosen with
+        the setting TOKENIZER.
+    pool : billiard.Pool or None
+        Pool of worker processes to preprocess large collections of tweets.
+        It is created the first time it is needed, and terminated once this
+        instance is garbage collected, e.g. when the predictors sharing it
+        are discarded from the registry (see caches.py).
     """
 
     regex_1 = re.compile(r'\S+(\.)(com|net|ly|co|us|ec|gob)(\S?)+')
     regex_2 = re.compile(r'(http|facebook|twitter|bit|soundcloud|www|pic|#|@)\S+') # noqa
+    cleaning_regex = re.compile(f'{regex_1.pattern}|{regex_2.pattern}')
+    alpha_regex = re.compile(r'[^\W\d_]+')
+    contractions_regex = re.compile(
+        r"cannot|d'ye|gimme|gonna|gotta|lemme|more'n|wanna|'tis|'twas"
+    )
     trans_table = str.maketrans('', '', string.punctuation)
+    accents_table = str.maketrans('áéíóúü', 'aeiouu')
 
-    def __init__(self):
+    def __init__(self, predictor):
         """
         This method loads the processor_model file by calling the method
-        load_model and downloads the required NLTK module 'punkt'.
+        load_model and sets up the tokenizer.
+
+        Parameters
+        ----------
+        predictor : Predictor
+            Django representation of the predictive model this preprocessor
+            prepares the tweets for.
         """
 
-        nltk.download('punkt')
+        self.predictor = predictor
+        self.tokenizer = get_tokenizer(settings.TOKENIZER)
+        self.pool = None
         self.load_model()
 
+    @classmethod
+    def key_for(cls, predictor):
+        """
+        This method builds the content-addressed key of the preprocessing
+        stage for a predictor. It depends on the class, the setting TOKENIZER
+        and the content of the TF-IDF vectorizer file.
+
+        Parameters
+        ----------
+        predictor : Predictor
+            Predictor whose artifacts contain the TF-IDF vectorizer.
+
+        Returns
+        -------
+        str
+            Key of the preprocessing stage (see pipelines.py).
+        """
+
+        return preprocessing_key(
+            cls.__name__, settings.TOKENIZER,
+            artifact_store.checksum(predictor, 'tfidf')
+        )
+
     def load_model(self):
         """
-        This method loads the pickled, trained TF-IDF vectorizer.
+        This method loads the pickled, trained TF-IDF vectorizer from the
+        predictor artifacts (see artifacts.py).
         """
 
-        module_dir = os.path.dirname(__file__)
-        file_path = os.path.join(module_dir, 'models', 'example', 'tfidf.model') # noqa
-        self.processor_model = joblib.load(file_path)
+        self.processor_model = artifact_store.load(self.predictor, 'tfidf')
 
     def normalize_case(self, data):
         """
@@ -173,7 +242,8 @@ class LogisticRegressionPreprocessor:
 
     def tokenize(self, data):
         """
-        This method splits data into words using a word tokenizer from NLTK.
+        This method splits data into words using the tokenizer chosen with
+        the setting TOKENIZER.
 
         Parameters
         ----------
@@ -186,7 +256,7 @@ class LogisticRegressionPreprocessor:
             Tweet text split into words, collection of words.
         """
 
-        return nltk.word_tokenize(data, language='spanish')
+        return self.tokenizer.tokenize(data)
 
     def undo_tokenization(self, data):
         """
@@ -208,10 +278,103 @@ class LogisticRegressionPreprocessor:
             return np.nan
         return ' '.join(data)
 
-    def preprocess(self, tweets):
+    def may_be_long_line(self, data, short_line_words=3):
+        """
+        This method cheaply tells whether data may still be a not short line
+        after tokenizing and removing punctuations and numerics.
+
+        Every word kept by the cleaning steps lies within a run of letters,
+        and the word tokenizer only splits a run of letters when it finds a
+        contraction. Thus, counting runs of letters gives an upper bound of
+        the number of words that will be kept.
+
+        Parameters
+        ----------
+        data : str
+            Lower-case tweet text without hashtags, mentions, links and
+            accents.
+        short_line_words : int, default=3
+            Number of words until which data is considered a short line.
+
+        Returns
+        -------
+        bool
+            False if data is known to be a short line, otherwise True.
+        """
+
+        if LogisticRegressionPreprocessor.contractions_regex.search(data):
+            return True
+        runs = LogisticRegressionPreprocessor.alpha_regex.findall(data)
+        return len(runs) > short_line_words
+
+    def normalize(self, data):
+        """
+        This method performs the cleaning steps that come before tokenizing:
+        it normalizes the text case and removes hashtags, mentions, links and
+        accents.
+
+        Two texts with the same normalized text are cleaned into the same
+        words, so the normalized text may be used to identify the result of
+        the whole preprocessing.
+
+        Parameters
+        ----------
+        data : str
+            Tweet text to normalize.
+
+        Returns
+        -------
+        str
+            Lower-case tweet text without hashtags, mentions, links and
+            accents.
+        """
+
+        return LogisticRegressionPreprocessor.cleaning_regex.sub(
+            '', data.lower()
+        ).translate(LogisticRegressionPreprocessor.accents_table)
+
+    def clean(self, data, short_line_words=3):
+        """
+        This method performs all the text cleaning steps in a single pass
+        over data.
+
+        It is equivalent to calling, in order, normalize_case,
+        remove_hastags_mentions_links, remove_accents, tokenize,
+        remove_punctuations, remove_numerics, remove_short_lines and
+        undo_tokenization, but it avoids creating intermediate objects and
+        skips tokenizing the lines that are known to be short beforehand.
+
+        Parameters
+        ----------
+        data : str
+            Tweet text to clean.
+        short_line_words : int, default=3
+            Number of words until which data is considered a short line.
+
+        Returns
+        -------
+        str or None
+            If data is a short line, it returns None, otherwise it returns the
+            cleaned words joined into a single string.
+        """
+
+        data = self.normalize(data)
+        if not self.may_be_long_line(data, short_line_words):
+            return None
+
+        trans_table = LogisticRegressionPreprocessor.trans_table
+        words = [
+            word for word in (
+                token.translate(trans_table) for token in self.tokenize(data)
+            ) if word.isalpha()
+        ]
+        if len(words) > short_line_words:
+            return ' '.join(words)
+
+    def preprocess_chunk(self, tweets):
         """
         This method orchestrates all of the tasks needed to successfully
-        prepare tweets for prediction.
+        prepare tweets for prediction in the current process.
 
         Parameters
         ----------
@@ -221,24 +384,134 @@ class LogisticRegressionPreprocessor:
 
         Returns
         -------
-        None or triple of np.array
-            If after preprocessing no tweets remain (which can happen when all
-            the tweets are considered short lines), it returns None, otherwise
-            it returns a triple of np.array in the following order:
-            tweet identifiers, tweet dates, feature matrix to feed predictor.
+        None or triple
+            Same as the method preprocess.
         """
 
         data = pd.DataFrame(data=tweets, columns=['id', 'date', 'tweet'])
-        data.tweet = data.tweet.apply(self.normalize_case)
-        data.tweet = data.tweet.apply(self.remove_hastags_mentions_links)
-        data.tweet = data.tweet.apply(self.remove_accents)
-        data.tweet = data.tweet.apply(self.tokenize)
-        data.tweet = data.tweet.apply(self.remove_punctuations)
-        data.tweet = data.tweet.apply(self.remove_numerics)
-        data.tweet = data.tweet.apply(self.remove_short_lines)
-        data.tweet = data.tweet.apply(self.undo_tokenization)
+        data.tweet = [self.clean(tweet) for tweet in data.tweet.values]
         data = data[~data.tweet.isna()]
 
         if data.shape[0] != 0:
-            features = self.processor_model.transform(data.tweet.values).todense() # noqa
+            features = self.processor_model.transform(data.tweet.values)
             return data.id.values, data.date.values, features
+
+    def preprocess(self, tweets):
+        """
+        This method orchestrates all of the tasks needed to successfully
+        prepare tweets for prediction.
+
+        If there are at least PREPROCESSING_PARALLEL_THRESHOLD tweets, they
+        are split into chunks of PREPROCESSING_CHUNK_SIZE tweets which are
+        preprocessed by PREPROCESSING_WORKERS worker processes. Otherwise,
+        they are preprocessed in the current process.
+
+        Parameters
+        ----------
+        tweets : list of triples
+            Collection of triples containing tweet information in the following
+            order: tweet id, tweet date, tweet text.
+
+        Returns
+        -------
+        None or triple
+            If after preprocessing no tweets remain (which can happen when all
+            the tweets are considered short lines), it returns None, otherwise
+            it returns a triple in the following order: np.array of tweet
+            identifiers, np.array of tweet dates and scipy.sparse.csr_matrix
+            of features to feed predictor.
+        """
+
+        if (
+            settings.PREPROCESSING_WORKERS < 2
+            or len(tweets) < settings.PREPROCESSING_PARALLEL_THRESHOLD
+        ):
+            return self.preprocess_chunk(tweets)
+
+        if self.pool is None:
+            self.pool = billiard.Pool(
+                processes=settings.PREPROCESSING_WORKERS,
+                initializer=_init_worker, initargs=(self.predictor,)
+            )
+            weakref.finalize(self, _shutdown_pool, self.pool)
+        # Chunks are submitted one by one rather than with Pool.map, because
+        # billiard credits every result of a map to a single worker, and the
+        # other workers then wait 30 seconds for their results to be
+        # acknowledged before exiting.
+        chunk_size = settings.PREPROCESSING_CHUNK_SIZE
+        pending = [
+            self.pool.apply_async(
+                _preprocess_chunk, (tweets[i:i + chunk_size],)
+            )
+            for i in range(0, len(tweets), chunk_size)
+        ]
+        results = [
+            result for result in (chunk.get() for chunk in pending)
+            if result is not None
+        ]
+
+        if results:
+            ids, dates, features = zip(*results)
+            return (
+                np.concatenate(ids),
+                np.concatenate(dates),
+                scipy.sparse.vstack(features, format='csr')
+            )
+
+
+# LogisticRegressionPreprocessor instance of the current worker process.
+_worker_preprocessor = None
+
+
+def _init_worker(predictor):
+    """
+    This function creates the LogisticRegressionPreprocessor instance of a
+    worker process when the process starts.
+
+    Parameters
+    ----------
+    predictor : Predictor
+        Same as in LogisticRegressionPreprocessor.__init__.
+    """
+
+    global _worker_preprocessor
+    _worker_preprocessor = LogisticRegressionPreprocessor(predictor)
+
+
+def _preprocess_chunk(tweets):
+    """
+    This function preprocesses a chunk of tweets in a worker process.
+
+    Parameters
+    ----------
+    tweets : list of triples
+        Collection of triples containing tweet information in the following
+        order: tweet id, tweet date, tweet text.
+
+    Returns
+    -------
+    None or triple
+        Same as LogisticRegressionPreprocessor.preprocess_chunk.
+    """
+
+    return _worker_preprocessor.preprocess_chunk(tweets)
+
+
+def _shutdown_pool(pool):
+    """
+    This function stops the worker processes of a preprocessor's pool once
+    the preprocessor is discarded.
+
+    Parameters
+    ----------
+    pool : billiard.Pool
+        The pool of the discarded preprocessor.
+
+    Notes
+    -----
+    The workers are idle by then, so they are asked to exit and waited for
+    instead of being terminated, which lets them exit cleanly.
+    """
+
+    pool.close()
+    pool.join()
@@ -0,0 +1,206 @@
+"""
+This module contains the business logic to share the rate limits of the
+Twitter API among every worker.
+
+The classes available are:
+    * QuotaScheduler - It hands out the calls left in the current rate limit
+    window of an endpoint.
+    * QuotaExceeded - It is raised when no calls are left in the current
+    window.
+
+Notes
+-----
+The calls left are kept in the database (see the model APIQuota), whose row
+is locked while it is read and updated, so two workers never spend the same
+call. A collection which cannot get a call is deferred until the window ends
+(see the task collect_tweets in tasks.py) instead of sleeping in the worker.
+"""
+import collections
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import APIQuota
+
+
+QuotaStatus = collections.namedtuple(
+    'QuotaStatus', ['limit', 'remaining', 'reset', 'waiting']
+)
+
+
+class QuotaExceeded(Exception):
+    """
+    Exception raised when no calls are left in the current rate limit window.
+
+    Attributes
+    ----------
+    eta : datetime
+        Date when the window ends and the calls are replenished.
+    """
+
+    def __init__(self, eta):
+        super().__init__(f'The API quota is exhausted until {eta}.')
+        self.eta = eta
+
+
+class QuotaScheduler:
+    """
+    This class hands out the calls left in the current rate limit window of
+    an endpoint, like a token bucket refilled at the end of each window.
+
+    Attributes
+    ----------
+    name : str
+        Name of the rate limited endpoint. It identifies its APIQuota row.
+    limit : int
+        Number of calls allowed per window.
+    window : timedelta
+        Duration of a window.
+    clock : callable
+        Function returning the current date. It can be replaced in tests.
+    """
+
+    def __init__(self, name, limit, window, clock=timezone.now):
+        """
+        This method sets the attributes. It does not touch the database.
+
+        Parameters
+        ----------
+        name : str
+            Name of the rate limited endpoint.
+        limit : int
+            Number of calls allowed per window.
+        window : int
+            Duration of a window in seconds.
+        clock : callable, default=timezone.now
+            Function returning the current date.
+        """
+
+        self.name = name
+        self.limit = limit
+        self.window = timedelta(seconds=window)
+        self.clock = clock
+
+    def get_quota(self, now):
+        """
+        This method locks the APIQuota row and starts a new window if the
+        current one has ended. It must be called inside a transaction.
+        """
+
+        quota, _ = APIQuota.objects.select_for_update().get_or_create(
+            name=self.name,
+            defaults={'remaining': self.limit, 'reset': now + self.window}
+        )
+        if quota.reset is None or quota.reset <= now:
+            quota.remaining = self.limit
+            quota.reset = now + self.window
+        return quota
+
+    def acquire(self, calls=1):
+        """
+        This method spends calls from the current window.
+
+        Parameters
+        ----------
+        calls : int, default=1
+            Number of calls to spend.
+
+        Returns
+        -------
+        int
+            Number of calls left in the window.
+
+        Raises
+        ------
+        QuotaExceeded
+            If fewer than calls are left in the window. Nothing is spent.
+        """
+
+        with transaction.atomic():
+            quota = self.get_quota(self.clock())
+            if quota.remaining < calls:
+                raise QuotaExceeded(quota.reset)
+            quota.remaining -= calls
+            quota.save(update_fields=['remaining', 'reset'])
+        return quota.remaining
+
+    def update(self, remaining, reset=None):
+        """
+        This method corrects the calls left with the rate limit the API
+        reported, e.g. in the x-rate-limit-remaining and x-rate-limit-reset
+        headers, which also counts the calls made by other clients.
+
+        Parameters
+        ----------
+        remaining : int
+            Number of calls left according to the API.
+        reset : datetime, default=None
+            Date when the window ends according to the API. If it is None,
+            the end of the current window is kept.
+
+        Returns
+        -------
+        datetime
+            Date when the window ends.
+        """
+
+        with transaction.atomic():
+            quota = self.get_quota(self.clock())
+            if reset is not None and reset > quota.reset:
+                # The API already started a new window.
+                quota.remaining = remaining
+            else:
+                # Calls spent by requests still in flight may be missing.
+                quota.remaining = min(quota.remaining, remaining)
+            if reset is not None:
+                quota.reset = reset
+            quota.save(update_fields=['remaining', 'reset'])
+        return quota.reset
+
+    def defer(self):
+        """
+        This method counts a collection deferred until the window ends.
+        """
+
+        APIQuota.objects.filter(name=self.name).update(
+            waiting=F('waiting') + 1
+        )
+
+    def resume(self):
+        """
+        This method stops counting a deferred collection once it resumes.
+        """
+
+        APIQuota.objects.filter(name=self.name, waiting__gt=0).update(
+            waiting=F('waiting') - 1
+        )
+
+    def status(self):
+        """
+        This method reports the calls left and the collections waiting for
+        the window to end, without locking anything.
+
+        Returns
+        -------
+        QuotaStatus
+            Named tuple containing the calls allowed per window, the calls
+            left, the date when the window ends (None if no window was
+            started) and the number of collections deferred.
+        """
+
+        quota = APIQuota.objects.filter(name=self.name).first()
+        if quota is None:
+            return QuotaStatus(self.limit, self.limit, None, 0)
+        if quota.reset is None or quota.reset <= self.clock():
+            return QuotaStatus(self.limit, self.limit, None, quota.waiting)
+        return QuotaStatus(
+            self.limit, quota.remaining, quota.reset, quota.waiting
+        )
+
+
+twitter_quota = QuotaScheduler(
+    'search', settings.TWITTER_SEARCH_QUOTA, settings.TWITTER_QUOTA_WINDOW
+)
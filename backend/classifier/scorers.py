@@ -0,0 +1,132 @@
+"""
+This module contains the classes that score feature matrices with trained
+linear models without going through their predict methods.
+
+The scorers available are:
+    * LinearScorer - It predicts the labels of a linear model (e.g. sklearn's
+    LogisticRegression) and their probabilities with NumPy arrays.
+"""
+import numpy as np
+
+
+class LinearScorer:
+    """
+    This class computes the decision function of a trained linear classifier
+    as a single sparse matrix product, and derives the predicted labels and
+    their probabilities from it, skipping the input validation of the model
+    methods.
+
+    Attributes
+    ----------
+    model : object
+        Trained linear classifier with the attributes classes_, coef_ and
+        intercept_, as sklearn's LogisticRegression.
+    classes : np.array
+        Labels the model may predict.
+    weights : np.array
+        Transposed model coefficients as a C-contiguous matrix with one row
+        per feature.
+    intercept : np.array
+        Model intercepts.
+    multinomial : bool
+        If True, probabilities are the softmax of the scores, otherwise each
+        score goes through the logistic function (one-vs-rest).
+
+    Notes
+    -----
+    The coefficients keep the dtype of the model (float64 for sklearn), like
+    the TF-IDF features. Then, the scores are the same as the ones of
+    model.decision_function, so are the predicted labels. Casting them to
+    float32 does not save time, since the product with float64 features
+    casts them back on every call.
+    """
+
+    def __init__(self, model):
+        """
+        This method extracts the coefficients and intercepts of model.
+
+        Parameters
+        ----------
+        model : object
+            Trained linear classifier, as sklearn's LogisticRegression.
+        """
+
+        self.model = model
+        self.classes = np.asarray(model.classes_)
+        self.weights = np.ascontiguousarray(model.coef_.T)
+        self.intercept = np.asarray(model.intercept_)
+
+        multi_class = getattr(model, 'multi_class', 'ovr')
+        if multi_class == 'auto':
+            multi_class = 'ovr' if (
+                model.solver == 'liblinear' or len(self.classes) <= 2
+            ) else 'multinomial'
+        self.multinomial = multi_class == 'multinomial'
+
+    def decision_function(self, features):
+        """
+        This method computes the score of each class for each row of features.
+
+        Parameters
+        ----------
+        features : scipy.sparse.csr_matrix or np.array
+            Feature matrix with one row per sample.
+
+        Returns
+        -------
+        np.array
+            Scores with one row per sample and one column per class, or a
+            single column for binary models.
+        """
+
+        return np.asarray(features @ self.weights) + self.intercept
+
+    def predict(self, features):
+        """
+        This method predicts the label of each row of features and its
+        probability.
+
+        Parameters
+        ----------
+        features : scipy.sparse.csr_matrix or np.array
+            Feature matrix with one row per sample.
+
+        Returns
+        -------
+        pair of np.array
+            Predicted labels (from classes) and the probability of each of
+            them.
+        """
+
+        # Scores are transposed (one row per class) because NumPy reduces
+        # a few long rows much faster than many short ones.
+        scores = np.ascontiguousarray(self.decision_function(features).T)
+        if scores.shape[0] == 1:
+            scores = scores[0]
+            indices = (scores > 0).astype(int)
+            # The binary multinomial case is the softmax of [-score, score].
+            positive = _logistic(2 * scores if self.multinomial else scores)
+            probabilities = np.where(indices == 1, positive, 1 - positive)
+            return self.classes[indices], probabilities
+
+        # Same as scores.argmax(axis=0), first class wins ties.
+        top_scores = scores.max(axis=0)
+        indices = np.empty(scores.shape[1], dtype=int)
+        for i in range(scores.shape[0] - 1, -1, -1):
+            indices[scores[i] == top_scores] = i
+        if self.multinomial:
+            probabilities = 1 / np.exp(scores - top_scores).sum(axis=0)
+        else:
+            class_probabilities = _logistic(scores)
+            probabilities = (
+                _logistic(top_scores) / class_probabilities.sum(axis=0)
+            )
+        return self.classes[indices], probabilities
+
+
+def _logistic(x):
+    """
+    This function computes the logistic function element-wise.
+    """
+
+    return 1 / (1 + np.exp(-x))
@@ -3,26 +3,113 @@ This module contains Celery tasks to run heavy routines asynchronously.
 
 Task list:
     * collect_tweets - It collects tweets asynchronously.
-    * classify_tweets - It classifies tweets asynchronously.
+    * classify_tweets - It queues tweets to be classified asynchronously.
+    * run_inference_batch - It classifies the tweets queued by several
+    searches at once.
     * notify_searchers - It notifies registered users after classification
-    completes.
+    completes or fails, along with the ones of other searches done
+    meanwhile.
+
+Function list:
+    * send_to_classify - It counts tweets as collected and stages them to be
+    classified.
+    * store_predictions - It stores the predictions made for the tweets of a
+    search.
+    * fail_requests - It marks the searches of inference requests as failed,
+    notifies their searchers and deletes the requests.
+    * complete_search - It marks a search as done and notifies its searchers
+    once its tweets are all collected and classified.
+    * schedule_notification - It schedules notify_searchers for a search
+    done or failed.
+
+Signal handler list:
+    * warm_up_worker - It builds the predictive models before the worker
+    takes tasks.
 """
+import logging
+
 from celery import shared_task
+from celery.signals import celeryd_after_setup
+from django.conf import settings
+from django.db import connections
+from django.db import transaction
+from django.db.models import F
+from django.db.models import Sum
+from django.utils import timezone
 
-from .collectors import OfficialAPICollector
+from .coalescing import sync_followers
+from .collectors import COLLECTION_ERRORS
+from .incremental import IncrementalCollection
+from .incremental import update_index
+from .models import InferenceRequest
+from .models import Prediction
+from .models import Predictor
 from .models import Search
-from .models import Searcher
 from .models import Tweet
+from .notifications import send_notifications
+from .quotas import QuotaExceeded
+from .utils import get_collector
 from .utils import get_predictor
+from .utils import warm_up_predictors
 
 
-api_collector = OfficialAPICollector()
+api_collector = get_collector(settings.COLLECTOR)
 
+logger = logging.getLogger(__name__)
 
-@shared_task
-def collect_tweets(search_id, search_term, number_of_tweets):
+
+@celeryd_after_setup.connect
+def warm_up_worker(instance, **kwargs):
+    """
+    Celery signal handler to build the predictive models chosen with the
+    setting PREDICTOR_WARM_UP when the worker starts. Workers which do not
+    consume the queue of run_inference_batch, e.g. the collection workers,
+    are skipped.
+
+    Notes
+    -----
+    It runs in the main worker process once logging is set up and before the
+    pool processes are forked, so they inherit the predictive models already
+    built (and the pages of the memory-mapped artifacts) instead of building
+    them on their first task. The database connections used are closed
+    before forking.
+    """
+
+    queue = settings.CELERY_TASK_ROUTES[run_inference_batch.name]['queue']
+    if queue not in instance.app.amqp.queues.consume_from:
+        return
+    warm_up_predictors(settings.PREDICTOR_WARM_UP)
+    connections.close_all()
+
+
+@shared_task(
+    bind=True, acks_late=True, reject_on_worker_lost=True,
+    autoretry_for=COLLECTION_ERRORS, retry_backoff=True,
+    max_retries=settings.COLLECTION_MAX_RETRIES
+)
+def collect_tweets(
+    self, search_id, search_term, number_of_tweets, deferred=False
+):
     """
-    Celery task to collect tweets asynchronously.
+    Celery task to collect tweets asynchronously. The tweets are sent to
+    classify_tweets page by page, in chunks of up to COLLECTION_CHUNK_SIZE
+    tweets, as they are collected, so the first results show up before the
+    collection completes. Only the tweets missing in the collection index of
+    the search term are fetched from the Twitter API (see incremental.py).
+
+    Each chunk is staged along with the cursor of the collection
+    (Search.max_id) in a single transaction, a checkpoint. The task is
+    acknowledged once it returns, so if the worker dies it is delivered
+    again and resumes from the last checkpoint, without fetching the pages
+    staged again.
+
+    When the rate limit of the Twitter API is exhausted, the collection is
+    deferred until the rate limit window ends, instead of holding the worker.
+    If the Twitter API cannot be reached (see COLLECTION_ERRORS in
+    collectors.py), the task is retried from the last checkpoint up to
+    COLLECTION_MAX_RETRIES times, with an exponential backoff. The search is
+    marked as failed, and its searchers notified, once it fails otherwise or
+    for the last time.
 
     Parameters
     ----------
@@ -32,63 +119,433 @@ def collect_tweets(search_id, search_term, number_of_tweets):
         The user input entered in the application search box.
     number_of_tweets : int
         The number of tweets to collect.
+    deferred : bool, default=False
+        Whether this collection was deferred.
     """
 
-    tweets = []
-    for tweet in api_collector.collect(search_term, number_of_tweets):
-        tweets.append((tweet.id_str, tweet.created_at, tweet.full_text))
-    if len(tweets) == 0:
-        search = Search.objects.get(pk=search_id)
-        search.empty = True
-        search.save()
-        notify_searchers.delay(search_id)
+    if deferred:
+        api_collector.quota.resume()
+    started = Search.objects.filter(
+        pk=search_id, state__in=[
+            Search.State.QUEUED, Search.State.COLLECTING, Search.State.FAILED
+        ]
+    ).update(state=Search.State.COLLECTING)
+    if not started:
+        # It was delivered again after the collection completed.
+        return
+    # The followers of a failed search wait for it again.
+    Search.objects.filter(
+        leader_id=search_id, state=Search.State.FAILED
+    ).update(state=Search.State.QUEUED)
+    search = Search.objects.get(pk=search_id)
+    if search.collected:
+        # The worker may have died before sending the last chunk staged.
+        for request_id in InferenceRequest.objects.filter(
+            search=search
+        ).values_list('id', flat=True):
+            classify_tweets.delay(request_id)
+
+    collected = search.collected
+    remaining = number_of_tweets - collected if number_of_tweets else 0
+    pages = IncrementalCollection(
+        api_collector, search, remaining, search.max_id
+    )
+    try:
+        for page in pages:
+            for i in range(0, len(page), settings.COLLECTION_CHUNK_SIZE):
+                chunk = [
+                    (tweet.id_str, tweet.created_at, tweet.full_text)
+                    for tweet in page[i:i + settings.COLLECTION_CHUNK_SIZE]
+                ]
+                send_to_classify(search, chunk, int(chunk[-1][0]) - 1)
+                collected += len(chunk)
+    except QuotaExceeded as error:
+        api_collector.quota.defer()
+        collect_tweets.apply_async(
+            (search_id, search_term, number_of_tweets), {'deferred': True},
+            eta=error.eta
+        )
+        logger.info('Collection of search %s deferred.', search_id)
+        return
+    except Exception as error:
+        if (
+            not isinstance(error, COLLECTION_ERRORS)
+            or self.request.retries >= self.max_retries
+        ):
+            Search.objects.filter(pk=search_id).update(
+                state=Search.State.FAILED
+            )
+            sync_followers([search_id])
+            schedule_notification(search_id)
+        raise
+
+    if collected == 0:
+        Search.objects.filter(pk=search_id).update(
+            state=Search.State.EMPTY, done_date=timezone.now()
+        )
+        sync_followers([search_id])
+        schedule_notification(search_id)
     else:
-        classify_tweets.delay(search_id, tweets)
+        # The search may have failed meanwhile (see fail_requests).
+        Search.objects.filter(
+            pk=search_id, state=Search.State.COLLECTING
+        ).update(state=Search.State.CLASSIFYING)
+        complete_search(search_id)
 
 
 @shared_task
-def classify_tweets(search_id, tweets):
+def classify_tweets(request_id):
     """
-    Celery task to classify tweets asynchronously. It is called after
-    collect_tweets finds tweets.
+    Celery task to queue tweets to be classified asynchronously. It is called
+    after collect_tweets stages a chunk of tweets as an InferenceRequest.
+
+    The tweets already classified by the search predictor, e.g. by an earlier
+    search of the same term, are removed from the request and linked to the
+    search without classifying them again. The rest are classified by
+    run_inference_batch along with the tweets queued by other searches. It is
+    scheduled right away if there are enough tweets queued to fill a batch,
+    otherwise after INFERENCE_BATCH_MAX_WAIT seconds.
 
     Parameters
     ----------
-    search_id : int
-        Primary key of the Search instance created for the user search.
+    request_id : int
+        Primary key of the InferenceRequest containing the tweets.
+    """
+
+    with transaction.atomic():
+        try:
+            request = InferenceRequest.objects.select_for_update().get(
+                pk=request_id
+            )
+        except InferenceRequest.DoesNotExist:
+            # A batch triggered by another search already classified it.
+            return
+        search = request.search
+        classified = set(Prediction.objects.filter(
+            predictor_id=search.predictor_id,
+            tweet_id__in=[id for id, _, _ in request.tweets]
+        ).values_list('tweet_id', flat=True))
+        if classified:
+            search.tweets.add(*classified)
+            unseen = [
+                tweet for tweet in request.tweets if tweet[0] not in classified
+            ]
+            # Counted by rows, like collected, since a chunk may repeat a
+            # tweet.
+            Search.objects.filter(pk=search.id).update(
+                classified=F('classified') + len(request.tweets) - len(unseen)
+            )
+            request.tweets = unseen
+            request.size = len(request.tweets)
+            if request.tweets:
+                request.save(update_fields=['tweets', 'size'])
+            else:
+                request.delete()
+    if not request.tweets:
+        complete_search(search.id)
+        return
+
+    queued = InferenceRequest.objects.filter(
+        predictor_id=search.predictor_id
+    ).aggregate(size=Sum('size'))['size'] or 0
+    if queued >= settings.INFERENCE_BATCH_SIZE:
+        run_inference_batch.delay(search.predictor_id)
+    else:
+        run_inference_batch.apply_async(
+            (search.predictor_id,),
+            countdown=settings.INFERENCE_BATCH_MAX_WAIT
+        )
+
+
+@shared_task(
+    bind=True, autoretry_for=(Exception,), retry_backoff=True,
+    max_retries=settings.INFERENCE_MAX_RETRIES
+)
+def run_inference_batch(self, predictor_id):
+    """
+    Celery task to classify, in a single call to the predictor, the oldest
+    tweets queued by classify_tweets for a predictor, up to
+    INFERENCE_BATCH_SIZE tweets. The predictions are then stored for each
+    search and their searchers notified.
+
+    Parameters
+    ----------
+    predictor_id : int
+        Primary key of the Predictor whose queued tweets are classified.
+
+    Returns
+    -------
+    dict or None
+        Batch metrics: number of tweets and searches, fill ratio (tweets
+        divided by INFERENCE_BATCH_SIZE) and maximum queueing delay in
+        seconds. None if there were no tweets queued.
+
+    Notes
+    -----
+    Queued requests are locked (skipping the ones locked by concurrent
+    batches) and deleted in the same transaction that stores their
+    predictions, so they are classified again if anything fails. The task is
+    retried up to INFERENCE_MAX_RETRIES times. If the last retry fails too,
+    the requests of the batch are failed (see fail_requests), so the next
+    batches of the predictor are not blocked by them.
+    """
+
+    batch_ids = []
+    try:
+        with transaction.atomic():
+            queued = InferenceRequest.objects.select_for_update(
+                skip_locked=True
+            ).filter(predictor_id=predictor_id).order_by('date', 'id')
+            batch_size = 0
+            for id, size in queued.values_list('id', 'size')[
+                :settings.INFERENCE_BATCH_SIZE
+            ]:
+                if (
+                    batch_ids
+                    and batch_size + size > settings.INFERENCE_BATCH_SIZE
+                ):
+                    break
+                batch_ids.append(id)
+                batch_size += size
+            if not batch_ids:
+                return None
+
+            requests = list(
+                InferenceRequest.objects.filter(pk__in=batch_ids)
+                .select_related('search__predictor').order_by('date', 'id')
+            )
+            start = timezone.now()
+            predictor = get_predictor(Predictor.objects.get(pk=predictor_id))
+            prediction = predictor.predict(
+                [tweet for request in requests for tweet in request.tweets]
+            )
+            results = {result[0]: result for result in prediction}
+
+            for request in requests:
+                store_predictions(request.search, [
+                    results[id] for id, _, _ in request.tweets
+                    if id in results
+                ])
+                Search.objects.filter(pk=request.search_id).update(
+                    classified=F('classified') + request.size
+                )
+            InferenceRequest.objects.filter(pk__in=batch_ids).delete()
+    except Exception:
+        if self.request.retries >= self.max_retries:
+            logger.exception(
+                'Inference batch of predictor %s failed, its searches are '
+                'marked as failed.', predictor_id
+            )
+            fail_requests(batch_ids)
+            if InferenceRequest.objects.filter(
+                predictor_id=predictor_id
+            ).exists():
+                run_inference_batch.delay(predictor_id)
+        raise
+
+    metrics = {
+        'tweets': batch_size,
+        'searches': len(requests),
+        'fill_ratio': batch_size / settings.INFERENCE_BATCH_SIZE,
+        'max_queueing_delay': (start - requests[0].date).total_seconds(),
+    }
+    logger.info(
+        'Inference batch of predictor %s: %d tweets from %d searches, fill '
+        'ratio %.3f, max queueing delay %.3f seconds.', predictor_id,
+        metrics['tweets'], metrics['searches'], metrics['fill_ratio'],
+        metrics['max_queueing_delay']
+    )
+    for request in requests:
+        complete_search(request.search_id)
+    if InferenceRequest.objects.filter(predictor_id=predictor_id).exists():
+        run_inference_batch.delay(predictor_id)
+    return metrics
+
+
+def store_predictions(search, prediction):
+    """
+    This function stores the predictions made for the tweets of a search. It
+    takes the same number of queries regardless of the number of tweets.
+
+    Parameters
+    ----------
+    search : Search
+        The search the tweets were collected for.
+    prediction : list of quadruples
+        Collection of quadruples containing tweet and prediction information
+        as returned by AbstractPredictor.predict.
+
+    Notes
+    -----
+    The rows are inserted in bulk ignoring the ones that already exist, since
+    searches classified in the same batch may share tweets. The existing
+    tweets and predictions that were soft deleted are restored, like
+    SafeDeleteModel.save does, but the label of a restored prediction is not
+    updated.
+    """
+
+    if not prediction:
+        return
+
+    ids = [id for id, _, _, _ in prediction]
+    with transaction.atomic():
+        Tweet.objects.bulk_create(
+            [Tweet(id=id, date=date) for id, date, _, _ in prediction],
+            ignore_conflicts=True
+        )
+        Tweet.all_objects.filter(id__in=ids, deleted__isnull=False).update(
+            deleted=None
+        )
+        Search.tweets.through.objects.bulk_create(
+            [
+                Search.tweets.through(search_id=search.id, tweet_id=id)
+                for id in ids
+            ],
+            ignore_conflicts=True
+        )
+        Prediction.objects.bulk_create(
+            [
+                Prediction(
+                    predictor_id=search.predictor_id, tweet_id=id,
+                    label=label, confidence=confidence
+                )
+                for id, _, label, confidence in prediction
+            ],
+            ignore_conflicts=True
+        )
+        Prediction.all_objects.filter(
+            predictor_id=search.predictor_id, tweet_id__in=ids,
+            deleted__isnull=False
+        ).update(deleted=None)
+
+
+def fail_requests(request_ids):
+    """
+    This function marks the searches of inference requests as failed, unless
+    they are already finished, notifies their searchers and deletes the
+    requests.
+
+    Parameters
+    ----------
+    request_ids : list of int
+        Primary keys of the InferenceRequest instances to fail.
+    """
+
+    with transaction.atomic():
+        requests = InferenceRequest.objects.filter(pk__in=request_ids)
+        search_ids = list(requests.values_list('search_id', flat=True))
+        failed = list(Search.objects.filter(pk__in=search_ids).exclude(
+            state__in=Search.FINISHED
+        ).values_list('id', flat=True))
+        Search.objects.filter(pk__in=failed).update(
+            state=Search.State.FAILED
+        )
+        sync_followers(search_ids)
+        requests.delete()
+    for search_id in failed:
+        schedule_notification(search_id)
+
+
+def send_to_classify(search, tweets, max_id):
+    """
+    This function counts tweets as collected for a search, stages them in an
+    InferenceRequest and sends its primary key to classify_tweets.
+
+    Parameters
+    ----------
+    search : Search
+        The search the tweets were collected for.
     tweets : list of triples
         Collection of triples containing tweet information in the following
         order: tweet id, tweet date, tweet text.
+    max_id : int
+        Tweet id to resume the collection from once tweets are staged. It is
+        stored as Search.max_id in the same transaction.
+
+    Notes
+    -----
+    Only the primary key goes through the broker, so the size of the
+    messages does not depend on the number or length of the tweets. The
+    request is deleted once its predictions are stored.
     """
 
-    search = Search.objects.get(pk=search_id)
-    predictor = get_predictor(predictor=search.predictor)
-    prediction = predictor.predict(tweets)
+    with transaction.atomic():
+        Search.objects.filter(pk=search.id).update(
+            collected=F('collected') + len(tweets), max_id=max_id
+        )
+        request = InferenceRequest.objects.create(
+            search=search, predictor_id=search.predictor_id, tweets=tweets,
+            size=len(tweets)
+        )
+    classify_tweets.delay(request.id)
+
+
+def complete_search(search_id):
+    """
+    This function marks a search as done, adds its tweets to the collection
+    index of its term and notifies its searchers if its tweets were all
+    collected and classified.
+
+    Parameters
+    ----------
+    search_id : int
+        Primary key of the Search instance created for the user search.
 
-    # TODO: Run these queries within a transaction
-    for id, date, label in prediction:
-        tweet = Tweet.objects.create(id=id, date=date)  # noqa. What if it already exists?
-        search.tweets.add(tweet)  # What if the relationship already exists?
-        tweet.predictors.add(
-            search.predictor, through_defaults={'label': label}
-        )  # What if the relationship already exists?
+    Notes
+    -----
+    The search is marked as done with a single conditional UPDATE, so only
+    one of the tasks that may complete it at the same time notifies the
+    searchers.
+    """
 
-    notify_searchers.delay(search_id)
+    completed = Search.objects.filter(
+        pk=search_id, state=Search.State.CLASSIFYING,
+        classified__gte=F('collected')
+    ).update(state=Search.State.DONE, done_date=timezone.now())
+    if completed:
+        sync_followers([search_id])
+        update_index(Search.objects.get(pk=search_id))
+        schedule_notification(search_id)
 
 
 @shared_task
 def notify_searchers(search_id):
     """
-    Celery task to notify registered users after classification completes. It
-    is called after classify_tweets ends successfully.
+    Celery task to notify registered users after classification completes or
+    fails. It is scheduled NOTIFICATION_WINDOW seconds after a search is done
+    or failed (see schedule_notification), so the searchers of every search
+    done in the meantime are notified at once (see notifications.py).
 
     Parameters
     ----------
     search_id : int
-        Primary key of the Search instance created for the user search.
+        Primary key of the Search instance created for the user search. The
+        searchers of its followers are notified too.
+
+    Returns
+    -------
+    int
+        Number of emails sent. It is 0 if an earlier task already notified
+        the searchers.
+    """
+
+    sent = send_notifications()
+    logger.info(
+        'Notifications of search %s: %d emails sent.', search_id, sent
+    )
+    return sent
+
+
+def schedule_notification(search_id):
     """
+    This function schedules notify_searchers for a search done or failed.
 
-    searchers = Searcher.objects.filter(search=search_id)
+    Parameters
+    ----------
+    search_id : int
+        Primary key of the Search instance done or failed.
+    """
 
-    for searcher in searchers:
-        pass  # Notify via email about clasification results
+    notify_searchers.apply_async(
+        (search_id,), countdown=settings.NOTIFICATION_WINDOW
+    )
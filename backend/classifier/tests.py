@@ -1,3 +1,1762 @@
-from django.test import TestCase # noqa
+import asyncio
+import collections
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from unittest import skipUnless
 
-# Create your tests here.
+import nltk
+import numpy as np
+import scipy.sparse
+from aiohttp import web
+from celery import Celery
+from celery.concurrency import get_implementation
+from celery.contrib.testing.worker import start_worker
+from celery.signals import celeryd_init
+from celery.signals import worker_init
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import get_connection
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.core.management import CommandError
+from django.db import connection
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.test import override_settings
+from django.test import SimpleTestCase
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from sklearn.linear_model import LogisticRegression as SklearnLogistic
+from tweepy.models import SearchResults
+
+from .artifacts import artifact_store
+from .artifacts import ArtifactStore
+from .benchmarks import make_corpus
+from .caches import prediction_cache
+from .caches import PredictionCache
+from .caches import predictor_registry
+from .collectors import AsyncAPICollector
+from .collectors import OfficialAPICollector
+from .incremental import IncrementalCollection
+from .models import App
+from .models import CollectionIndex
+from .models import InferenceRequest
+from .models import Prediction
+from .models import PredictionLabel
+from .models import Predictor
+from .models import Search
+from .models import Searcher
+from .models import Tweet
+from .pipelines import predict_many
+from .predictors import LogisticRegression
+from .preprocessors import LogisticRegressionPreprocessor
+from .quotas import QuotaExceeded
+from .quotas import QuotaScheduler
+from .scorers import LinearScorer
+from .tasks import classify_tweets
+from .tasks import collect_tweets
+from .tasks import complete_search
+from .tasks import fail_requests
+from .tasks import notify_searchers
+from .tasks import run_inference_batch
+from .tasks import store_predictions
+from .tokenizers import compare_tokenizers
+from .tokenizers import NLTKTokenizer
+from .tokenizers import RegexTokenizer
+from .utils import get_predictor
+from .utils import verify_manifest
+from .utils import warm_up_predictors
+from .utils import write_manifest
+from backend.celery import app
+from backend.celery import configure_worker
+
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), 'testdata')
+
+# The NLTK data is only available once fetched (see fetch_nltk_data), e.g.
+# in the Docker image.
+requires_nltk_data = skipUnless(
+    os.path.isdir(os.path.join(settings.NLTK_DATA_DIR, 'tokenizers', 'punkt')),
+    'NLTK data not found, run "python manage.py fetch_nltk_data".'
+)
+
+EXAMPLE_PREDICTOR = Predictor(
+    name='LogisticRegression', version='v1.0', artifacts_path='example'
+)
+
+
+def preprocess_in_worker(tweets):
+    preprocessor = LogisticRegressionPreprocessor(EXAMPLE_PREDICTOR)
+    ids, _, features = preprocessor.preprocess(tweets)
+    return list(ids), features.shape
+
+
+class LogisticRegressionPreprocessorTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.preprocessor = LogisticRegressionPreprocessor(EXAMPLE_PREDICTOR)
+        with open(os.path.join(TESTDATA_DIR, 'tweets.txt')) as tweets:
+            cls.corpus = make_corpus(5000) + tweets.read().splitlines()
+
+    def legacy_clean(self, data):
+        # Cleaning steps of the original pipeline, which tokenized with
+        # nltk.word_tokenize as the example model was trained.
+        preprocessor = self.preprocessor
+        data = preprocessor.normalize_case(data)
+        data = preprocessor.remove_hastags_mentions_links(data)
+        data = preprocessor.remove_accents(data)
+        data = nltk.word_tokenize(data, language='spanish')
+        data = preprocessor.remove_punctuations(data)
+        data = preprocessor.remove_numerics(data)
+        data = preprocessor.remove_short_lines(data)
+        data = preprocessor.undo_tokenization(data)
+        return data if isinstance(data, str) else None
+
+    @requires_nltk_data
+    @override_settings(TOKENIZER='NLTKTokenizer')
+    def test_clean_matches_original_pipeline(self):
+        preprocessor = LogisticRegressionPreprocessor(EXAMPLE_PREDICTOR)
+        for text in self.corpus:
+            expected = self.legacy_clean(text)
+            self.assertEqual(preprocessor.clean(text), expected, text)
+
+    @requires_nltk_data
+    @override_settings(TOKENIZER='NLTKTokenizer')
+    def test_preprocess_matches_original_pipeline(self):
+        preprocessor = LogisticRegressionPreprocessor(EXAMPLE_PREDICTOR)
+        tweets = [
+            (str(i), '2021-05-01T00:00:00', text)
+            for i, text in enumerate(self.corpus)
+        ]
+        ids, _, features = preprocessor.preprocess(tweets)
+        self.assertTrue(scipy.sparse.isspmatrix_csr(features))
+        expected = [
+            (str(i), self.legacy_clean(text))
+            for i, text in enumerate(self.corpus)
+        ]
+        expected = [(id, text) for id, text in expected if text is not None]
+        self.assertEqual(list(ids), [id for id, _ in expected])
+        expected_features = self.preprocessor.processor_model.transform(
+            [text for _, text in expected]
+        )
+        self.assertEqual(abs(features - expected_features).max(), 0)
+
+    @override_settings(
+        PREPROCESSING_WORKERS=2, PREPROCESSING_CHUNK_SIZE=300,
+        PREPROCESSING_PARALLEL_THRESHOLD=1000
+    )
+    def test_parallel_preprocess_matches_serial(self):
+        tweets = [
+            (str(i), '2021-05-01T00:00:00', text)
+            for i, text in enumerate(self.corpus)
+        ]
+        preprocessor = LogisticRegressionPreprocessor(EXAMPLE_PREDICTOR)
+        ids, dates, features = preprocessor.preprocess(tweets)
+        expected_ids, expected_dates, expected_features = (
+            self.preprocessor.preprocess_chunk(tweets)
+        )
+        self.assertTrue(scipy.sparse.isspmatrix_csr(features))
+        self.assertEqual(list(ids), list(expected_ids))
+        self.assertEqual(list(dates), list(expected_dates))
+        self.assertEqual(abs(features - expected_features).max(), 0)
+
+        # The pool is terminated along with the preprocessor.
+        workers = list(preprocessor.pool._pool)
+        del preprocessor
+        for worker in workers:
+            worker.join(5)
+            self.assertFalse(worker.is_alive())
+
+    @override_settings(
+        PREPROCESSING_WORKERS=2, PREPROCESSING_CHUNK_SIZE=300,
+        PREPROCESSING_PARALLEL_THRESHOLD=1000
+    )
+    def test_parallel_preprocess_in_prefork_worker(self):
+        tweets = [
+            (str(i), '2021-05-01T00:00:00', text)
+            for i, text in enumerate(self.corpus)
+        ]
+        # The processes of the Celery prefork pool are daemons.
+        pool = get_implementation('prefork')(
+            limit=1, app=app, initargs=(app, 'test')
+        )
+        pool.start()
+        self.addCleanup(pool.stop)
+        finished = threading.Event()
+        results = []
+
+        def finish(result):
+            results.append(result)
+            finished.set()
+
+        pool.apply_async(
+            preprocess_in_worker, (tweets,), callback=finish,
+            error_callback=finish
+        )
+        self.assertTrue(finished.wait(30))
+        ids, _, features = self.preprocessor.preprocess_chunk(tweets)
+        self.assertEqual(results, [(list(ids), features.shape)])
+
+
+class RegexTokenizerTests(SimpleTestCase):
+
+    def test_matches_nltk_word_tokenizer_without_sentences(self):
+        with open(os.path.join(TESTDATA_DIR, 'tweets.txt')) as tweets:
+            texts = make_corpus(5000, seed=1) + tweets.read().splitlines()
+        comparison = compare_tokenizers(
+            NLTKTokenizer(preserve_line=True), RegexTokenizer(), texts
+        )
+        self.assertEqual(comparison.mismatches, [])
+
+    def test_splits_like_nltk(self):
+        tokenizer = RegexTokenizer()
+        cases = {
+            "no puedo, don't": ['no', 'puedo', ',', 'do', "n't"],
+            'gonna "ver" (ya).': ['gon', 'na', '``', 'ver', "''", '(', 'ya', ')', '.'], # noqa
+            'a,5 b:c...d': ['a,5', 'b', ':', 'c', '...', 'd'],
+        }
+        for text, tokens in cases.items():
+            self.assertEqual(tokenizer.tokenize(text), tokens, text)
+
+
+class LinearScorerTests(SimpleTestCase):
+
+    def assertScoresLike(self, model, features):
+        labels, probabilities = LinearScorer(model).predict(features)
+        self.assertEqual(list(labels), list(model.predict(features)))
+        expected = model.predict_proba(features).max(axis=1)
+        self.assertLess(abs(probabilities - expected).max(), 1e-5)
+
+    def test_matches_example_model(self):
+        preprocessor = LogisticRegressionPreprocessor(EXAMPLE_PREDICTOR)
+        model = artifact_store.load(EXAMPLE_PREDICTOR, 'logit')
+        tweets = [
+            (str(i), '2021-05-01T00:00:00', text)
+            for i, text in enumerate(
+                make_corpus(settings.INFERENCE_BATCH_SIZE, seed=3)
+            )
+        ]
+        _, _, features = preprocessor.preprocess(tweets)
+        self.assertScoresLike(model, features)
+
+    def test_matches_one_vs_rest_and_binary_models(self):
+        generator = np.random.default_rng(0)
+        features = scipy.sparse.random(
+            300, 50, density=0.2, format='csr', random_state=0
+        )
+        for multi_class, n_classes in [
+            ('ovr', 3), ('ovr', 2), ('multinomial', 2)
+        ]:
+            y = generator.integers(n_classes, size=300)
+            model = SklearnLogistic(multi_class=multi_class)
+            self.assertScoresLike(model.fit(features, y), features)
+
+
+class ArtifactStoreTests(SimpleTestCase):
+
+    def test_loads_memory_mapped_arrays(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = ArtifactStore(root)
+            predictor = Predictor(version='v2.0', artifacts_path='test')
+            model = {'coef': np.ones((3, 4))}
+            store.save(predictor, logit=model)
+            loaded = store.load(predictor, 'logit')
+            self.assertIsInstance(loaded['coef'], np.memmap)
+            self.assertEqual(abs(loaded['coef'] - model['coef']).max(), 0)
+
+            predictor.version = 'v3.0'
+            with self.assertRaises(ImproperlyConfigured):
+                ArtifactStore(root).load(predictor, 'logit')
+
+    def test_reverifies_replaced_artifacts(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = ArtifactStore(root)
+            predictor = Predictor(version='v2.0', artifacts_path='test')
+            store.save(predictor, logit={'coef': np.ones(3)})
+            checksum = store.checksum(predictor, 'logit')
+
+            # Another process replaces the artifacts. The modification time
+            # is set explicitly, since it may not change within a few
+            # milliseconds on some file systems.
+            ArtifactStore(root).save(predictor, logit={'coef': np.zeros(3)})
+            manifest = os.path.join(store.path(predictor), 'manifest.json')
+            mtime = os.stat(manifest).st_mtime_ns + 10 ** 9
+            os.utime(manifest, ns=(mtime, mtime))
+            self.assertNotEqual(store.checksum(predictor, 'logit'), checksum)
+
+
+class NLTKDataTests(SimpleTestCase):
+
+    def test_verifies_checksums(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            with self.assertRaises(ImproperlyConfigured):
+                verify_manifest(data_dir)
+            path = os.path.join(data_dir, 'spanish.pickle')
+            with open(path, 'wb') as file:
+                file.write(b'punkt')
+            write_manifest(data_dir)
+            verify_manifest(data_dir)
+            with open(path, 'ab') as file:
+                file.write(b'corrupted')
+            with self.assertRaises(ImproperlyConfigured):
+                verify_manifest(data_dir)
+
+    def test_tokenizer_loads_data_lazily(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            with self.settings(NLTK_DATA_DIR=data_dir):
+                tokenizer = NLTKTokenizer()
+                with self.assertRaises(ImproperlyConfigured):
+                    tokenizer.tokenize('hola')
+
+
+class PredictionCacheTests(SimpleTestCase):
+
+    def test_evicts_least_recently_used_entries(self):
+        cache = PredictionCache(max_size=2)
+        cache.set_many([('a', 0), ('b', 1)])
+        self.assertEqual(cache.get_many(['a']), [0])
+        cache.set_many([('c', 2)])
+        self.assertEqual(cache.get_many(['a', 'b', 'c'], -1), [0, -1, 2])
+        self.assertEqual(cache.stats(), {'size': 2, 'hits': 3, 'misses': 1})
+
+    def test_keys_depend_on_tokenizer_and_artifacts(self):
+        cache = PredictionCache(max_size=2)
+        predictor = Predictor(id=1, version='v1.0')
+        keys = {
+            cache.key(predictor, tokenizer, checksums, 'hola mundo')
+            for tokenizer in ['NLTKTokenizer', 'RegexTokenizer']
+            for checksums in [('a', 'b'), ('a', 'c')]
+        }
+        self.assertEqual(len(keys), 4)
+
+
+class LogisticRegressionTests(TestCase):
+
+    def setUp(self):
+        self.predictor = Predictor.objects.create(
+            name='LogisticRegression', version='v1.0', description=''
+        )
+        for integer_label in range(3):
+            PredictionLabel.objects.create(
+                label=str(integer_label), integer_label=integer_label,
+                description='', predictor=self.predictor
+            )
+        self.tweets = [
+            (str(i), '2021-05-01T00:00:00', text)
+            for i, text in enumerate(make_corpus(500, seed=2))
+        ]
+
+    def test_cached_predictions_match_uncached_ones(self):
+        predictor = LogisticRegression(self.predictor)
+        expected = predictor.predict(self.tweets)
+        misses = prediction_cache.misses
+        self.assertEqual(predictor.predict(self.tweets), expected)
+        self.assertEqual(prediction_cache.misses, misses)
+
+    @override_settings(TOKENIZER='NLTKTokenizer')
+    def test_cold_construct_does_not_use_the_network(self):
+        predictor_registry.discard(self.predictor.id)
+        with mock.patch.object(
+            socket.socket, 'connect', side_effect=AssertionError('network')
+        ):
+            get_predictor(self.predictor)
+        self.assertIn(self.predictor.id, predictor_registry)
+        predictor_registry.discard(self.predictor.id)
+
+    def test_generation_changes_rebuild_registered_predictors(self):
+        predictor_registry.discard(self.predictor.id)
+        predictor = get_predictor(Predictor.objects.get(pk=self.predictor.pk))
+        self.assertIs(
+            get_predictor(Predictor.objects.get(pk=self.predictor.pk)),
+            predictor
+        )
+        # Another process edits the predictor.
+        Predictor.objects.filter(pk=self.predictor.pk).update(
+            generation=F('generation') + 1
+        )
+        self.assertIsNot(
+            get_predictor(Predictor.objects.get(pk=self.predictor.pk)),
+            predictor
+        )
+        predictor_registry.discard(self.predictor.id)
+
+    def test_label_changes_invalidate_cached_predictions(self):
+        predictor = LogisticRegression(self.predictor)
+        predictor.predict(self.tweets)
+        PredictionLabel.objects.first().save()
+        misses = prediction_cache.misses
+        predictor.predict(self.tweets)
+        self.assertEqual(prediction_cache.misses, misses + len(self.tweets))
+
+
+class PredictManyTests(TestCase):
+
+    def setUp(self):
+        self.predictors = []
+        for _ in range(2):
+            predictor = Predictor.objects.create(
+                name='LogisticRegression', version='v1.0', description=''
+            )
+            for integer_label in range(3):
+                PredictionLabel.objects.create(
+                    label=str(integer_label), integer_label=integer_label,
+                    description='', predictor=predictor
+                )
+            self.predictors.append(LogisticRegression(predictor))
+        self.tweets = [
+            (str(i), '2021-05-01T00:00:00', text)
+            for i, text in enumerate(make_corpus(500, seed=4))
+        ]
+
+    def test_shares_preprocessing_between_equal_keys(self):
+        first, second = self.predictors
+        self.assertEqual(first.preprocessing_key, second.preprocessing_key)
+        self.assertIs(first.preprocessor, second.preprocessor)
+        with mock.patch.object(
+            LogisticRegressionPreprocessor, 'preprocess', autospec=True,
+            side_effect=LogisticRegressionPreprocessor.preprocess
+        ) as preprocess:
+            predictions = predict_many(self.predictors, self.tweets)
+        preprocess.assert_called_once()
+        for predictor, prediction in zip(self.predictors, predictions):
+            self.assertEqual(
+                prediction, predictor.predict_features(
+                    predictor.preprocess(self.tweets)
+                )
+            )
+            self.assertTrue(all(
+                label.predictor == predictor.predictor
+                for _, _, label, _ in prediction
+            ))
+
+
+class WarmUpPredictorsTests(TestCase):
+
+    def setUp(self):
+        self.predictors = [
+            Predictor.objects.create(
+                name='LogisticRegression', version='v1.0', description='',
+                active=active
+            )
+            for active in (True, True, False)
+        ]
+        App.objects.create(
+            name='App', description='', about='',
+            default_predictor=self.predictors[1]
+        )
+
+    def tearDown(self):
+        for predictor in self.predictors:
+            predictor_registry.discard(predictor.id)
+
+    def test_scopes(self):
+        self.assertEqual(warm_up_predictors('none'), [])
+        self.assertEqual(warm_up_predictors('default'), self.predictors[1:2])
+        self.assertEqual(warm_up_predictors('all'), self.predictors[:2])
+        self.assertNotIn(self.predictors[2].id, predictor_registry)
+        with self.assertRaises(ImproperlyConfigured):
+            warm_up_predictors('active')
+
+
+@mock.patch('classifier.tasks.schedule_notification')
+@mock.patch('classifier.tasks.run_inference_batch.delay')
+class RunInferenceBatchTests(TestCase):
+
+    def setUp(self):
+        self.predictor = Predictor.objects.create(
+            name='LogisticRegression', version='v1.0', description=''
+        )
+        for integer_label in range(3):
+            PredictionLabel.objects.create(
+                label=str(integer_label), integer_label=integer_label,
+                description='', predictor=self.predictor
+            )
+        self.searches = [
+            Search.objects.create(
+                truncated_uuid=str(i), search_term='hola',
+                number_of_tweets=21, predictor=self.predictor, collected=21,
+                state=Search.State.CLASSIFYING
+            )
+            for i in range(2)
+        ]
+        # Both searches found the tweet 'shared'.
+        tweets = [
+            [('shared', '2021-05-01T00:00:00', 'hola que tal dia')],
+            [('shared', '2021-05-01T00:00:00', 'hola que tal dia')],
+        ]
+        for search, search_tweets in zip(self.searches, tweets):
+            search_tweets += [
+                (f'{search.id}-{i}', '2021-05-01T00:00:00', text)
+                for i, text in enumerate(make_corpus(20, seed=search.id))
+            ]
+            InferenceRequest.objects.create(
+                search=search, predictor=self.predictor, tweets=search_tweets,
+                size=len(search_tweets)
+            )
+
+    def tearDown(self):
+        predictor_registry.discard(self.predictor.id)
+
+    @override_settings(INFERENCE_BATCH_SIZE=100)
+    def test_classifies_several_searches_at_once(self, run, notify):
+        with mock.patch.object(
+            LogisticRegression, 'predict', autospec=True,
+            side_effect=LogisticRegression.predict
+        ) as predict:
+            metrics = run_inference_batch(self.predictor.id)
+        predict.assert_called_once()
+        self.assertEqual(metrics['searches'], 2)
+        self.assertEqual(metrics['fill_ratio'], 42 / 100)
+        self.assertFalse(InferenceRequest.objects.exists())
+        for search in self.searches:
+            ids = set(search.tweets.values_list('id', flat=True))
+            self.assertIn('shared', ids)
+            self.assertTrue(all(
+                id == 'shared' or id.startswith(f'{search.id}-')
+                for id in ids
+            ))
+        self.assertEqual(notify.call_count, 2)
+        run.assert_not_called()
+
+    @override_settings(INFERENCE_BATCH_SIZE=30)
+    def test_batches_are_bounded_by_size(self, run, notify):
+        metrics = run_inference_batch(self.predictor.id)
+        self.assertEqual(metrics['searches'], 1)
+        self.assertEqual(
+            InferenceRequest.objects.get().search, self.searches[1]
+        )
+        run.assert_called_once_with(self.predictor.id)
+
+    @override_settings(INFERENCE_BATCH_SIZE=30)
+    def test_failing_batches_fail_their_searches(self, run, notify):
+        with mock.patch.object(
+            LogisticRegression, 'predict', side_effect=ValueError('poison')
+        ) as predict, self.assertLogs('classifier.tasks', 'ERROR'):
+            result = run_inference_batch.apply((self.predictor.id,))
+        self.assertIsInstance(result.result, ValueError)
+        self.assertEqual(
+            predict.call_count, run_inference_batch.max_retries + 1
+        )
+        states = [
+            Search.objects.get(pk=search.pk).state for search in self.searches
+        ]
+        self.assertEqual(
+            states, [Search.State.FAILED, Search.State.CLASSIFYING]
+        )
+        self.assertEqual(
+            InferenceRequest.objects.get().search, self.searches[1]
+        )
+        run.assert_called_once_with(self.predictor.id)
+
+
+@mock.patch('classifier.tasks.schedule_notification')
+@mock.patch('classifier.tasks.run_inference_batch.apply_async')
+class ClassifyTweetsTests(TestCase):
+
+    def setUp(self):
+        self.predictor = Predictor.objects.create(
+            name='LogisticRegression', version='v1.0', description=''
+        )
+        label = PredictionLabel.objects.create(
+            label='0', integer_label=0, description='',
+            predictor=self.predictor
+        )
+        self.search = Search.objects.create(
+            truncated_uuid='0', search_term='hola', number_of_tweets=10,
+            predictor=self.predictor
+        )
+        self.tweets = [
+            (str(i), '2021-05-01T00:00:00', text)
+            for i, text in enumerate(make_corpus(10))
+        ]
+        for id in ['0', '1', '2']:
+            tweet = Tweet.objects.create(id=id, date='2021-05-01T00:00:00Z')
+            Prediction.objects.create(
+                predictor=self.predictor, tweet=tweet, label=label
+            )
+
+    def stage(self, tweets):
+        return InferenceRequest.objects.create(
+            search=self.search, predictor=self.predictor, tweets=tweets,
+            size=len(tweets)
+        ).id
+
+    def test_queues_only_unseen_tweets(self, run, notify):
+        request_id = self.stage(self.tweets)
+        with CaptureQueriesContext(connection) as queries:
+            classify_tweets(request_id)
+        self.assertEqual(1, sum(
+            'FROM "Prediction"' in query['sql']
+            for query in queries.captured_queries
+        ))
+        request = InferenceRequest.objects.get()
+        self.assertEqual(request.id, request_id)
+        self.assertEqual(request.size, 7)
+        self.assertEqual(
+            [tweet[0] for tweet in request.tweets],
+            [str(i) for i in range(3, 10)]
+        )
+        self.assertEqual(
+            set(self.search.tweets.values_list('id', flat=True)),
+            {'0', '1', '2'}
+        )
+        run.assert_called_once()
+        notify.assert_not_called()
+
+    def test_notifies_when_every_tweet_was_classified(self, run, notify):
+        Search.objects.filter(pk=self.search.id).update(
+            collected=3, state=Search.State.CLASSIFYING
+        )
+        classify_tweets(self.stage(self.tweets[:3]))
+        self.assertFalse(InferenceRequest.objects.exists())
+        self.assertEqual(self.search.tweets.count(), 3)
+        notify.assert_called_once_with(self.search.id)
+        run.assert_not_called()
+
+    def test_counts_repeated_tweets_as_classified(self, run, notify):
+        Search.objects.filter(pk=self.search.id).update(
+            collected=4, state=Search.State.CLASSIFYING
+        )
+        classify_tweets(self.stage(self.tweets[:3] + self.tweets[:1]))
+        self.search.refresh_from_db()
+        self.assertEqual(self.search.classified, 4)
+        self.assertEqual(self.search.state, Search.State.DONE)
+        notify.assert_called_once_with(self.search.id)
+
+    def test_ignores_requests_already_classified(self, run, notify):
+        request_id = self.stage(self.tweets)
+        InferenceRequest.objects.filter(pk=request_id).delete()
+        classify_tweets(request_id)
+        run.assert_not_called()
+        notify.assert_not_called()
+
+
+@mock.patch('classifier.tasks.schedule_notification')
+@mock.patch('classifier.tasks.api_collector')
+@override_settings(COLLECTION_CHUNK_SIZE=4, INFERENCE_BATCH_MAX_WAIT=0)
+class CollectTweetsTests(TestCase):
+
+    def setUp(self):
+        self.predictor = Predictor.objects.create(
+            name='LogisticRegression', version='v1.0', description=''
+        )
+        for integer_label in range(3):
+            PredictionLabel.objects.create(
+                label=str(integer_label), integer_label=integer_label,
+                description='', predictor=self.predictor
+            )
+        App.objects.create(
+            name='App', description='', about='',
+            default_predictor=self.predictor
+        )
+        self.search = Search.objects.create(
+            truncated_uuid='0', search_term='hola', number_of_tweets=10,
+            predictor=self.predictor
+        )
+        self.statuses = [
+            mock.Mock(
+                id_str=str(i), created_at='2021-05-01T00:00:00Z',
+                full_text=text
+            )
+            for i, text in enumerate(make_corpus(10, seed=5))
+        ]
+
+    def tearDown(self):
+        predictor_registry.discard(self.predictor.id)
+
+    def result(self):
+        return self.client.post(
+            '/api/result', {'search_id': self.search.truncated_uuid},
+            content_type='application/json'
+        ).json()
+
+    def test_classifies_tweets_in_chunks(self, collector, notify):
+        results = []
+
+        def collect_pages(search_term, number_of_tweets, max_id, since_id):
+            for i in range(0, len(self.statuses), 5):
+                results.append(self.result())
+                yield self.statuses[i:i + 5]
+
+        collector.collect_pages.side_effect = collect_pages
+        with mock.patch(
+            'classifier.tasks.classify_tweets.delay',
+            side_effect=classify_tweets
+        ) as classify:
+            collect_tweets(self.search.id, 'hola', 10)
+        # Pages of 5 tweets are split into chunks of 4 and 1.
+        self.assertEqual(classify.call_count, 4)
+        self.assertTrue(all(
+            isinstance(request_id, int)
+            for (request_id,), _ in classify.call_args_list
+        ))
+        self.assertFalse(InferenceRequest.objects.exists())
+
+        progress = [result['progress'] for result in results]
+        self.assertEqual(
+            [(p['collected'], p['classified']) for p in progress],
+            [(0, 0), (5, 5)]
+        )
+        self.assertTrue(results[0]['processing'])
+        self.assertNotIn('processing', results[1])
+        self.assertFalse(any(p['done'] for p in progress))
+
+        result = self.result()
+        self.assertEqual(
+            result['progress'],
+            {
+                'collected': 10, 'classified': 10, 'done': True,
+                'state': 'done'
+            }
+        )
+        classified = sum(
+            (ids for label, ids in result.items() if label.isdigit()), []
+        )
+        self.assertEqual(
+            sorted(classified),
+            sorted(self.search.tweets.values_list('id', flat=True))
+        )
+        notify.assert_called_once_with(self.search.id)
+
+    def test_empty_search(self, collector, notify):
+        collector.collect_pages.return_value = []
+        collect_tweets(self.search.id, 'hola', 10)
+        result = self.result()
+        self.assertFalse(result['processing'])
+        self.assertTrue(result['progress']['done'])
+        notify.assert_called_once_with(self.search.id)
+
+
+class ResultTests(TestCase):
+
+    def setUp(self):
+        self.predictor = Predictor.objects.create(
+            name='LogisticRegression', version='v1.0', description=''
+        )
+        self.label = PredictionLabel.objects.create(
+            label='0', integer_label=0, description='',
+            predictor=self.predictor
+        )
+        App.objects.create(
+            name='App', description='', about='',
+            default_predictor=self.predictor
+        )
+        self.search = Search.objects.create(
+            truncated_uuid='0', search_term='hola', number_of_tweets=10,
+            predictor=self.predictor, state=Search.State.COLLECTING
+        )
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def poll(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.client.post(
+                '/api/result', {'search_id': self.search.truncated_uuid},
+                content_type='application/json'
+            ).json()
+        tables = [
+            table for table in ['Search', 'Tweet', 'Prediction']
+            for query in queries if f'FROM "{table}"' in query['sql']
+        ]
+        return result, tables
+
+    def test_polls_in_progress_read_the_search_only(self):
+        Search.objects.filter(pk=self.search.id).update(collected=5)
+        result, tables = self.poll()
+        self.assertEqual(tables, ['Search'])
+        self.assertTrue(result['processing'])
+        self.assertEqual(result['progress'], {
+            'collected': 5, 'classified': 0, 'done': False,
+            'state': 'collecting'
+        })
+
+    def test_results_are_cached_until_more_are_classified(self):
+        store_predictions(self.search, [
+            (str(i), '2021-05-01T00:00:00Z', self.label, 0.5)
+            for i in range(3)
+        ])
+        Search.objects.filter(pk=self.search.id).update(
+            collected=5, classified=3
+        )
+        result, tables = self.poll()
+        self.assertIn('Prediction', tables)
+        self.assertEqual(sorted(result['0']), ['0', '1', '2'])
+
+        result, tables = self.poll()
+        self.assertEqual(tables, ['Search'])
+        self.assertEqual(sorted(result['0']), ['0', '1', '2'])
+
+        store_predictions(self.search, [
+            ('3', '2021-05-01T00:00:00Z', self.label, 0.5)
+        ])
+        Search.objects.filter(pk=self.search.id).update(
+            classified=4, state=Search.State.CLASSIFYING
+        )
+        result, tables = self.poll()
+        self.assertIn('Prediction', tables)
+        self.assertEqual(sorted(result['0']), ['0', '1', '2', '3'])
+        self.assertEqual(result['progress']['state'], 'classifying')
+
+    def test_failed_search(self):
+        Search.objects.filter(pk=self.search.id).update(
+            state=Search.State.FAILED
+        )
+        result, tables = self.poll()
+        self.assertFalse(result['processing'])
+        self.assertTrue(result['progress']['done'])
+        self.assertEqual(result['progress']['state'], 'failed')
+        self.assertEqual(
+            result['detail'], "Tweets collection for 'hola' failed."
+        )
+
+
+@mock.patch('classifier.views.collect_tweets.delay')
+class CoalescingTests(TestCase):
+
+    def setUp(self):
+        self.predictor = Predictor.objects.create(
+            name='LogisticRegression', version='v1.0', description=''
+        )
+        App.objects.create(
+            name='App', description='', about='',
+            default_predictor=self.predictor
+        )
+
+    def search(self, search_term, number_of_tweets=10):
+        truncated_uuid = self.client.post(
+            '/api/search',
+            {'search_term': search_term, 'number_of_tweets': number_of_tweets},
+            content_type='application/json'
+        ).json()['truncated_uuid']
+        return Search.objects.get(truncated_uuid=truncated_uuid)
+
+    def test_identical_searches_follow_the_first_one(self, collect):
+        leader = self.search('Hola  Mundo')
+        follower = self.search('HOLA mundo')
+        other = self.search('hola mundo', number_of_tweets=20)
+        self.assertIsNone(leader.leader)
+        self.assertEqual(follower.leader, leader)
+        self.assertIsNone(other.leader)
+        self.assertNotEqual(leader.truncated_uuid, follower.truncated_uuid)
+        self.assertEqual(collect.call_count, 2)
+
+        Search.objects.filter(pk=leader.id).update(collected=5, classified=3)
+        result = self.client.post(
+            '/api/result', {'search_id': follower.truncated_uuid},
+            content_type='application/json'
+        ).json()
+        self.assertEqual(result['search_term'], 'HOLA mundo')
+        self.assertEqual(
+            result['progress'],
+            {
+                'collected': 5, 'classified': 3, 'done': False,
+                'state': 'queued'
+            }
+        )
+
+    @override_settings(SEARCH_COALESCING_WINDOW=60)
+    def test_done_searches_are_followed_while_fresh(self, collect):
+        leader = self.search('hola')
+        Search.objects.filter(pk=leader.id).update(
+            state=Search.State.DONE, done_date=timezone.now()
+        )
+        self.assertEqual(self.search('hola').leader, leader)
+
+        Search.objects.filter(pk=leader.id).update(
+            done_date=timezone.now() - timedelta(seconds=61)
+        )
+        self.assertIsNone(self.search('hola').leader)
+        self.assertEqual(collect.call_count, 2)
+
+    @mock.patch('classifier.tasks.schedule_notification')
+    def test_followers_take_the_state_of_their_leader(self, notify, collect):
+        leader = self.search('hola')
+        follower = self.search('hola')
+        self.assertEqual(follower.state, Search.State.QUEUED)
+
+        Search.objects.filter(pk=leader.id).update(
+            state=Search.State.CLASSIFYING
+        )
+        complete_search(leader.id)
+        leader.refresh_from_db()
+        follower.refresh_from_db()
+        self.assertEqual(follower.state, Search.State.DONE)
+        self.assertEqual(follower.done_date, leader.done_date)
+        late = self.search('hola')
+        self.assertEqual(late.leader, leader)
+        self.assertEqual(late.state, Search.State.DONE)
+
+        other = self.search('chao')
+        follower = self.search('chao')
+        request = InferenceRequest.objects.create(
+            search=other, predictor=self.predictor, tweets=[], size=0
+        )
+        fail_requests([request.id])
+        follower.refresh_from_db()
+        self.assertEqual(follower.state, Search.State.FAILED)
+        notify.assert_called_with(other.id)
+
+    @override_settings(SEARCH_LEADER_MAX_AGE=60)
+    def test_stale_searches_in_progress_are_not_followed(self, collect):
+        leader = self.search('hola')
+        Search.objects.filter(pk=leader.id).update(
+            state=Search.State.COLLECTING
+        )
+        self.assertEqual(self.search('hola').leader, leader)
+
+        Search.objects.filter(pk=leader.id).update(
+            date=timezone.now() - timedelta(seconds=61)
+        )
+        self.assertIsNone(self.search('hola').leader)
+        self.assertEqual(collect.call_count, 2)
+
+
+class StorePredictionsTests(TestCase):
+
+    def setUp(self):
+        self.predictor = Predictor.objects.create(
+            name='LogisticRegression', version='v1.0', description=''
+        )
+        self.label = PredictionLabel.objects.create(
+            label='0', integer_label=0, description='',
+            predictor=self.predictor
+        )
+        self.search = Search.objects.create(
+            truncated_uuid='0', search_term='hola', number_of_tweets=10,
+            predictor=self.predictor
+        )
+
+    def make_prediction(self, size):
+        return [
+            (str(i), '2021-05-01T00:00:00Z', self.label, 0.5)
+            for i in range(size)
+        ]
+
+    def test_number_of_queries_does_not_depend_on_tweets(self):
+        with CaptureQueriesContext(connection) as queries:
+            store_predictions(self.search, self.make_prediction(10))
+        with self.assertNumQueries(len(queries)):
+            store_predictions(self.search, self.make_prediction(100))
+        self.assertEqual(self.search.tweets.count(), 100)
+        self.assertEqual(
+            Prediction.objects.filter(predictor=self.predictor).count(), 100
+        )
+
+    def test_restores_soft_deleted_rows(self):
+        store_predictions(self.search, self.make_prediction(3))
+        Tweet.objects.get(id='0').delete()
+        self.assertFalse(Prediction.objects.filter(tweet_id='0').exists())
+        store_predictions(self.search, self.make_prediction(3))
+        self.assertEqual(self.search.tweets.count(), 3)
+        self.assertEqual(
+            Prediction.objects.get(tweet_id='0').confidence, 0.5
+        )
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    NOTIFICATION_BATCH_SIZE=3, FRONTEND_URL='http://twish'
+)
+class NotificationTests(TestCase):
+
+    def setUp(self):
+        self.predictor = Predictor.objects.create(
+            name='LogisticRegression', version='v1.0', description=''
+        )
+        labels = [
+            PredictionLabel.objects.create(
+                label=str(integer_label), integer_label=integer_label,
+                description='', predictor=self.predictor
+            )
+            for integer_label in range(2)
+        ]
+        self.hola = self.create_search(
+            'hola', collected=3, classified=3, state=Search.State.DONE
+        )
+        store_predictions(self.hola, [
+            (str(i), '2021-05-01T00:00:00Z', labels[i % 2], 0.5)
+            for i in range(3)
+        ])
+        chao = self.create_search('chao', state=Search.State.EMPTY)
+        follower = self.create_search('Hola', leader=self.hola)
+        self.adios = self.create_search('adios')
+        for name, search in [
+            ('ana', self.hola), ('bob', self.hola), ('carla', self.hola),
+            ('ana', chao), ('dan', follower), ('eve', self.adios)
+        ]:
+            Searcher.objects.create(
+                name=name, email=f'{name}@example.com', search=search
+            )
+
+    def create_search(self, search_term, **kwargs):
+        return Search.objects.create(
+            truncated_uuid=search_term, search_term=search_term,
+            number_of_tweets=10, predictor=self.predictor,
+            **kwargs
+        )
+
+    def test_sends_batches_over_one_connection(self):
+        connections = []
+
+        def connect(*args, **kwargs):
+            backend = get_connection(*args, **kwargs)
+            backend.send_messages = mock.Mock(wraps=backend.send_messages)
+            connections.append(backend)
+            return backend
+
+        with mock.patch(
+            'classifier.notifications.get_connection', side_effect=connect
+        ), mock.patch(
+            'classifier.notifications.render_to_string',
+            wraps=render_to_string
+        ) as render:
+            self.assertEqual(notify_searchers(self.hola.id), 4)
+        # One summary per search: hola, chao and the follower of hola.
+        self.assertEqual(render.call_count, 3)
+        self.assertEqual(len(connections), 1)
+        self.assertEqual(connections[0].send_messages.call_count, 2)
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox), [
+                'ana@example.com', 'bob@example.com', 'carla@example.com',
+                'dan@example.com'
+            ]
+        )
+
+        ana = mail.outbox[0]
+        self.assertEqual(ana.subject, 'Results for 2 searches')
+        self.assertIn("Results for 'hola'", ana.body)
+        self.assertIn('* 0: 2 tweets', ana.body)
+        self.assertIn('* 1: 1 tweets', ana.body)
+        self.assertIn('http://twish/search/hola', ana.body)
+        self.assertIn("did not found tweets for 'chao'", ana.body)
+        dan = mail.outbox[3]
+        self.assertEqual(dan.subject, "Results for 'Hola'")
+        self.assertIn('http://twish/search/Hola', dan.body)
+
+    def test_notifies_each_searcher_once(self):
+        notify_searchers(self.hola.id)
+        self.assertEqual(notify_searchers(self.hola.id), 0)
+        self.assertEqual(len(mail.outbox), 4)
+
+        Search.objects.filter(pk=self.adios.id).update(
+            state=Search.State.DONE
+        )
+        self.assertEqual(notify_searchers(self.adios.id), 1)
+        self.assertEqual(mail.outbox[-1].to, ['eve@example.com'])
+
+    def test_notifies_failed_searches(self):
+        Search.objects.filter(pk=self.adios.id).update(
+            state=Search.State.FAILED
+        )
+        notify_searchers(self.adios.id)
+        eve = mail.outbox[-1]
+        self.assertEqual(eve.to, ['eve@example.com'])
+        self.assertIn(
+            "the tweets collection for 'adios' failed", eve.body
+        )
+        self.assertNotIn('tweets were collected', eve.body)
+
+    def test_releases_searchers_not_notified(self):
+        with mock.patch.object(
+            locmem.EmailBackend, 'send_messages', side_effect=[3, OSError]
+        ):
+            with self.assertRaises(OSError):
+                notify_searchers(self.hola.id)
+        self.assertEqual(
+            sorted(Searcher.objects.filter(
+                notified=False
+            ).values_list('name', flat=True)),
+            ['dan', 'eve']
+        )
+
+    def test_releases_searchers_of_messages_not_sent(self):
+        with mock.patch.object(
+            locmem.EmailBackend, 'send_messages', side_effect=[2, 1]
+        ):
+            self.assertEqual(notify_searchers(self.hola.id), 3)
+        self.assertEqual(
+            sorted(Searcher.objects.filter(
+                notified=False
+            ).values_list('name', flat=True)),
+            ['carla', 'eve']
+        )
+
+    @mock.patch('classifier.views.schedule_notification')
+    def test_registering_to_a_search_done(self, schedule):
+        App.objects.create(
+            name='App', description='', about='',
+            default_predictor=self.predictor
+        )
+        for search in ['adios', 'Hola']:
+            response = self.client.post('/api/email', {
+                'name': 'fer', 'email': 'fer@example.com', 'search': search
+            }, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        schedule.assert_called_once_with(
+            Search.objects.get(truncated_uuid='Hola').id
+        )
+
+
+class BenchPredictorTests(TestCase):
+
+    def setUp(self):
+        self.predictor = Predictor.objects.create(
+            name='LogisticRegression', version='v1.0', description=''
+        )
+        for integer_label in range(3):
+            PredictionLabel.objects.create(
+                label=str(integer_label), integer_label=integer_label,
+                description='', predictor=self.predictor
+            )
+        self.directory = tempfile.TemporaryDirectory()
+        self.baseline = os.path.join(self.directory.name, 'baseline.json')
+
+    def tearDown(self):
+        predictor_registry.discard(self.predictor.id)
+        self.directory.cleanup()
+
+    def bench(self, *args):
+        call_command(
+            'bench_predictor', '--size', '300', '--batch-sizes', '50', '300',
+            *args, stdout=io.StringIO(), stderr=io.StringIO()
+        )
+
+    def test_compares_against_baseline(self):
+        self.bench('--output', self.baseline)
+        with open(self.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        results = baseline['results'][str(self.predictor)]
+        self.assertEqual(set(results), {'50', '300'})
+        for result in results.values():
+            self.assertEqual(
+                set(result['scorer']), {'scorer', 'predict_proba'}
+            )
+        self.assertEqual(results['50']['labels'], results['300']['labels'])
+        self.assertFalse(Search.objects.exists())
+
+        self.bench('--baseline', self.baseline, '--threshold', '100')
+
+        labels = results['50']['labels']
+        index = next(i for i, label in enumerate(labels) if label is not None)
+        labels[index] = labels[index] + 1
+        with open(self.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file)
+        with self.assertRaisesMessage(CommandError, 'regressed'):
+            self.bench('--baseline', self.baseline, '--threshold', '100')
+        with self.assertRaisesMessage(CommandError, 'corpus'):
+            self.bench('--baseline', self.baseline, '--seed', '1')
+
+    def test_measures_peak_memory(self):
+        output = os.path.join(self.directory.name, 'memory.json')
+        call_command(
+            'bench_memory', '--sizes', '100', '1000', '--output', output,
+            stdout=io.StringIO()
+        )
+        with open(output) as output_file:
+            results = json.load(output_file)[str(self.predictor)]
+        self.assertEqual(set(results), {'100', '1000'})
+        for result in results.values():
+            for mode in ['sparse', 'dense']:
+                self.assertGreaterEqual(
+                    result[mode]['peak'], result[mode]['baseline']
+                )
+        # Dense features take a row of the whole vocabulary per tweet.
+        growth = {
+            mode: results['1000'][mode]['peak'] - results['100'][mode]['peak']
+            for mode in ['sparse', 'dense']
+        }
+        self.assertGreater(growth['dense'], growth['sparse'])
+
+    def test_measures_worker_memory(self):
+        output = os.path.join(self.directory.name, 'artifacts.json')
+        call_command(
+            'bench_artifacts', '--workers', '2', '--size', '100', '--output',
+            output, stdout=io.StringIO()
+        )
+        with open(output) as output_file:
+            results = json.load(output_file)[str(self.predictor)]
+        self.assertEqual(set(results), {'r', 'None'})
+        for workers in results.values():
+            self.assertEqual(len(workers), 2)
+            for worker in workers:
+                self.assertEqual(set(worker), {'rss', 'pss'})
+
+
+class TaskRoutingTests(SimpleTestCase):
+
+    def make_app(self, queue, release, classified):
+        loadtest = Celery('loadtest', broker='memory://', set_as_current=False)
+        loadtest.conf.update(
+            broker_transport_options={'polling_interval': 0.01},
+            task_routes=settings.CELERY_TASK_ROUTES,
+            task_default_queue=settings.CELERY_TASK_DEFAULT_QUEUE
+        )
+        configure_worker(loadtest, queue, settings.CELERY_WORKER_QUEUES[queue])
+
+        # Not lazy, so they take the place of the tasks of tasks.py.
+        @loadtest.task(name='classifier.tasks.collect_tweets', lazy=False)
+        def collect_tweets():
+            release.wait(30)
+
+        @loadtest.task(
+            name='classifier.tasks.run_inference_batch', lazy=False
+        )
+        def run_inference_batch(number):
+            classified.append(number)
+
+        return loadtest
+
+    def test_routes(self):
+        for task, queue in [
+            ('collect_tweets', 'collection'),
+            ('notify_searchers', 'collection'),
+            ('classify_tweets', 'classification'),
+            ('run_inference_batch', 'classification'),
+        ]:
+            route = app.amqp.router.route({}, f'classifier.tasks.{task}')
+            self.assertEqual(route['queue'].name, queue)
+
+    def test_workers_consume_their_queues(self):
+        for queue, consumed, pool in [
+            ('', {'collection', 'classification'}, 'prefork'),
+            ('collection', {'collection'}, 'threads'),
+        ]:
+            worker = Celery('worker', broker='memory://', set_as_current=False)
+            worker.conf.task_default_queue = settings.CELERY_TASK_DEFAULT_QUEUE
+            with mock.patch.dict(os.environ, CELERY_WORKER_QUEUE=queue):
+                celeryd_init.send(
+                    sender='worker', instance=mock.Mock(app=worker),
+                    conf=worker.conf, options={}
+                )
+            self.assertEqual(set(worker.amqp.queues.consume_from), consumed)
+
+            # The pool of the command line, unless it is not the default.
+            controller = mock.Mock(app=worker, pool_cls='prefork')
+            worker_init.send(sender=controller)
+            self.assertEqual(controller.pool_cls, pool)
+            controller = mock.Mock(app=worker, pool_cls='solo')
+            worker_init.send(sender=controller)
+            self.assertEqual(controller.pool_cls, 'solo')
+
+    def test_classification_is_not_blocked_by_collection(self):
+        release = threading.Event()
+        classified = []
+        collection = self.make_app('collection', release, classified)
+        classification = self.make_app('classification', release, classified)
+        options = settings.CELERY_WORKER_QUEUES['collection']
+        with start_worker(
+            collection, pool=options['pool'],
+            concurrency=options['concurrency'], perform_ping_check=False
+        ), start_worker(
+            # The embedded worker cannot fork, a single process is enough.
+            classification, pool='solo', perform_ping_check=False
+        ):
+            collect_tweets = collection.tasks[
+                'classifier.tasks.collect_tweets'
+            ]
+            run_inference_batch = collection.tasks[
+                'classifier.tasks.run_inference_batch'
+            ]
+            try:
+                # Every thread of the collection worker is held, and more
+                # collections are queued behind them, until the batches are
+                # all classified.
+                for _ in range(options['concurrency'] * 5):
+                    collect_tweets.delay()
+                for number in range(10):
+                    run_inference_batch.delay(number)
+                deadline = time.monotonic() + 30
+                while len(classified) < 10 and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                done = sorted(classified)
+            finally:
+                release.set()
+        self.assertEqual(done, list(range(10)))
+
+
+class FakeTwitterAPI:
+    """
+    Search endpoint serving the tweets recorded in testdata, in a thread.
+    The tweets with an id greater than published_id are not served yet and
+    the requests whose number is in failures fail. most_in_flight is the
+    greatest number of requests served at once.
+    """
+
+    def __init__(self, delay=0, rate_limit=None):
+        with open(os.path.join(TESTDATA_DIR, 'search_pages.json')) as pages:
+            self.pages = json.load(pages)
+        self.statuses = [
+            status for page in self.pages for status in page['statuses']
+        ]
+        self.published_id = self.statuses[0]['id']
+        self.served = []
+        self.failures = set()
+        self.delay = delay
+        self.rate_limit = rate_limit
+        self.reset = int(time.time()) + 600
+        self.requests = []
+        self.connections = set()
+        self.token_requests = 0
+        self.in_flight = 0
+        self.most_in_flight = 0
+
+    async def search(self, request):
+        self.requests.append(dict(request.query))
+        self.connections.add(request.transport.get_extra_info('peername'))
+        self.in_flight += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        if len(self.requests) in self.failures:
+            return web.json_response({'errors': []}, status=503)
+        headers = {}
+        if self.rate_limit is not None:
+            headers = {
+                'x-rate-limit-remaining': str(
+                    max(self.rate_limit - len(self.requests), 0)
+                ),
+                'x-rate-limit-reset': str(self.reset),
+            }
+            if len(self.requests) > self.rate_limit:
+                return web.json_response(
+                    {'errors': [{'code': 88}]}, status=429, headers=headers
+                )
+        max_id = int(request.query.get('max_id', self.published_id))
+        since_id = int(request.query.get('since_id', 0))
+        statuses = [
+            status for status in self.statuses
+            if since_id < status['id'] <= min(max_id, self.published_id)
+        ]
+        statuses = statuses[:int(request.query['count'])]
+        self.served.extend(status['id'] for status in statuses)
+        return web.json_response({
+            'statuses': statuses,
+            'search_metadata': {'count': int(request.query['count'])}
+        }, headers=headers)
+
+    async def token(self, request):
+        self.token_requests += 1
+        return web.json_response(
+            {'token_type': 'bearer', 'access_token': 'token'}
+        )
+
+    async def start(self):
+        application = web.Application()
+        application.router.add_get('/1.1/search/tweets.json', self.search)
+        application.router.add_post('/oauth2/token', self.token)
+        self.runner = web.AppRunner(application)
+        await self.runner.setup()
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        await web.SockSite(self.runner, sock).start()
+        return f'http://127.0.0.1:{sock.getsockname()[1]}'
+
+    def __enter__(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(
+            self.start(), self.loop
+        ).result()
+
+    def __exit__(self, *args):
+        asyncio.run_coroutine_threadsafe(
+            self.runner.cleanup(), self.loop
+        ).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+@override_settings(TWITTER_BEARER_TOKEN='')
+class OfficialAPICollectorTests(SimpleTestCase):
+
+    def page(self, ids, next_results):
+        page = SearchResults()
+        page.extend(mock.Mock(id_str=str(id)) for id in ids)
+        page.next_results = next_results
+        return page
+
+    @mock.patch('classifier.collectors.tweepy.Cursor')
+    def test_spends_a_call_per_page_fetched(self, cursor):
+        cursor.return_value.pages.return_value = iter([
+            self.page([3, 2], '?max_id=1'), self.page([1], None)
+        ])
+        quota = mock.Mock()
+        collector = OfficialAPICollector(quota=quota)
+        pages = list(collector.collect_pages('hola', 0))
+        self.assertEqual(
+            [[tweet.id_str for tweet in page] for page in pages],
+            [['3', '2'], ['1']]
+        )
+        self.assertEqual(quota.acquire.call_count, 2)
+
+
+class AsyncAPICollectorTests(SimpleTestCase):
+
+    def test_collect(self):
+        api = FakeTwitterAPI()
+        with api as api_url:
+            collector = AsyncAPICollector(api_url, quota=mock.Mock())
+            self.addCleanup(collector.close)
+            tweets = list(collector.collect('hola', 0))
+            limited = list(collector.collect('hola', 150))
+        expected = [
+            status for page in api.pages for status in page['statuses']
+        ]
+        self.assertEqual(
+            [tweet.id_str for tweet in tweets],
+            [status['id_str'] for status in expected]
+        )
+        self.assertEqual(tweets[-1].full_text, expected[-1]['full_text'])
+        self.assertEqual(
+            tweets[0].created_at.isoformat(), '2021-05-01T12:00:00+00:00'
+        )
+        self.assertEqual(
+            [tweet.id_str for tweet in limited],
+            [status['id_str'] for status in expected[:150]]
+        )
+        # Three pages and an empty one, then only the two pages needed.
+        self.assertEqual(len(api.requests), 6)
+        self.assertEqual(api.requests[0]['q'], 'hola -filter:retweets')
+        self.assertEqual(
+            int(api.requests[1]['max_id']), int(expected[99]['id']) - 1
+        )
+        self.assertEqual(api.token_requests, 1)
+
+    def test_concurrent_collections_share_connections(self):
+        api = FakeTwitterAPI(delay=0.05)
+        searches = 20
+        with api as api_url:
+            collector = AsyncAPICollector(
+                api_url, max_connections=5, quota=mock.Mock()
+            )
+            self.addCleanup(collector.close)
+            results = [None] * searches
+
+            def collect(i):
+                results[i] = list(collector.collect('hola', 250))
+
+            threads = [
+                threading.Thread(target=collect, args=(i,))
+                for i in range(searches)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertTrue(all(len(tweets) == 250 for tweets in results))
+        self.assertEqual(len(api.requests), searches * 3)
+        self.assertEqual(api.token_requests, 1)
+        self.assertLessEqual(len(api.connections), 5)
+        # The collections shared the connections at once, not in turns.
+        self.assertGreater(api.most_in_flight, 1)
+        self.assertLessEqual(api.most_in_flight, 5)
+
+
+@override_settings(TWITTER_BEARER_TOKEN='token')
+class QuotaSchedulerTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.quota = QuotaScheduler('test', 2, 900, clock=lambda: self.now)
+
+    def test_acquire(self):
+        self.assertEqual(self.quota.acquire(), 1)
+        self.assertEqual(self.quota.acquire(), 0)
+        with self.assertRaises(QuotaExceeded) as context:
+            self.quota.acquire()
+        reset = self.now + timedelta(seconds=900)
+        self.assertEqual(context.exception.eta, reset)
+        self.assertEqual(self.quota.status(), (2, 0, reset, 0))
+
+        self.now = reset
+        self.assertEqual(self.quota.status(), (2, 2, None, 0))
+        self.assertEqual(self.quota.acquire(), 1)
+
+    def test_update(self):
+        self.quota.acquire()
+        reset = self.now + timedelta(seconds=600)
+        self.quota.update(2, reset)
+        self.assertEqual(self.quota.status(), (2, 1, reset, 0))
+        self.quota.update(0)
+        self.assertEqual(self.quota.status(), (2, 0, reset, 0))
+        # The API started a new window before this one ended.
+        self.quota.update(2, reset + timedelta(seconds=900))
+        self.assertEqual(self.quota.status().remaining, 2)
+
+    @mock.patch('classifier.tasks.schedule_notification')
+    @mock.patch('classifier.tasks.classify_tweets.delay')
+    @mock.patch('classifier.tasks.collect_tweets.apply_async')
+    def test_collection_is_deferred(self, apply_async, *mocks):
+        predictor = Predictor.objects.create(
+            name='LogisticRegression', version='v1.0', description=''
+        )
+        search = Search.objects.create(
+            truncated_uuid='0', search_term='hola', number_of_tweets=250,
+            predictor=predictor
+        )
+        api = FakeTwitterAPI()
+        with api as api_url, mock.patch(
+            'classifier.tasks.api_collector',
+            AsyncAPICollector(api_url, quota=self.quota)
+        ) as collector:
+            self.addCleanup(collector.close)
+            collect_tweets(search.id, 'hola', 250)
+            (args, kwargs), options = apply_async.call_args
+            reset = self.now + timedelta(seconds=900)
+            self.assertEqual(options['eta'], reset)
+            self.assertEqual(self.quota.status(), (2, 0, reset, 1))
+            search.refresh_from_db()
+            self.assertEqual(search.collected, 200)
+            self.assertEqual(search.state, Search.State.COLLECTING)
+
+            self.now = reset
+            collect_tweets(*args, **kwargs)
+        self.assertEqual(self.quota.status(), (2, 1, mock.ANY, 0))
+        search.refresh_from_db()
+        self.assertEqual(search.collected, 250)
+        self.assertEqual(search.state, Search.State.CLASSIFYING)
+        max_ids = [request.get('max_id') for request in api.requests]
+        self.assertEqual(len(max_ids), 3)
+        self.assertEqual(len(set(max_ids)), 3)
+        self.assertEqual(
+            int(max_ids[2]), api.pages[1]['statuses'][-1]['id'] - 1
+        )
+
+    def test_rate_limit_exceeded_by_other_clients(self):
+        api = FakeTwitterAPI(rate_limit=1)
+        self.quota.limit = 10
+        tweets = []
+        with api as api_url:
+            collector = AsyncAPICollector(api_url, quota=self.quota)
+            self.addCleanup(collector.close)
+            with self.assertRaises(QuotaExceeded) as context:
+                for tweet in collector.collect('hola', 250):
+                    tweets.append(tweet)
+        self.assertEqual(len(tweets), 100)
+        self.assertEqual(context.exception.eta.timestamp(), api.reset)
+        self.assertEqual(self.quota.status().remaining, 0)
+
+
+@override_settings(
+    COLLECTION_CHUNK_SIZE=100, INFERENCE_BATCH_MAX_WAIT=0,
+    TWITTER_BEARER_TOKEN='token'
+)
+class FakeTwitterAPITestCase(TestCase):
+    """
+    Test case collecting the tweets of FakeTwitterAPI with collect_tweets.
+    """
+
+    def setUp(self):
+        self.predictor = Predictor.objects.create(
+            name='LogisticRegression', version='v1.0', description=''
+        )
+        for integer_label in range(3):
+            PredictionLabel.objects.create(
+                label=str(integer_label), integer_label=integer_label,
+                description='', predictor=self.predictor
+            )
+        App.objects.create(
+            name='App', description='', about='',
+            default_predictor=self.predictor
+        )
+        self.api = FakeTwitterAPI()
+        api_url = self.api.__enter__()
+        self.addCleanup(self.api.__exit__)
+        collector = AsyncAPICollector(api_url, quota=mock.Mock())
+        self.addCleanup(collector.close)
+        patcher = mock.patch('classifier.tasks.api_collector', collector)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        predictor_registry.discard(self.predictor.id)
+
+    def create_search(self, search_term, number_of_tweets):
+        return Search.objects.create(
+            truncated_uuid='0', search_term=search_term,
+            number_of_tweets=number_of_tweets, predictor=self.predictor
+        )
+
+    def collect(self, search_term, number_of_tweets):
+        search = self.create_search(search_term, number_of_tweets)
+        collect_tweets(search.id, search_term, number_of_tweets)
+        search.refresh_from_db()
+        self.assertEqual(search.state, Search.State.DONE)
+        return search
+
+    def tweet_ids(self, search):
+        return sorted(
+            (int(id) for id in search.tweets.values_list('id', flat=True)),
+            reverse=True
+        )
+
+
+@mock.patch('classifier.tasks.schedule_notification')
+class IncrementalCollectionTests(FakeTwitterAPITestCase):
+
+    def test_fetches_newer_tweets_only(self, notify):
+        statuses = self.api.statuses
+        self.api.published_id = statuses[50]['id']
+        first = self.collect('hola', 100)
+        index = CollectionIndex.objects.get()
+        self.assertEqual(index.since_id, self.tweet_ids(first)[0])
+        self.assertEqual(index.max_id, self.tweet_ids(first)[-1])
+
+        self.api.published_id = statuses[0]['id']
+        self.api.requests.clear()
+        predictions = Prediction.objects.count()
+        second = self.collect(' HOLA ', 100)
+        self.assertEqual(len(self.api.requests), 2)
+        self.assertTrue(all(
+            int(request['since_id']) == index.since_id
+            for request in self.api.requests
+        ))
+        self.assertEqual(second.collected, 100)
+        self.assertLessEqual(Prediction.objects.count() - predictions, 50)
+
+        stored = set(Tweet.objects.values_list('id', flat=True))
+        fetched = [
+            status for status in statuses if status['id'] > index.since_id
+        ]
+        newer = [
+            status['id'] for status in fetched if status['id_str'] in stored
+        ]
+        older = [
+            status['id'] for status in statuses[len(fetched):]
+            if status['id_str'] in stored
+        ]
+        self.assertEqual(
+            self.tweet_ids(second), newer + older[:100 - len(fetched)]
+        )
+        index.refresh_from_db()
+        self.assertEqual(index.since_id, newer[0])
+        self.assertEqual(index.max_id, self.tweet_ids(first)[-1])
+
+    def test_fetches_older_tweets_once(self, notify):
+        statuses = self.api.statuses
+        self.api.published_id = statuses[50]['id']
+        first = self.collect('hola', 100)
+
+        self.api.published_id = statuses[0]['id']
+        self.api.requests.clear()
+        self.collect('hola', 250)
+        self.assertEqual(
+            int(self.api.requests[2]['max_id']), self.tweet_ids(first)[-1] - 1
+        )
+        self.assertNotIn('since_id', self.api.requests[2])
+        # Only the tweets discarded while classifying, which are not stored,
+        # may be fetched again at the edges of the index.
+        stored = set(Tweet.objects.values_list('id', flat=True))
+        fetched = collections.Counter(self.api.served)
+        self.assertFalse(any(
+            str(id) in stored for id, count in fetched.items() if count > 1
+        ))
+        self.assertEqual(len(fetched), len(statuses))
+        index = CollectionIndex.objects.get()
+        self.assertEqual(index.since_id, max(int(id) for id in stored))
+        self.assertEqual(index.max_id, min(int(id) for id in stored))
+
+        CollectionIndex.objects.update(
+            date=F('date') - timedelta(seconds=2 * 3600)
+        )
+        self.api.requests.clear()
+        self.collect('hola', 10)
+        self.assertEqual(len(self.api.requests), 1)
+        self.assertNotIn('since_id', self.api.requests[0])
+
+    def test_tops_up_in_chunks(self, notify):
+        first = self.collect('hola', 100)
+        search = self.create_search('hola', 0)
+        collector = mock.Mock(**{'collect_pages.return_value': []})
+        with override_settings(COLLECTION_CHUNK_SIZE=30):
+            pages = list(IncrementalCollection(collector, search, 0))
+        stored = self.tweet_ids(first)
+        self.assertEqual(
+            [len(page) for page in pages],
+            [min(30, len(stored) - i) for i in range(0, len(stored), 30)]
+        )
+        self.assertEqual(
+            [int(tweet.id_str) for page in pages for tweet in page], stored
+        )
+
+
+@mock.patch('classifier.tasks.schedule_notification')
+class CollectionCheckpointTests(FakeTwitterAPITestCase):
+
+    def test_resumes_after_failed_request(self, notify):
+        statuses = self.api.statuses
+        self.api.failures = {3}
+        search = self.create_search('hola', 250)
+        # The task is retried from the last checkpoint.
+        result = collect_tweets.apply((search.id, 'hola', 250))
+        self.assertTrue(result.successful())
+        search.refresh_from_db()
+        self.assertEqual(search.state, Search.State.DONE)
+        self.assertEqual(search.collected, 250)
+        self.assertEqual(
+            sorted(self.api.served), sorted(s['id'] for s in statuses)
+        )
+        self.assertEqual(
+            self.api.requests[2]['max_id'], self.api.requests[3]['max_id']
+        )
+
+        # Delivered once more after completing, it does nothing.
+        collect_tweets(search.id, 'hola', 250)
+        self.assertEqual(len(self.api.requests), 4)
+
+    def test_fails_after_last_retry(self, notify):
+        retries = collect_tweets.max_retries
+        self.api.failures = set(range(3, 4 + retries))
+        search = self.create_search('hola', 250)
+        collect_tweets.apply((search.id, 'hola', 250))
+        self.assertEqual(len(self.api.requests), 3 + retries)
+        search.refresh_from_db()
+        self.assertEqual(search.state, Search.State.FAILED)
+        self.assertEqual(search.collected, 200)
+        notify.assert_called_once_with(search.id)
+
+    def test_resumes_after_worker_died(self, notify):
+        statuses = self.api.statuses
+        search = self.create_search('hola', 250)
+
+        def die_on_second_chunk(request_id):
+            if classify.call_count == 2:
+                raise SystemExit
+            classify_tweets(request_id)
+
+        with mock.patch(
+            'classifier.tasks.classify_tweets.delay',
+            side_effect=die_on_second_chunk
+        ) as classify, self.assertRaises(SystemExit):
+            collect_tweets(search.id, 'hola', 250)
+        search.refresh_from_db()
+        self.assertEqual(search.collected, 200)
+        self.assertEqual(search.classified, 100)
+
+        collect_tweets(search.id, 'hola', 250)
+        search.refresh_from_db()
+        self.assertEqual(search.state, Search.State.DONE)
+        self.assertEqual(search.classified, 250)
+        self.assertFalse(InferenceRequest.objects.exists())
+        # Only the page requested ahead when the worker died is fetched
+        # again. The pages staged are not.
+        fetched = collections.Counter(self.api.served)
+        self.assertEqual(len(fetched), len(statuses))
+        self.assertTrue(all(
+            count == 1 for id, count in fetched.items()
+            if id >= statuses[199]['id']
+        ))
@@ -0,0 +1,276 @@
+"""
+This module contains the classes that encapsulate the business logic to split
+tweet texts into words.
+
+The tokenizers available are:
+    * NLTKTokenizer - It splits texts with the NLTK word tokenizer. It is the
+    default tokenizer, the one the example model was trained with.
+    * RegexTokenizer - It splits texts with a single compiled regular
+    expression. It is faster, but opt-in until the model is trained with
+    it (see the setting TOKENIZER).
+
+Function list:
+    * compare_tokenizers - It runs two tokenizers over the same texts and
+    reports the token mismatches and the time each of them took.
+"""
+import abc
+import collections
+import re
+import time
+
+import nltk
+from django.conf import settings
+
+from .utils import verify_manifest
+
+
+TokenizerComparison = collections.namedtuple(
+    'TokenizerComparison',
+    ['mismatches', 'reference_seconds', 'candidate_seconds']
+)
+
+
+class AbstractTokenizer(metaclass=abc.ABCMeta):
+    """
+    Abstract class which your custom tokenizers must subclass from.
+    """
+
+    @abc.abstractmethod
+    def tokenize(self, data):
+        """
+        This method splits data into words.
+
+        Parameters
+        ----------
+        data : str
+            Tweet text to split into words.
+
+        Returns
+        -------
+        list of str
+            Tweet text split into words, collection of words.
+        """
+
+        pass
+
+
+class NLTKTokenizer(AbstractTokenizer):
+    """
+    This class splits texts into words using the word tokenizer from NLTK.
+
+    Attributes
+    ----------
+    language : str
+        The model name in the Punkt corpus used to split sentences.
+    preserve_line : bool
+        If True, the text is not split into sentences before splitting it
+        into words, which does not require the NLTK module 'punkt'.
+    data_loaded : bool
+        Whether the NLTK data directory was already verified and registered.
+
+    Notes
+    -----
+    The NLTK module 'punkt' is never downloaded here. It is read from
+    settings.NLTK_DATA_DIR, which is filled at build time with the command
+    fetch_nltk_data.
+    """
+
+    def __init__(self, language='spanish', preserve_line=False):
+        """
+        This method sets the attributes language and preserve_line. It does
+        not touch the disk or the network, see the method load_data.
+        """
+
+        self.language = language
+        self.preserve_line = preserve_line
+        self.data_loaded = preserve_line
+
+    def load_data(self):
+        """
+        This method verifies the files in settings.NLTK_DATA_DIR and makes
+        NLTK look for its modules there first.
+        """
+
+        verify_manifest(settings.NLTK_DATA_DIR)
+        if settings.NLTK_DATA_DIR not in nltk.data.path:
+            nltk.data.path.insert(0, settings.NLTK_DATA_DIR)
+        self.data_loaded = True
+
+    def tokenize(self, data):
+        """
+        This method splits data into words using nltk.word_tokenize. The first
+        call loads the NLTK data, if needed, by calling the method load_data.
+
+        Parameters
+        ----------
+        data : str
+            Tweet text to split into words.
+
+        Returns
+        -------
+        list of str
+            Tweet text split into words, collection of words.
+        """
+
+        if not self.data_loaded:
+            self.load_data()
+        return nltk.word_tokenize(
+            data, language=self.language, preserve_line=self.preserve_line
+        )
+
+
+# Building blocks of RegexTokenizer.regex. Each one mirrors a group of the
+# substitutions NLTKWordTokenizer applies, in the same order.
+_SPLITTERS = r'''«“‘„»”’"*;@#$%&?!\[\](){}<>'''
+_DOUBLE_QUOTES = rf"(?<=[^\s{_SPLITTERS}`,:])(?<!\.\.)(?<!--)(?<!'')''"
+_COLONS = r"(?<![:,])[:,](?!\d)|(?<=[:,])[:,](?=[:,]|$)"
+_FINAL_PERIOD = r'''(?<=[^.])\.(?=[\]\)}>"'»”’ ]*\s*$)'''
+_SEPARATED = (
+    rf"--|\.{{2,}}|``|`|[{_SPLITTERS}]|{_DOUBLE_QUOTES}|{_COLONS}"
+    rf"|{_FINAL_PERIOD}"
+)
+_STARTING_QUOTE = r"(?<=')(?!(?i:re|ve|ll|m|t|s|d|n))\w\b"
+_QUOTE_SPACE = (
+    r"(?<!')'(?= |[`«“‘„;@#$%&?!]|\.\.|"
+    rf"{_COLONS}|{_FINAL_PERIOD}|{_STARTING_QUOTE})"
+)
+_BOUNDARY = rf" |\Z|{_QUOTE_SPACE}|{_SEPARATED}|{_STARTING_QUOTE}"
+_SUFFIX = rf"(?<=[^' ])(?:'[sSmMdD]|')(?={_BOUNDARY})"
+_LONG_SUFFIX = (
+    rf"(?<=[^' ])(?:'ll|'LL|'re|'RE|'ve|'VE|n't|N'T)"
+    rf"(?={_BOUNDARY}|{_SUFFIX})"
+)
+_WORD_END = rf"(?:\b|(?={_LONG_SUFFIX}))"
+_WANNA_END = rf"(?=\s|\Z|{_QUOTE_SPACE}|{_SEPARATED}|{_SUFFIX}|{_LONG_SUFFIX})"
+_CONTRACTION = (
+    rf"(?i:\b(?:can(?=not{_WORD_END})|gim(?=me{_WORD_END})"
+    rf"|gon(?=na{_WORD_END})|got(?=ta{_WORD_END})|lem(?=me{_WORD_END})"
+    rf"|more(?='n{_WORD_END})|d(?='ye{_WORD_END}))"
+    rf"|(?:(?<=\bcan)not|(?<=\bgim)me|(?<=\bgon)na|(?<=\bgot)ta"
+    rf"|(?<=\blem)me|(?<=\bmore)'n|(?<=\bd)'ye){_WORD_END}"
+    rf"|\bwan(?=na{_WANNA_END})|(?<=\bwan)na{_WANNA_END})"
+)
+_LEADING_CONTRACTION = (
+    rf"(?<![^\S ])(?i:'t)(?=(?i:is|was){_WORD_END})"
+    rf"|(?<=(?i:'t))(?i:is|was){_WORD_END}"
+)
+_STOP = (
+    rf"\s|{_SEPARATED}|{_SUFFIX}|{_LONG_SUFFIX}|{_CONTRACTION}"
+    rf"|{_STARTING_QUOTE}"
+)
+
+
+class RegexTokenizer(AbstractTokenizer):
+    """
+    This class splits texts into words with a single compiled regular
+    expression which reproduces the word boundaries of the NLTK word
+    tokenizer.
+
+    Attributes
+    ----------
+    regex : SRE_Pattern
+        Regular expression pattern to match every token.
+    simple_regex : SRE_Pattern
+        Faster version of regex for the texts without apostrophes and
+        contractions, which are most of them.
+    contractions_regex : SRE_Pattern
+        Regular expression pattern to match the contractions NLTK splits that
+        do not contain apostrophes.
+    opening_quotes_regex : SRE_Pattern
+        Regular expression pattern to match the quotes NLTK converts into
+        opening quotes (``).
+
+    Notes
+    -----
+    The text is treated as a single sentence, just like
+    nltk.word_tokenize(data, preserve_line=True) does. Thus, it may differ from
+    NLTKTokenizer when a period in the middle of the text ends a sentence, e.g.
+    "it's. Hola" gives "it's." instead of "it", "'s", ".". Use
+    compare_tokenizers to check how often this happens on your data, and
+    retrain the model with this tokenizer before choosing it with the
+    setting TOKENIZER.
+    """
+
+    regex = re.compile(
+        rf'{_SEPARATED}|{_SUFFIX}|{_LONG_SUFFIX}|{_CONTRACTION}'
+        rf'|{_LEADING_CONTRACTION}|\S(?:(?!{_STOP})\S)*'
+    )
+    simple_regex = re.compile(
+        rf'{_SEPARATED}|\S(?:[^\s{_SPLITTERS}`.,:-]+|(?!{_SEPARATED})\S)*'
+    )
+    contractions_regex = re.compile(
+        r'(?i)cannot|gimme|gonna|gotta|lemme|wanna'
+    )
+    opening_quotes_regex = re.compile(r'''(?<=[ \(\[{<«“‘„`])(?:"|\'\')''')
+
+    def tokenize(self, data):
+        """
+        This method splits data into words using regex, or simple_regex when
+        data has neither apostrophes nor contractions.
+
+        Parameters
+        ----------
+        data : str
+            Tweet text to split into words.
+
+        Returns
+        -------
+        list of str
+            Tweet text split into words, collection of words.
+        """
+
+        if "'" in data or RegexTokenizer.contractions_regex.search(data):
+            regex = RegexTokenizer.regex
+        else:
+            regex = RegexTokenizer.simple_regex
+
+        if '"' in data or "''" in data:
+            if data.startswith('"'):
+                data = f' `` {data[1:]}'
+            data = RegexTokenizer.opening_quotes_regex.sub(' `` ', data)
+            return [
+                "''" if token == '"' else token
+                for token in regex.findall(data)
+            ]
+        return regex.findall(data)
+
+
+def compare_tokenizers(reference, candidate, texts):
+    """
+    This function runs two tokenizers over the same texts and reports the
+    token mismatches and the time each of them took.
+
+    Parameters
+    ----------
+    reference : AbstractTokenizer
+        Tokenizer whose tokens are considered correct.
+    candidate : AbstractTokenizer
+        Tokenizer to compare against reference.
+    texts : list of str
+        Collection of texts to split into words.
+
+    Returns
+    -------
+    TokenizerComparison
+        Named tuple containing the list of mismatches, as triples in the
+        following order: text, reference tokens, candidate tokens; and the
+        seconds reference and candidate took to tokenize all the texts.
+    """
+
+    start = time.perf_counter()
+    reference_tokens = [reference.tokenize(text) for text in texts]
+    reference_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    candidate_tokens = [candidate.tokenize(text) for text in texts]
+    candidate_seconds = time.perf_counter() - start
+
+    mismatches = [
+        (text, expected, actual)
+        for text, expected, actual
+        in zip(texts, reference_tokens, candidate_tokens)
+        if expected != actual
+    ]
+    return TokenizerComparison(
+        mismatches, reference_seconds, candidate_seconds
+    )
@@ -3,19 +3,43 @@ This module defines some utility functions to use throughout the application.
 
 Function list:
     * logo_filename - It is called to obtain the upload path of the app logo.
-    * get_predictor - It returns and caches the corresponding predictive model
-    (from predictors.py) instance for a given Predictor model instance.
+    * normalize_search_term - It returns the form of a search term used to
+    find identical searches.
+    * get_predictor - It returns and registers the corresponding predictive
+    model (from predictors.py) instance for a given Predictor model instance.
+    * warm_up_predictors - It builds and caches the predictive models of the
+    active predictors before they are needed.
+    * get_tokenizer - It returns a tokenizer (from tokenizers.py) instance
+    given its class name.
+    * get_collector - It returns a collector (from collectors.py) instance
+    given its class name.
     * update_app_settings - It updates the single App instance in cache and
     dumps its information to disk as a JSON file.
+    * file_checksum - It computes the SHA-256 hex digest of a file.
+    * write_manifest - It records the checksum of every file in a directory.
+    * verify_manifest - It checks the files in a directory against their
+    recorded checksums.
 """
+import hashlib
 import json
+import logging
+import os
+import time
 
 from django.conf import settings
 from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
 from django.utils.module_loading import import_string
 
+from .caches import predictor_registry
+
 
 PREDICTORS_DIR = 'classifier.predictors'
+TOKENIZERS_DIR = 'classifier.tokenizers'
+COLLECTORS_DIR = 'classifier.collectors'
+MANIFEST_FILENAME = 'manifest.json'
+
+logger = logging.getLogger(__name__)
 
 
 def logo_filename(instance, filename):
@@ -46,23 +70,46 @@ def logo_filename(instance, filename):
     return 'logo'
 
 
+def normalize_search_term(search_term):
+    """
+    This function returns the form of a search term used to find identical
+    searches. Twitter search is case-insensitive and ignores extra
+    whitespaces, so those differences are removed.
+
+    Parameters
+    ----------
+    search_term : str
+        Term entered by the user in the search box.
+
+    Returns
+    -------
+    str
+        search_term in lowercase and with its whitespaces collapsed.
+    """
+
+    return ' '.join(search_term.lower().split())
+
+
 def get_predictor(predictor):
     """
     It returns the corresponding predictive model (from predictors.py)
-    instance for the Predictor model instance received and caches it.
+    instance for the Predictor model instance received and registers it in
+    predictor_registry (caches.py).
 
     Parameters
     ----------
     predictor : Predictor
         Predictor chosen by the user when requesting the search and
-        classification through the application GUI.
+        classification through the application GUI. It must be recently read
+        from the database so that its generation is up to date.
 
     Returns
     -------
     AbstractPredictor
-        Predictor (from predictors.py) instance to make predictions. If there
-        exists an instance in cache for the predictor received, it returns it,
-        otherwise it creates a new one, caches it and returns it.
+        Predictor (from predictors.py) instance to make predictions. If this
+        process has an instance for the predictor version and generation
+        received, it returns it, otherwise it creates a new one, registers it
+        and returns it. The time taken to create it is logged.
 
     Raises
     ------
@@ -71,12 +118,126 @@ def get_predictor(predictor):
         class name in the module predictors.py.
     """
 
-    predictors = cache.get_or_set('PREDICTORS', {})
-    if predictor.id not in predictors:
-        GenericPredictor = import_string(f'{PREDICTORS_DIR}.{predictor.name}')
-        predictors[predictor.id] = GenericPredictor(predictor)
-        cache.set('PREDICTORS', predictors)
-    return predictors[predictor.id]
+    return predictor_registry.get(predictor, _build_predictor)
+
+
+def _build_predictor(predictor):
+    """
+    It creates the predictive model (from predictors.py) instance for a
+    Predictor model instance and logs the time it takes.
+    """
+
+    start = time.perf_counter()
+    GenericPredictor = import_string(f'{PREDICTORS_DIR}.{predictor.name}')
+    instance = GenericPredictor(predictor)
+    logger.info(
+        'Predictor %r constructed in %.3f seconds.', predictor,
+        time.perf_counter() - start
+    )
+    return instance
+
+
+def warm_up_predictors(scope):
+    """
+    It builds and caches the predictive model (from predictors.py) instances
+    of the predictors in scope by calling get_predictor, which logs the time
+    each of them takes.
+
+    Parameters
+    ----------
+    scope : str
+        Which predictors to build: 'all' for every active Predictor plus the
+        App default_predictor, 'default' for the App default_predictor only,
+        or 'none'.
+
+    Returns
+    -------
+    list of Predictor
+        Predictors whose predictive model was built and cached.
+
+    Raises
+    ------
+    ImproperlyConfigured
+        If scope is not one of the values described above.
+    """
+
+    from .models import App
+    from .models import Predictor
+
+    if scope not in ('all', 'default', 'none'):
+        raise ImproperlyConfigured(
+            f'Unknown PREDICTOR_WARM_UP value {scope!r}. '
+            "Use 'all', 'default' or 'none'."
+        )
+
+    predictors = []
+    if scope == 'all':
+        predictors.extend(Predictor.objects.filter(active=True))
+    if scope != 'none':
+        app = App.objects.select_related('default_predictor').first()
+        if app is not None and app.default_predictor is not None:
+            if app.default_predictor not in predictors:
+                predictors.append(app.default_predictor)
+
+    warmed_up = []
+    for predictor in predictors:
+        try:
+            get_predictor(predictor)
+        except Exception:
+            logger.exception('Predictor %r could not be built.', predictor)
+        else:
+            warmed_up.append(predictor)
+    return warmed_up
+
+
+def get_tokenizer(name):
+    """
+    It returns a tokenizer (from tokenizers.py) instance given its class name.
+
+    Parameters
+    ----------
+    name : str
+        Name of a class in the module tokenizers.py, e.g. 'RegexTokenizer'
+        or 'NLTKTokenizer'.
+
+    Returns
+    -------
+    AbstractTokenizer
+        Tokenizer (from tokenizers.py) instance to split texts into words.
+
+    Raises
+    ------
+    ImportError
+        If name does not match any class name in the module tokenizers.py.
+    """
+
+    GenericTokenizer = import_string(f'{TOKENIZERS_DIR}.{name}')
+    return GenericTokenizer()
+
+
+def get_collector(name):
+    """
+    It returns a collector (from collectors.py) instance given its class name.
+
+    Parameters
+    ----------
+    name : str
+        Name of a class in the module collectors.py, e.g. 'AsyncAPICollector'
+        or 'OfficialAPICollector'.
+
+    Returns
+    -------
+    object
+        Collector (from collectors.py) instance to collect tweets.
+
+    Raises
+    ------
+    ImportError
+        If name does not match any class name in the module collectors.py.
+    """
+
+    Collector = import_string(f'{COLLECTORS_DIR}.{name}')
+    return Collector()
 
 
 def update_app_settings():
@@ -97,3 +258,93 @@ def update_app_settings():
 
     with open(settings.APP_CONFIG_PATH, 'w') as config_file:
         json.dump(data, config_file, indent=4)
+
+
+def file_checksum(path):
+    """
+    This function computes the SHA-256 hex digest of a file.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file.
+
+    Returns
+    -------
+    str
+        SHA-256 hex digest of the file content.
+    """
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_manifest(directory, **fields):
+    """
+    This function records the checksum of every file in a directory in its
+    manifest file (manifest.json).
+
+    Parameters
+    ----------
+    directory : str
+        Path of the directory.
+    **fields
+        Additional information to record in the manifest file, e.g. version.
+
+    Returns
+    -------
+    dict
+        Manifest written, with the checksum of each file (keyed by its path
+        relative to directory) under the key 'files'.
+    """
+
+    files = {}
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            relative_path = os.path.relpath(path, directory)
+            if relative_path != MANIFEST_FILENAME:
+                files[relative_path] = file_checksum(path)
+
+    manifest = {**fields, 'files': files}
+    with open(os.path.join(directory, MANIFEST_FILENAME), 'w') as file:
+        json.dump(manifest, file, indent=4, sort_keys=True)
+    return manifest
+
+
+def verify_manifest(directory):
+    """
+    This function checks the files in a directory against the checksums
+    recorded in its manifest file (manifest.json).
+
+    Parameters
+    ----------
+    directory : str
+        Path of the directory.
+
+    Returns
+    -------
+    dict
+        Manifest read, as written by write_manifest.
+
+    Raises
+    ------
+    ImproperlyConfigured
+        If the manifest file is missing, or if a file is missing or its
+        checksum does not match the recorded one.
+    """
+
+    manifest_path = os.path.join(directory, MANIFEST_FILENAME)
+    if not os.path.isfile(manifest_path):
+        raise ImproperlyConfigured(f'{manifest_path} not found.')
+
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    for relative_path, checksum in manifest['files'].items():
+        path = os.path.join(directory, relative_path)
+        if not os.path.isfile(path) or file_checksum(path) != checksum:
+            raise ImproperlyConfigured(f'{path} is missing or corrupted.')
+    return manifest
@@ -14,17 +14,20 @@ View list:
 """
 import uuid
 
+from django.conf import settings
 from django.core.cache import cache
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from .coalescing import create_search
 from .models import App
 from .models import Prediction
 from .models import Search
 from .serializers import SearcherSerializer
 from .serializers import SearchSerializer
 from .tasks import collect_tweets
+from .tasks import schedule_notification
 
 
 @api_view(['POST'])
@@ -33,6 +36,9 @@ def search(request):
     View to trigger the asynchronous tweet collection task. This view is
     called when the user uses the search box in the application GUI.
 
+    If an identical search is in progress or was done recently, the search
+    follows it instead of collecting its own tweets (see coalescing.py).
+
     Parameters
     ----------
     request : Request
@@ -55,12 +61,13 @@ def search(request):
     )
     serializer = SearchSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
-    search_instance = serializer.save()
-    collect_tweets.delay(
-        search_instance.id,
-        search_instance.search_term,
-        search_instance.number_of_tweets
-    )
+    search_instance = create_search(serializer)
+    if search_instance.leader is None:
+        collect_tweets.delay(
+            search_instance.id,
+            search_instance.search_term,
+            search_instance.number_of_tweets
+        )
     return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 
@@ -69,6 +76,12 @@ def result(request):
     """
     View to get the search and classification results of a given search.
 
+    The state of the search and its progress are read from a single Search
+    row (and its leader's), so polls for a search in progress do not query
+    the Tweet and Prediction tables until some tweets are classified. The
+    tweets classified are then cached along with the number of tweets
+    classified, so they are queried again only when it changes.
+
     Parameters
     ----------
     request : Request
@@ -80,22 +93,32 @@ def result(request):
     Response
         If the search_id received does not exist in database, the response
         status code is 404 and its body contains an error message.
-        If the search_id received does exist, three cases may happen:
-        1. Tweets were found for the given search term and the prediction
-        process is completed: the response status code is 200 and its body
-        contains a dictionary of tweets grouped by label.
-        2. Tweets were found for the given search term, but the prediction
-        process is not completed yet: the response status code is 200 and
-        its body contains a message and a processing flag set to True, both
+        If the search_id received does exist, four cases may happen:
+        1. Tweets were found for the given search term and some of them are
+        already classified: the response status code is 200 and its body
+        contains a dictionary of the tweets classified so far grouped by
+        label.
+        2. Tweets were found for the given search term, but none of them is
+        classified yet: the response status code is 200 and its body
+        contains a message and a processing flag set to True, both
         indicating that processing is not completed yet.
         3. No tweets were found for the given search term: the response status
         code is 200 and its body contains a message and processing flag set to
         False, both indicating that processing was already completed.
+        4. The collection failed: the response status code is 200 and its
+        body contains a message and a processing flag set to False.
+        In every case, the body contains the progress of the search: the
+        number of tweets collected and classified so far, its state (see
+        Search.State) and a done flag set to True once the collection and
+        classification are completed or failed, i.e. there is nothing left to
+        poll for.
     """
 
     search_id = request.data.get('search_id')
     try:
-        search_instance = Search.objects.get(truncated_uuid=search_id)
+        search_instance = Search.objects.select_related('leader').get(
+            truncated_uuid=search_id
+        )
     except Search.DoesNotExist:
         data = {
             'detail': f'Invalid id {search_id} - search does not exist.',
@@ -103,36 +126,60 @@ def result(request):
         return Response(data, status=status.HTTP_404_NOT_FOUND)
 
     search_term = search_instance.search_term
+    # Followers show the results of the search they follow.
+    search_instance = search_instance.leader or search_instance
+    progress = {
+        'collected': search_instance.collected,
+        'classified': search_instance.classified,
+        'done': search_instance.state not in Search.IN_PROGRESS,
+        'state': search_instance.state,
+    }
 
-    if search_instance.empty:
+    if search_instance.state == Search.State.EMPTY:
         # TODO: Hide search after this condition is True for the first time
         data = {
             'detail': f"Unfortunately, we did not found tweets for '{search_term}'.", # noqa
             'search_term': search_term,
-            'processing': False
+            'processing': False,
+            'progress': progress
         }
         return Response(data)
 
-    tweets = search_instance.tweets.all()
+    if search_instance.state == Search.State.FAILED:
+        data = {
+            'detail': f"Tweets collection for '{search_term}' failed.",
+            'search_term': search_term,
+            'processing': False,
+            'progress': progress
+        }
+        return Response(data)
 
-    if len(tweets) == 0:
+    if not search_instance.classified:
         data = {
             'detail': f"Tweets collection and classification for '{search_term}' \
 have not been completed yet.",
             'search_term': search_term,
-            'processing': True
+            'processing': True,
+            'progress': progress
         }
         return Response(data)
 
-    data = dict()
-    for tweet in tweets:
-        prediction = Prediction.objects.get(
-            predictor=search_instance.predictor, tweet=tweet
-        )
-        data[prediction.label.label] = data.get(prediction.label.label, [])
-        data[prediction.label.label].append(tweet.id)
+    key = f'RESULT_{search_instance.id}_{search_instance.classified}'
+    labels = cache.get(key)
+    if labels is None:
+        predictions = Prediction.objects.filter(
+            predictor=search_instance.predictor_id,
+            tweet__in=search_instance.tweets.all()
+        ).values_list('label__label', 'tweet_id')
+        labels = dict()
+        for label, tweet_id in predictions:
+            labels[label] = labels.get(label, [])
+            labels[label].append(tweet_id)
+        cache.set(key, labels, settings.RESULT_CACHE_TIMEOUT)
 
+    data = dict(labels)
     data['search_term'] = search_term
+    data['progress'] = progress
 
     return Response(data)
 
@@ -143,6 +190,9 @@ def email(request):
     View to save the name and email of a user interested in being notified
     when the collection and prediction process of a given search completes.
 
+    If the search is already done or failed, the user is notified once the
+    next NOTIFICATION_WINDOW seconds pass (see notifications.py).
+
     Parameters
     ----------
     request : Request
@@ -173,6 +223,12 @@ def email(request):
         }
         return Response(message, status=status.HTTP_404_NOT_FOUND)
     serializer.save(search=search_instance)
+    if (
+        (search_instance.leader or search_instance).state
+        in Search.NOTIFIABLE
+    ):
+        # The search was done or failed before the user registered.
+        schedule_notification(search_instance.id)
     return Response(serializer.data)
 
 
@@ -196,6 +252,8 @@ def search_history(request):
         instances data as validated by the SearchSerializer.
     """
 
-    search_set = Search.objects.exclude(tweets=None).order_by('-date')
+    search_set = Search.objects.filter(state=Search.State.DONE).exclude(
+        tweets=None
+    ).order_by('-date')
     serializer = SearchSerializer(search_set, many=True)
     return Response(serializer.data)
@@ -19,29 +19,43 @@ const Result = () => {
     const [searchTerm, setSearchTerm] = useState('');
     const [activeTab, setActiveTab] = useState(settings.predictor.labels[0].label);
     const [isEmptySearch, setIsEmptySearch] = useState(false);
+    const [failure, setFailure] = useState(null);
     const [linkCopied, setLinkCopied] = useState(false);
     const [loading, setLoading] = useState(true);
+    const [progress, setProgress] = useState(null);
 
     const { searchId } = useParams();
     const history = useHistory();
 
     useEffect(() => {
-        axios.post(API.result, {search_id: searchId}).then(response => {
-            setTimeout(() => {
-                setSearchTerm(response.data.search_term);
-                if(response.data.processing === undefined) {
-                    setTweets(response.data);
-                } else if (!response.data.processing) { // Empty search
-                    setIsEmptySearch(true);
-                }
-                setLoading(false);
-            }, 500);
-        }).catch(() => {
-            setTimeout(() => {
-                history.push('/404');
-                setLoading(false);
-            }, 500);
-        });
+        let timeout;
+        const fetchResult = () => {
+            axios.post(API.result, {search_id: searchId}).then(response => {
+                timeout = setTimeout(() => {
+                    setSearchTerm(response.data.search_term);
+                    setProgress(response.data.progress);
+                    if(response.data.processing === undefined) {
+                        setTweets(response.data);
+                    } else if (response.data.progress.state === 'failed') {
+                        setFailure(response.data.detail);
+                    } else if (!response.data.processing) { // Empty search
+                        setIsEmptySearch(true);
+                    }
+                    setLoading(false);
+                    // Partial results: keep polling until the search is done.
+                    if(response.data.progress && !response.data.progress.done) {
+                        timeout = setTimeout(fetchResult, 3000);
+                    }
+                }, 500);
+            }).catch(() => {
+                timeout = setTimeout(() => {
+                    history.push('/404');
+                    setLoading(false);
+                }, 500);
+            });
+        };
+        fetchResult();
+        return () => clearTimeout(timeout);
     }, []);
 
     const copyLink = () => {
@@ -56,6 +70,15 @@ const Result = () => {
         <div className="m-5">
             <Header />
             { loading ? <img className="mx-auto mt-16 h-10" src={spinner} /> :
+            failure ?
+                <main className="mt-16 mx-auto text-center md:w-3/4 lg:w-1/2">
+                    <p className="text-2xl font-semibold">{ failure }</p>
+                    <p className="text-2xl font-semibold">:(</p>
+                    <br />
+                    <a className="text-2xl font-semibold text-blue-900 hover:underline" href="/">
+                        Go back to home
+                    </a>
+                </main> :
             isEmptySearch ?
                 <main className="mt-16 mx-auto text-center md:w-3/4 lg:w-1/2">
                     <p className="text-2xl font-semibold">
@@ -86,6 +109,11 @@ const Result = () => {
                     <Clipboard copy={document.location.href} />
                 </main> :
                 <main className="mt-16 mx-auto text-center lg:w-3/4">
+                    { progress && !progress.done &&
+                        <p className="mb-8 italic text-gray-600">
+                            Classified { progress.classified } of the { progress.collected } tweets collected so far...
+                        </p>
+                    }
                     <ul className="space-x-4">
                         { settings.predictor.labels.map(label => {
                             return (